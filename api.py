@@ -0,0 +1,316 @@
+from dotenv import load_dotenv
+load_dotenv()  # engine.py reads its limits from the environment at import
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import secrets
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.process
+import tornado.queues
+import tornado.web
+
+from backends import QUERY_ERRORS
+from engine import Engine
+from metrics import get_metrics
+from query_guard import QueryAborted
+from results import DEFAULT_PAGE_SIZE
+
+UPLOAD_SPOOL_BYTES = 64 * 1024 * 1024  # uploads beyond this are spooled to a temporary file
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "10000"))  # rows a client may ask for per page
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+# Function to make a page dict JSON-friendly; NaN becomes null and dates ISO strings
+def page_payload(page):
+    frame = json.loads(page["table"].to_pandas().to_json(orient="split", index=False, date_format="iso"))
+    payload = {key: value for key, value in page.items() if key != "table"}
+    payload.update(columns=frame["columns"], data=frame["data"])
+    return payload
+
+
+# Function to encode a page as an Arrow IPC stream, with the other page fields in the schema
+# metadata; the table's buffers are written as they are, with no per-value conversion
+def page_arrow(page):
+    fields = {key: value for key, value in page.items() if key != "table"}
+    table = page["table"].replace_schema_metadata({"page": json.dumps(fields)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, engine, executor):
+        self.engine = engine
+        self.executor = executor
+
+    def write_json(self, payload, status=200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload, default=str))
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        message = getattr(error, "log_message", None) or str(error or self._reason)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"error": message}))
+
+    def json_body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Request body must be JSON.")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, "Request body must be a JSON object.")
+        return body
+
+    # Function to read a required field of a JSON body; a missing one is the client's error
+    def field(self, body, name):
+        if body.get(name) is None:
+            raise tornado.web.HTTPError(400, f"Missing '{name}' in the request body.")
+        return body[name]
+
+    # Function to read a requested page size (a JSON value or a query argument); it must be a
+    # whole number from 1 to MAX_PAGE_SIZE, and defaults to DEFAULT_PAGE_SIZE
+    def page_size(self, value):
+        if value is None:
+            return DEFAULT_PAGE_SIZE
+        if isinstance(value, str) and value.strip().isdigit():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_PAGE_SIZE:
+            raise tornado.web.HTTPError(400, f"'page_size' must be a whole number from 1 to {MAX_PAGE_SIZE}.")
+        return value
+
+    # Function to run blocking engine work on the request worker pool
+    async def blocking(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    # Function to resolve a database display name to its path; clients never send paths
+    async def database(self, name):
+        databases = await self.blocking(self.engine.databases)
+        if name not in databases:
+            raise tornado.web.HTTPError(404, f"Unknown database: {name}")
+        return databases[name]
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write_json({"status": "ok", "pid": os.getpid()})
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(get_metrics().prometheus_text())
+
+
+class StatsHandler(BaseHandler):
+    def get(self):
+        self.write_json(self.engine.stats())
+
+
+class DatabasesHandler(BaseHandler):
+    async def get(self):
+        self.write_json({"databases": list(await self.blocking(self.engine.databases))})
+
+    async def delete(self):
+        db = await self.database(self.get_argument("database"))
+        await self.blocking(self.engine.delete_database, db)
+        self.write_json({"deleted": self.get_argument("database")})
+
+
+class TablesHandler(BaseHandler):
+    async def get(self):
+        db = await self.database(self.get_argument("database"))
+        self.write_json({"tables": await self.blocking(self.engine.table_names, db)})
+
+
+class ColumnsHandler(BaseHandler):
+    async def get(self):
+        db = await self.database(self.get_argument("database"))
+        self.write_json({"columns": await self.blocking(self.engine.column_names, self.get_argument("table"), db)})
+
+
+# POST {"question", "database", "table", "columns"?, "page_size"?, "stream"?}. Without stream the
+# reply is the ask() result; with stream it is newline-delimited JSON: {"text": ...} for every
+# chunk of the model response, then {"result": ...} (or {"error": ...}).
+class AskHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        db = await self.database(self.field(body, "database"))
+        ask = functools.partial(self.engine.ask, self.field(body, "question"), db, self.field(body, "table"),
+                                columns=body.get("columns"),
+                                page_size=self.page_size(body.get("page_size")))
+        if not body.get("stream"):
+            self.write_json(await self.blocking(ask))
+            return
+
+        loop = tornado.ioloop.IOLoop.current()
+        queue = tornado.queues.Queue()
+
+        def run():
+            try:
+                return ask(on_text=lambda text: loop.add_callback(queue.put_nowait, {"text": text}))
+            finally:
+                loop.add_callback(queue.put_nowait, None)
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        task = loop.run_in_executor(self.executor, run)
+        while (event := await queue.get()) is not None:
+            self.write(json.dumps(event) + "\n")
+            await self.flush()
+        try:
+            self.write(json.dumps({"result": await task}, default=str) + "\n")
+        except Exception as e:
+            self.write(json.dumps({"error": str(e)}) + "\n")
+        self.finish()
+
+
+# POST {"database", "sql", "page_size"?} opens a query and starts its first page; the SQL must
+# be a single SELECT statement
+class QueriesHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        db = await self.database(self.field(body, "database"))
+        try:
+            query_id = await self.blocking(self.engine.open_query, self.field(body, "sql"), db,
+                                           self.page_size(body.get("page_size")))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        self.write_json({"query_id": query_id})
+
+
+# GET a page of an open query, as JSON or, when the Accept header asks for it, as an Arrow IPC
+# stream; DELETE the query to stop it
+class QueryHandler(BaseHandler):
+    async def get(self, query_id, page=None):
+        page_size = self.page_size(self.get_argument("page_size", None))
+        try:
+            job = await self.blocking(self.engine.submit_page, query_id, int(page or 0), page_size)
+        except (KeyError, ValueError):
+            raise tornado.web.HTTPError(404, f"Unknown query: {query_id}")
+        try:
+            # The SQL runs on the engine's watchdog workers; this loop only awaits the result
+            result = await asyncio.wrap_future(job.future)
+        except QueryAborted as e:
+            self.write_json({"error": str(e), "reason": e.reason, "seconds": e.seconds}, status=409)
+            return
+        except QUERY_ERRORS as e:
+            self.write_json({"error": str(e)}, status=422)
+            return
+        if ARROW_STREAM in self.request.headers.get("Accept", ""):
+            self.set_header("Content-Type", ARROW_STREAM)
+            self.finish(await self.blocking(page_arrow, result))
+        else:
+            self.write_json(await self.blocking(page_payload, result))
+
+    def delete(self, query_id, page=None):
+        self.engine.cancel(query_id)
+        self.write_json({"cancelled": query_id})
+
+
+# POST {"query_id", "table", "columns"?}: let the index advisor learn from a query that ask()
+# generated; any other query id is refused
+class AdviseHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        try:
+            advice = await self.blocking(self.engine.advise, self.field(body, "query_id"), self.field(body, "table"),
+                                         body.get("columns"))
+        except KeyError as e:
+            raise tornado.web.HTTPError(404, str(e.args[0]) if e.args else "Unknown query.")
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        self.write_json({"advice": advice})
+
+
+# POST the raw file as the request body: /api/upload?filename=sales.csv&engine=sqlite, plus
+# &mode=upsert (and optionally &key=id) to write only what changed. The body is streamed into a
+# spooled temporary file instead of being buffered whole in memory.
+@tornado.web.stream_request_body
+class UploadHandler(BaseHandler):
+    def prepare(self):
+        self.request.connection.set_max_body_size(self.settings["max_upload_bytes"])
+        self.upload = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self.size = 0
+
+    def data_received(self, chunk):
+        self.upload.write(chunk)
+        self.size += len(chunk)
+
+    async def post(self):
+        try:
+            self.upload.seek(0)
+            report = await self.blocking(self.engine.ingest, self.upload, self.get_argument("filename"),
+                                         engine=self.get_argument("engine", "sqlite"), size=self.size,
+                                         mode=self.get_argument("mode", "replace"),
+                                         key=self.get_argument("key", None) or None)
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        finally:
+            self.upload.close()
+        self.write_json(report)
+
+
+# Function to build the tornado application around one engine
+def make_app(engine, workers=8, max_upload_bytes=2 * 1024 ** 3):
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+    handler_args = {"engine": engine, "executor": executor}
+    return tornado.web.Application(
+        [
+            (r"/healthz", HealthHandler, handler_args),
+            (r"/metrics", MetricsHandler, handler_args),
+            (r"/api/stats", StatsHandler, handler_args),
+            (r"/api/databases", DatabasesHandler, handler_args),
+            (r"/api/tables", TablesHandler, handler_args),
+            (r"/api/columns", ColumnsHandler, handler_args),
+            (r"/api/ask", AskHandler, handler_args),
+            (r"/api/queries", QueriesHandler, handler_args),
+            (r"/api/queries/([\w-]+)(?:/pages/(\d+))?", QueryHandler, handler_args),
+            (r"/api/advise", AdviseHandler, handler_args),
+            (r"/api/upload", UploadHandler, handler_args),
+        ],
+        max_upload_bytes=max_upload_bytes,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the NL-to-SQL engine over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--root", default=".", help="directory holding the databases")
+    parser.add_argument("--processes", type=int, default=1, help="forked server processes sharing the port; 0 = one per CPU")
+    parser.add_argument("--workers", type=int, default=8, help="threads per process for model calls, schema and ingest")
+    parser.add_argument("--sql-workers", type=int, default=4, help="threads per process executing SQL")
+    parser.add_argument("--max-upload-mb", type=int, default=2048)
+    args = parser.parse_args()
+
+    sockets = tornado.netutil.bind_sockets(args.port, address=args.host)
+    # Query ids are signed; forked processes share the key so that any of them can reopen a query
+    secret = os.getenv("ENGINE_SECRET") or secrets.token_hex(16)
+    if args.processes != 1:
+        tornado.process.fork_processes(args.processes)
+    # Every process builds its own engine after the fork; the on-disk cache tiers are shared
+    engine = Engine(root_dir=args.root, sql_workers=args.sql_workers, secret=secret)
+    server = tornado.httpserver.HTTPServer(
+        make_app(engine, workers=args.workers, max_upload_bytes=args.max_upload_mb * 1024 * 1024),
+        max_body_size=args.max_upload_mb * 1024 * 1024,
+    )
+    server.add_sockets(sockets)
+    print(f"Serving on http://{args.host}:{args.port} (pid {os.getpid()})")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
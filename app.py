@@ -3,186 +3,132 @@ load_dotenv()  # Load environment variables
 
 import streamlit as st
 import os
-import sqlite3
-import pandas as pd
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+from query_guard import QueryAborted
+import metrics
+from results import DEFAULT_PAGE_SIZE, clean_sql
+from backends import QUERY_ERRORS
+from engine import Engine
+from client import EngineClient
 
 try:
     import openpyxl
 except ImportError:
     st.error("Missing optional dependency 'openpyxl'. Please install it using `pip install openpyxl`.")
 
-# Configure our API Key
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# Page sizes offered for query results
+PAGE_SIZE_OPTIONS = [100, DEFAULT_PAGE_SIZE, 1000, 5000]
+QUERY_POLL_SECONDS = 0.25
+
+# ENGINE_URL points the app at an api.py server (e.g. http://127.0.0.1:8765) instead of running
+# the engine inside the Streamlit process. Limits, caches and the index advisor are configured
+# where the engine runs (see engine.py).
+ENGINE_URL = os.getenv("ENGINE_URL")
+
+# Show generated SQL token by token, validating it as soon as the statement is complete
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+
+# Stage timings: METRICS_JSONL appends every span to a file, METRICS_TEXTFILE keeps a
+# Prometheus text file up to date and METRICS_PORT serves /metrics for scraping on METRICS_HOST
+METRICS_JSONL = os.getenv("METRICS_JSONL")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Function to share one engine (and so its caches, schema catalog and SQL workers) across
+# reruns and sessions
+@st.cache_resource
+def get_engine():
+    return EngineClient(ENGINE_URL) if ENGINE_URL else Engine()
+
+# Function to get the worker that runs the index advisor off the script thread: creating an index
+# on a large table takes a while, and a single worker keeps index builds from overlapping
+@st.cache_resource
+def get_advisor_executor():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+
+# Function to configure metrics export once per process
+@st.cache_resource
+def setup_metrics():
+    store = metrics.get_metrics()
+    store.jsonl_path = METRICS_JSONL
+    return metrics.serve_prometheus(METRICS_PORT, METRICS_HOST) if METRICS_PORT else None
+
+setup_metrics()
+
+# Function to move the result window by a number of pages
+def change_page(step):
+    st.session_state["result_page"] = max(st.session_state.get("result_page", 0) + step, 0)
+
+# Function to restart paging when the page size changes
+def change_page_size():
+    st.session_state["result_page"] = 0
+
+# Function to fetch the current page on the engine's SQL workers. While the query runs, the
+# script shows the elapsed time and a Cancel button and polls by rerunning; returns the page,
+# or None if the query is still running or failed.
+def fetch_result_page(query_id, page):
+    engine = get_engine()
+    job = engine.submit_page(query_id, page, st.session_state.get("page_size", DEFAULT_PAGE_SIZE))
+
+    if not job.wait(QUERY_POLL_SECONDS):
+        timeout = engine.query_timeout
+        st.progress(min(job.elapsed() / timeout, 1.0) if timeout else 0.0,
+                    text=f"Running query... {job.elapsed():.1f}s")
+        st.button("Cancel query", on_click=job.cancel)
+        st.rerun()
 
-# Function to Load Google Gemini Model and provide SQL query as response
-def get_gemini_response(question, prompt):
-    model = genai.GenerativeModel('gemini-pro')
-    response = model.generate_content([prompt[0], question])
-    return response.text.strip()
-
-# Function to retrieve query from the SQL database
-def read_sql_query(sql, db):
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
     try:
-        # Clean SQL query from markdown or any unwanted characters
-        sql_clean = sql.replace("```sql", "").replace("```", "").strip()
-        print(f"Executing SQL query: {sql_clean}")  # Print SQL query for debugging
-        cur.execute(sql_clean)
-        rows = cur.fetchall()
-        columns = [description[0] for description in cur.description]  # Get column names
-    except sqlite3.OperationalError as e:
+        return job.result()
+    except QueryAborted as e:
+        st.error(f"{e} Try a narrower question.")
+    except QUERY_ERRORS as e:
         st.error(f"Error executing query: {e}")
-        return pd.DataFrame()
-    finally:
-        conn.close()
-    
-    # Ensure rounding precision is maintained
-    df = pd.DataFrame(rows, columns=columns)
-    numeric_cols = df.select_dtypes(include='number').columns
-    df[numeric_cols] = df[numeric_cols].round(2)
-    
-    return df
-
-# Function to create a database from a DataFrame
-def create_database_from_df(df, db_name):
-    conn = sqlite3.connect(db_name)
-    df.to_sql('uploaded_data', conn, if_exists='replace', index=False)
-    conn.close()
+    return None
+
+# Function to render the current page of a result window with page navigation
+def render_result_window(query_id):
+    page = st.session_state.get("result_page", 0)
+    result = fetch_result_page(query_id, page)
+    if result is None:
+        return False
+    table = result["table"]
+
+    st.subheader("The Response is:")
+    if table.num_rows == 0 and page == 0:
+        st.write("No data found for the query.")
+        return True
+
+    # st.dataframe takes the Arrow table as-is and virtualizes rendering, so only visible rows
+    # reach the browser
+    with metrics.span("render", rows=table.num_rows):
+        st.dataframe(table, use_container_width=True, hide_index=True)
+    first_row = result["page_start"] + 1
+    st.caption(f"Rows {first_row:,}-{first_row + table.num_rows - 1:,}" + (" (more available)" if result["has_more"] else ""))
+    if result["capped"]:
+        st.warning(f"Results are capped at {result['max_rows']:,} rows. Narrow the question to see the rest.")
+
+    previous_col, next_col, size_col = st.columns(3)
+    previous_col.button("Previous page", disabled=page == 0, on_click=change_page, args=(-1,))
+    next_col.button("Next page", disabled=not result["has_more"], on_click=change_page, args=(1,))
+    size_col.selectbox("Rows per page", PAGE_SIZE_OPTIONS, index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE),
+                       key="page_size", on_change=change_page_size)
+    return True
 
 # Function to get table names from the database
 def get_table_names(db):
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cur.fetchall()
-    conn.close()
-    return [table[0] for table in tables]
+    return get_engine().table_names(db)
 
 # Function to get column names from the database table
 def get_column_names(table_name, db):
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info({table_name})")
-    columns = [row[1] for row in cur.fetchall()]
-    conn.close()
-    return columns
-
-
-def generate_prompt(table_name, columns):
-    columns_str = ", ".join(columns)
-    return [
-        f"""
-You are an expert in converting English questions to SQL queries!
-The SQL database has a table named '{table_name}' with the following columns: {columns_str}.
-Here are some examples of how to convert English questions to SQL queries:
-
-Example 1 - How many entries of records are present in the table?
-Query: SELECT COUNT(*) FROM {table_name};
-
-Example 2 - Tell me all the records where the column '<COLUMN_NAME>' has the value '<VALUE>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME> = '<VALUE>';
-
-Example 3 - What is the average value of the column '<COLUMN_NAME>'?
-Query: SELECT AVG(<COLUMN_NAME>) FROM {table_name};
-
-Example 4 - List all records where the column '<COLUMN_NAME1>' is '<VALUE1>' and the column '<COLUMN_NAME2>' is greater than <VALUE2>.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> = '<VALUE1>' AND <COLUMN_NAME2> > <VALUE2>;
-
-Example 5 - Get the sum of the column '<COLUMN_NAME>' for records where '<COLUMN_NAME2>' is '<VALUE>'.
-Query: SELECT SUM(<COLUMN_NAME>) FROM {table_name} WHERE <COLUMN_NAME2> = '<VALUE>';
-
-Example 6 - Retrieve the top <N> records with the highest values in the column '<COLUMN_NAME>'.
-Query: SELECT * FROM {table_name} ORDER BY <COLUMN_NAME> DESC LIMIT <N>;
-
-Example 7 - Find the maximum value in the column '<COLUMN_NAME>'.
-Query: SELECT MAX(<COLUMN_NAME>) FROM {table_name};
-
-Example 8 - Show the count of records grouped by the column '<COLUMN_NAME>'.
-Query: SELECT <COLUMN_NAME>, COUNT(*) FROM {table_name} GROUP BY <COLUMN_NAME>;
-
-Example 9 - Display records where the column '<COLUMN_NAME>' is between '<VALUE1>' and '<VALUE2>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME> BETWEEN '<VALUE1>' AND '<VALUE2>';
-
-Example 10 - Fetch all distinct values in the column '<COLUMN_NAME>'.
-Query: SELECT DISTINCT <COLUMN_NAME> FROM {table_name};
-
-Example 11 - List records where the '<COLUMN_NAME1>' is greater than <VALUE1>, the '<COLUMN_NAME2>' is '<VALUE2>', and order by '<COLUMN_NAME3>' in descending order.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> > <VALUE1> AND <COLUMN_NAME2> = '<VALUE2>' ORDER BY <COLUMN_NAME3> DESC;
-
-Example 12 - Calculate the average '<COLUMN_NAME1>' and the total '<COLUMN_NAME2>' for each '<COLUMN_NAME3>' where '<COLUMN_NAME4>' is '<VALUE>'.
-Query: SELECT <COLUMN_NAME3>, AVG(<COLUMN_NAME1>) AS Avg<COLUMN_NAME1>, SUM(<COLUMN_NAME2>) AS Total<COLUMN_NAME2> FROM {table_name} WHERE <COLUMN_NAME4> = '<VALUE>' GROUP BY <COLUMN_NAME3>;
-
-Example 13 - Retrieve records where '<COLUMN_NAME1>' is between <VALUE1> and <VALUE2>, '<COLUMN_NAME2>' is '<VALUE3>', and '<COLUMN_NAME3>' is either '<VALUE4>' or '<VALUE5>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> BETWEEN <VALUE1> AND <VALUE2> AND <COLUMN_NAME2> = '<VALUE3>' AND <COLUMN_NAME3> IN ('<VALUE4>', '<VALUE5>');
-
-Example 14 - Show the top <N> '<COLUMN_NAME1>' with the highest average '<COLUMN_NAME2>', including the count of records in each '<COLUMN_NAME1>'.
-Query: SELECT <COLUMN_NAME1>, AVG(<COLUMN_NAME2>) AS Avg<COLUMN_NAME2>, COUNT(*) AS RecordCount FROM {table_name} GROUP BY <COLUMN_NAME1> ORDER BY Avg<COLUMN_NAME2> DESC LIMIT <N>;
-
-Example 15 - Find all records where the '<COLUMN_NAME1>' is greater than the average '<COLUMN_NAME1>' and the '<COLUMN_NAME2>' is less than <VALUE>.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> > (SELECT AVG(<COLUMN_NAME1>) FROM {table_name}) AND <COLUMN_NAME2> < <VALUE>;
-
-Example 16 - Fetch records where the '<COLUMN_NAME1>' is not null and '<COLUMN_NAME2>' does not contain '<VALUE>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> IS NOT NULL AND <COLUMN_NAME2> NOT LIKE '%<VALUE>%';
-
-Example 17 - List records where '<COLUMN_NAME1>' is '<VALUE1>' and either '<COLUMN_NAME2>' is '<VALUE2>' or '<COLUMN_NAME3>' is less than '<VALUE3>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> = '<VALUE1>' AND (<COLUMN_NAME2> = '<VALUE2>' OR <COLUMN_NAME3> < <VALUE3>);
+    return get_engine().column_names(table_name, db)
 
-Example 18 - Get the total count of records, the average value of '<COLUMN_NAME1>', and the maximum '<COLUMN_NAME2>' for records where '<COLUMN_NAME3>' is '<VALUE>'.
-Query: SELECT COUNT(*), AVG(<COLUMN_NAME1>), MAX(<COLUMN_NAME2>) FROM {table_name} WHERE <COLUMN_NAME3> = '<VALUE>';
-
-Example 19 - Find records where the '<COLUMN_NAME1>' value is within the range of the minimum and maximum values of '<COLUMN_NAME2>' grouped by '<COLUMN_NAME3>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> BETWEEN (SELECT MIN(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>) AND (SELECT MAX(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>);
-
-Example 20 - List the number of distinct '<COLUMN_NAME>' values along with their frequencies, sorted by frequency in descending order.
-Query: SELECT <COLUMN_NAME>, COUNT(*) AS Frequency FROM {table_name} GROUP BY <COLUMN_NAME> ORDER BY Frequency DESC;
-
-Example 21 - Retrieve records where '<COLUMN_NAME1>' is in the top 5 values, and '<COLUMN_NAME2>' is not null, ordered by '<COLUMN_NAME3>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> IN (SELECT <COLUMN_NAME1> FROM {table_name} ORDER BY <COLUMN_NAME1> DESC LIMIT 5) AND <COLUMN_NAME2> IS NOT NULL ORDER BY <COLUMN_NAME3>;
-
-Example 22 - Find records where the '<COLUMN_NAME1>' value is within the range of the minimum and maximum values of '<COLUMN_NAME2>' grouped by '<COLUMN_NAME3>'.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> BETWEEN (SELECT MIN(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>) AND (SELECT MAX(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>);
-
-Example 23 - Fetch records where '<COLUMN_NAME1>' is equal to '<VALUE1>' and '<COLUMN_NAME2>' is within the last 7 days from today.
-Query: SELECT * FROM {table_name} WHERE <COLUMN_NAME1> = '<VALUE1>' AND <COLUMN_NAME2> >= DATE_SUB(CURDATE(), INTERVAL 7 DAY);
-
-Example 24 - Show the average '<COLUMN_NAME1>', sum of '<COLUMN_NAME2>', and count of '<COLUMN_NAME3>' for records grouped by '<COLUMN_NAME4>' having count greater than 5.
-Query: SELECT <COLUMN_NAME4>, AVG(<COLUMN_NAME1>), SUM(<COLUMN_NAME2>), COUNT(<COLUMN_NAME3>) FROM {table_name} GROUP BY <COLUMN_NAME4> HAVING COUNT(<COLUMN_NAME3>) > 5;
-
-Example 25 - Calculate the price of one item given the total sales and total reviews, rounded to two decimal places.
-Query: SELECT ROUND(SUM(total_sale) / SUM(total_review), 2) AS item_price FROM {table_name};
-
-Example 26 - Give me all records which month have only one record.
-Query: SELECT * FROM {table_name} WHERE EXTRACT(MONTH FROM <DATE_COLUMN>) IN (SELECT month FROM (SELECT EXTRACT(MONTH FROM <DATE_COLUMN>) AS month, COUNT(*) AS record_count FROM {table_name} GROUP BY month) AS monthly_counts WHERE record_count = 1);
-
-Example 27 - Give all records and add a new column for single unit price (<REVENUE_COLUMN> / <UNITS_SOLD_COLUMN>) rounded to two decimal places.
-Query: SELECT *, ROUND(<REVENUE_COLUMN> / <UNITS_SOLD_COLUMN>, 2) AS Single_Unit_Price FROM {table_name};
-
-Example 28 - Give all records and add a column showing the result of a calculation (e.g., <COLUMN_NAME1> divided by <COLUMN_NAME2>) rounded to two decimal places.
-Query: SELECT *, ROUND(<COLUMN_NAME1> / <COLUMN_NAME2>, 2) AS Calculated_Column FROM {table_name};
-
-Example 29 - Give all records and add a column showing the result of a mathematical operation (e.g., <COLUMN_NAME> multiplied by <VALUE>) rounded to two decimal places.
-Query: SELECT *, ROUND(<COLUMN_NAME> * <VALUE>, 2) AS Calculated_Column FROM {table_name};
-
-Example 30 - Give all records and add a column showing the monthly salary (salary divided by 12) rounded to two decimal places.
-Query: SELECT *, ROUND(salary / 12, 2) AS Monthly_Salary FROM {table_name};
-
-Example 31 - Add a new column showing the total price (quantity * unit_price) rounded to two decimal places.
-Query: SELECT *, ROUND(quantity * unit_price, 2) AS Total_Price FROM {table_name};
-
-The SQL code should not have ``` in the beginning or end and should not include the word 'Query' in the output. Ensure that the generated SQL query is accurate and matches the requested parameters precisely.
-"""
-    ]
 
 def list_databases(root_dir):
-    return {
-        os.path.splitext(file)[0]: os.path.join(root_dir, file)
-        for file in os.listdir(root_dir) if file.endswith(".db")
-    }
+    return get_engine().databases()
 
 def delete_database(db_path):
-    os.remove(db_path)
+    get_engine().delete_database(db_path)
 
 # Streamlit APP
 st.set_page_config(page_title="Gemini Application for Translating Natural Language Queries into SQL and Retrieving Data Using Python and Streamlit | haidertoqeer")
@@ -222,19 +168,71 @@ else:
     st.warning("At least one database must remain. Cannot delete the only database.")
 
 # Continue with the rest of your Streamlit app
-uploaded_file = st.file_uploader("Upload an XLSX or CSV file", type=["xlsx", "csv"])
+STORAGE_ENGINES = {"SQLite (row store)": "sqlite", "DuckDB + Parquet (columnar)": "duckdb"}
 
-if uploaded_file:
+uploaded_file = st.file_uploader("Upload an XLSX or CSV file", type=["xlsx", "csv"])
+storage_engine = st.radio(
+    "Storage engine", list(STORAGE_ENGINES), horizontal=True,
+    help="The columnar engine stores uploads as Parquet and runs queries on DuckDB; "
+         "it is much faster for aggregates over large tables.",
+)
+UPLOAD_MODES = {"Replace the table": "replace", "Update changed rows only": "upsert"}
+upload_mode = UPLOAD_MODES[st.radio(
+    "Upload mode", list(UPLOAD_MODES), horizontal=True,
+    help="Re-uploading a refreshed file with 'Update changed rows only' writes just the rows that are new "
+         "or changed since the last upload and keeps the table's indexes.",
+)]
+upsert_key = st.text_input(
+    "Key column (optional)", key="upsert_key",
+    help="Match rows on this column instead of by position; rows missing from the file are kept.",
+) if upload_mode == "upsert" else None
+
+# Identity of an upload and the settings it is loaded with. Every rerun (page clicks, polling a
+# running query) sees the same attached file, so it is only ingested when this changes.
+upload_identity = (
+    getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size),
+    storage_engine, upload_mode, upsert_key or None,
+) if uploaded_file else None
+if upload_identity is None:
+    st.session_state.pop("ingested_upload", None)  # the same file attached again is a new upload
+
+if uploaded_file and st.session_state.get("ingested_upload") != upload_identity:
+    st.session_state["ingested_upload"] = upload_identity
     try:
-        if uploaded_file.name.endswith(".xlsx"):
-            df = pd.read_excel(uploaded_file)
-        elif uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-        
-        uploaded_db_name = uploaded_file.name.split(".")[0] + ".db"
-        create_database_from_df(df, uploaded_db_name)
+        engine = STORAGE_ENGINES[storage_engine]
+        progress_bar = st.progress(0.0, text="Loading rows...")
+
+        # Report progress as the share of the uploaded file consumed so far
+        def report_progress(rows_written, elapsed):
+            fraction = min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0)
+            progress_bar.progress(fraction, text=f"Loaded {rows_written:,} rows in {elapsed:.1f}s")
+
+        # XLSX is a zip archive, so the file position says nothing about progress
+        def report_row_count(rows_written, elapsed):
+            progress_bar.progress(0.0, text=f"Loaded {rows_written:,} rows in {elapsed:.1f}s")
+
+        report = get_engine().ingest(
+            uploaded_file, uploaded_file.name, engine=engine, size=uploaded_file.size,
+            progress=report_row_count if uploaded_file.name.endswith(".xlsx") else report_progress,
+            mode=upload_mode, key=upsert_key or None,
+        )
+
+        progress_bar.empty()
         available_databases = refresh_available_databases()  # Refresh the database list
-        st.success(f"Database '{uploaded_file.name.split('.')[0]}' created successfully!")
+        if "inserted" in report:
+            st.success(
+                f"Database '{report['database']}' updated: {report['inserted']:,} rows inserted, "
+                f"{report['updated']:,} updated, {report['skipped']:,} unchanged"
+                + (f", {report['deleted']:,} deleted" if report["deleted"] else "")
+                + f" ({report['seconds']:.1f}s)"
+            )
+        else:
+            st.success(
+                f"Database '{report['database']}' created successfully! "
+                f"({report['rows']:,} rows, {report['rows_per_sec']:,.0f} rows/sec)"
+            )
+        if "tables" in report:
+            st.caption("Tables: " + ", ".join(f"{t['table']} ({t['rows']:,} rows)" for t in report["tables"]))
     except Exception as e:
         st.error(f"Error uploading file: {e}")
 
@@ -270,40 +268,108 @@ if submit:
     elif len(question.split()) < 3:  # Check if the question is too short
         st.warning("Please enter a more detailed question.")
     else:
-        # Check for specific phrases and generate default query if applicable
-        if "get all results" in question.lower() or "show all" in question.lower():
-            sql_query = f"SELECT * FROM {selected_table};"
-        else:
-            with st.spinner("Generating SQL query and retrieving data..."):
-                try:
-                    # Generate prompt and get SQL query
-                    prompt = generate_prompt(selected_table, columns)
-                    response = get_gemini_response(question, prompt)
-                    
-                    # Clean SQL query from markdown or any unwanted characters
-                    sql_query = response.replace("```sql", "").replace("```", "").strip()
-                    
-                except Exception as e:
-                    st.error(f"Error generating SQL query: {e}")
-                    sql_query = ""
-        
-        # Display the generated SQL query in a styled box
-        st.markdown(
-            f"""
-            <div style="background-color: #f0f0f0; color: #000000; padding: 15px; border-radius: 8px; box-shadow: 0px 4px 6px rgba(0, 0, 0, 0.1);">
-                <strong>Generated SQL Query:</strong>
-                <pre style="background-color: #ffffff; padding: 10px; border-radius: 4px; overflow-x: auto;">{sql_query}</pre>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-        
-        # Retrieve data from the SQL database
-        if sql_query:
-            df = read_sql_query(sql_query, selected_db)
-
-            st.subheader("The Response is:")
-            if not df.empty:
-                st.table(df)
+        engine = get_engine()
+        previous_query = st.session_state.get("query_id")
+        if previous_query is not None:
+            engine.close_query(previous_query)
+        result = {"sql": "", "error": None, "query_id": None}
+        try:
+            page_size = st.session_state.get("page_size", DEFAULT_PAGE_SIZE)
+            if STREAM_RESPONSES:
+                # Show the SQL as it arrives; once the statement is complete it is checked with
+                # EXPLAIN and its first page starts loading while the stream finishes
+                sql_box = st.empty()
+                result = engine.ask(question, selected_db, selected_table, columns=columns, page_size=page_size,
+                                    on_text=lambda text: sql_box.code(clean_sql(text), language="sql"))
+                sql_box.empty()
             else:
-                st.write("No data found for the query.")
\ No newline at end of file
+                with st.spinner("Generating SQL query and retrieving data..."):
+                    result = engine.ask(question, selected_db, selected_table, columns=columns, page_size=page_size)
+        except Exception as e:
+            st.error(f"Error generating SQL query: {e}")
+
+        # Keep the query in the session so page navigation survives reruns
+        sql_query = result["sql"] or ""
+        st.session_state["sql_query"] = sql_query
+        st.session_state["query_id"] = result["query_id"]
+        st.session_state["result_page"] = 0
+        st.session_state["index_advice_pending"] = result["query_id"] is not None
+        st.session_state.pop("index_advice", None)
+        if result["error"] is not None:
+            st.error(f"The generated SQL cannot run on this database: {result['error']}")
+
+if "sql_query" in st.session_state:
+    sql_query = st.session_state["sql_query"]
+
+    # Display the generated SQL query in a styled box
+    st.markdown(
+        f"""
+        <div style="background-color: #f0f0f0; color: #000000; padding: 15px; border-radius: 8px; box-shadow: 0px 4px 6px rgba(0, 0, 0, 0.1);">
+            <strong>Generated SQL Query:</strong>
+            <pre style="background-color: #ffffff; padding: 10px; border-radius: 4px; overflow-x: auto;">{sql_query}</pre>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+    # Retrieve one page of data from the SQL database
+    if st.session_state.get("query_id") is not None:
+        completed = render_result_window(st.session_state["query_id"])
+
+        # Once the first page of a new query is on screen, learn from it and adjust indexes in the
+        # background; the advice is shown on a later rerun once it is ready
+        if st.session_state.pop("index_advice_pending", False) and completed:
+            st.session_state["index_advice"] = get_advisor_executor().submit(
+                get_engine().advise, st.session_state["query_id"], selected_table, columns
+            )
+        advice_job = st.session_state.get("index_advice")
+        if advice_job is not None and not advice_job.done():
+            st.caption("The index advisor is checking this query's indexes in the background.")
+        elif advice_job is not None:
+            try:
+                advice = advice_job.result()
+            except Exception as e:
+                advice = {"error": str(e)}
+            if advice and advice.get("error"):
+                st.warning(f"Index advisor could not update indexes: {advice['error']}")
+            elif advice and advice["recommendations"]:
+                with st.expander("Index advisor"):
+                    for item in advice["recommendations"]:
+                        if item["action"] == "retire":
+                            verb = "Dropped" if advice["applied"] else "Consider dropping"
+                            st.write(f"{verb} unused index `{item['index']}` on `{item['column']}`.")
+                        elif advice["applied"] and item.get("before_seconds") is not None:
+                            st.write(
+                                f"Created index `{item['index']}` on `{item['column']}`: sample query "
+                                f"{item['before_seconds'] * 1000:.1f} ms -> {item['after_seconds'] * 1000:.1f} ms."
+                            )
+                        else:
+                            verb = "Created" if advice["applied"] else "Consider creating"
+                            st.write(f"{verb} an index on `{item['column']}` (used {item['hits']} times "
+                                     f"for {', '.join(item['kinds'])}).")
+
+# Show how often the model round trip was skipped
+engine_stats = get_engine().stats()
+intent_stats = engine_stats["intents"]
+st.sidebar.caption(
+    f"Local SQL: {intent_stats['hits']} of {intent_stats['hits'] + intent_stats['misses']} questions "
+    f"answered without the model ({intent_stats['hit_rate']:.0%})"
+)
+cache_stats = engine_stats["query_cache"]
+st.sidebar.caption(
+    f"Query cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+    f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)"
+)
+killed_queries = engine_stats["killed_queries"]
+if killed_queries:
+    st.sidebar.caption(f"Query watchdog: {killed_queries} queries stopped (see .killed_queries.jsonl)")
+result_stats = engine_stats["result_cache"]
+st.sidebar.caption(
+    f"Result cache: {result_stats['memory_hits'] + result_stats['disk_hits']} hits, "
+    f"{result_stats['misses']} misses, {result_stats['memory_bytes'] / 1024 / 1024:.1f} MB in memory"
+)
+
+# Refresh the Prometheus text file after every run; with ENGINE_URL the engine's stage timings
+# are recorded by the server and exposed on its /metrics
+if METRICS_TEXTFILE:
+    metrics.get_metrics().write_prometheus(METRICS_TEXTFILE)
@@ -0,0 +1,540 @@
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import column_stats
+from connections import get_pool, quote_identifier
+from ingest import DEFAULT_TABLE, SIDE_TABLE_PREFIX, chunk_digest, upsert_chunks, write_chunks
+from metrics import span, timed
+from query_guard import PROGRESS_OPS, QueryError
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# A columnar database is a directory "<name>.parquetdb" holding one sub-directory of Parquet
+# part files per table; queries run on an embedded DuckDB over those files.
+COLUMNAR_SUFFIX = ".parquetdb"
+ENGINES = ("sqlite", "duckdb")
+UPLOAD_MODES = ("replace", "upsert")
+
+# Errors either engine can raise while running generated SQL, including a guard stopping it
+QUERY_ERRORS = (sqlite3.Error, QueryError) + ((duckdb.Error,) if duckdb is not None else ())
+
+# Rows fetched from a SQLite cursor per round trip while building Arrow columns
+FETCH_BATCH_ROWS = 10_000
+
+_READ_ONLY = re.compile(r"^\s*(select|with|values|describe|summarize|explain)\b", re.IGNORECASE)
+
+# Memory a columnar database's DuckDB instance may use before large sorts and aggregates spill
+# to disk. The limit applies to the whole instance, so it is set once per connection.
+DUCKDB_MEMORY_LIMIT_MB = int(os.getenv("DUCKDB_MEMORY_LIMIT_MB", os.getenv("QUERY_TEMP_STORE_MB", "256")))
+
+# Table functions that read files, refused on DuckDB versions that cannot restrict file access
+_FILE_FUNCTIONS = re.compile(r"\b(?:read_\w+|\w+_scan|glob|sniff_csv|parquet_\w+)\s*\(", re.IGNORECASE)
+
+
+# Function to walk a statement as (start, end, kind) pieces, kind being "comment", "quoted"
+# (a string or quoted identifier) or "char" for everything else
+def _scan(sql):
+    position = 0
+    while position < len(sql):
+        char = sql[position]
+        if sql.startswith("--", position):
+            newline = sql.find("\n", position)
+            end = len(sql) if newline < 0 else newline + 1
+            kind = "comment"
+        elif sql.startswith("/*", position):
+            close = sql.find("*/", position + 2)
+            end = len(sql) if close < 0 else close + 2
+            kind = "comment"
+        elif char in "'\"`[":
+            close = sql.find("]" if char == "[" else char, position + 1)
+            end = len(sql) if close < 0 else close + 1
+            kind = "quoted"
+        else:
+            end = position + 1
+            kind = "char"
+        yield position, end, kind
+        position = end
+
+
+# Function to drop the trailing semicolons and comments of a statement, so it can be wrapped in
+# a sub-query. Quoted strings and identifiers are skipped while looking for comments.
+def strip_statement(sql):
+    end = 0
+    for start, stop, kind in _scan(sql):
+        if kind == "quoted" or (kind == "char" and not sql[start].isspace() and sql[start] != ";"):
+            end = stop
+    return sql[:end]
+
+
+# Function to blank out the comments, strings and quoted identifiers of a statement, leaving
+# the SQL keywords and punctuation at their positions
+def code_text(sql):
+    return "".join(sql[start:end] if kind == "char" else " " * (end - start) for start, end, kind in _scan(sql))
+
+
+# Function to tell whether a statement is one statement a columnar database may run: read-only,
+# with no second statement after a semicolon outside strings and comments
+def is_read_only_statement(sql):
+    return _READ_ONLY.match(sql) is not None and ";" not in code_text(strip_statement(sql))
+
+
+# Function to tell whether a statement reads files itself, through a table function or a quoted
+# path used as a table ("FROM 'data.csv'")
+def reads_files(sql):
+    code = code_text(sql)
+    if _FILE_FUNCTIONS.search(code):
+        return True
+    return any(kind == "quoted" and sql[start] == "'" and re.search(r"\b(?:from|join)\s*$", code[:start], re.IGNORECASE)
+               for start, _, kind in _scan(sql))
+
+
+# Function to tell whether a database path is a columnar (Parquet + DuckDB) database
+def is_columnar(db):
+    return db.rstrip("/\\").endswith(COLUMNAR_SUFFIX)
+
+
+# Function to name the storage for a new database given the selected engine
+def database_path(name, engine="sqlite"):
+    return name + (COLUMNAR_SUFFIX if engine == "duckdb" else ".db")
+
+
+# Function to convert decimal columns to float64, matching what SQLite would return
+def _decimals_to_float(table):
+    for position, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(position, field.name, pc.cast(table.column(position), pa.float64()))
+    return table
+
+
+# Function to build one Arrow column from a SQLite result column. SQLite is dynamically typed,
+# so a column mixing e.g. numbers and text is stored as text, as uploads do; so is a column
+# with integers beyond 64 bits.
+def _arrow_column(values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+
+# Row-store backend: the existing SQLite files read through the shared connection pool
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, db):
+        self.db = db
+
+    # With a guard, the progress handler stops the statement once the guard's time runs out or
+    # it is cancelled, and temporary b-trees beyond the temp-store budget spill to a file
+    @contextmanager
+    def _execute(self, sql, params, guard):
+        with get_pool(self.db).connection() as conn:
+            previous = None
+            if guard is not None:
+                if guard.limits.temp_store_mb:
+                    # Pooled connections are shared, so the settings are put back afterwards
+                    previous = (conn.execute("PRAGMA temp_store").fetchone()[0],
+                                conn.execute("PRAGMA temp.cache_size").fetchone()[0])
+                    conn.execute("PRAGMA temp_store = FILE")
+                    conn.execute(f"PRAGMA temp.cache_size = {-int(guard.limits.temp_store_mb * 1024)}")
+                conn.set_progress_handler(guard.progress_handler, PROGRESS_OPS)
+            cur = conn.cursor()
+            try:
+                cur.execute(sql, params)
+                yield cur
+            except sqlite3.OperationalError:
+                if guard is not None:
+                    guard.check(sql)
+                raise
+            finally:
+                cur.close()
+                if guard is not None:
+                    conn.set_progress_handler(None, 0)
+                if previous is not None:
+                    conn.execute(f"PRAGMA temp_store = {int(previous[0])}")
+                    conn.execute(f"PRAGMA temp.cache_size = {int(previous[1])}")
+
+    def query_rows(self, sql, params=(), max_rows=None, guard=None):
+        if guard is not None:
+            max_rows = guard.row_limit(max_rows)
+        with self._execute(sql, params, guard) as cur:
+            if cur.description is None:
+                return [], []
+            rows = cur.fetchall() if max_rows is None else cur.fetchmany(max_rows)
+            return [description[0] for description in cur.description], rows
+
+    # Function to read a result straight into Arrow columns. Rows are fetched in batches and each
+    # batch is packed into a 2-D object array right away, so the full result never exists as
+    # row tuples, and never as pandas object columns; every column then becomes one Arrow array.
+    def query_arrow(self, sql, params=(), max_rows=None, guard=None):
+        if guard is not None:
+            max_rows = guard.row_limit(max_rows)
+        with span("sql.execute", engine=self.name), self._execute(sql, params, guard) as cur:
+            if cur.description is None:
+                return pa.table({})
+            names = [description[0] for description in cur.description]
+            batches = []
+            remaining = max_rows
+            while remaining is None or remaining > 0:
+                rows = cur.fetchmany(FETCH_BATCH_ROWS if remaining is None else min(FETCH_BATCH_ROWS, remaining))
+                if not rows:
+                    break
+                batches.append(np.array(rows, dtype=object))
+                if remaining is not None:
+                    remaining -= len(rows)
+        values = np.concatenate(batches) if batches else np.empty((0, len(names)), dtype=object)
+        with span("frame.build", rows=len(values)):
+            return pa.Table.from_arrays([_arrow_column(values[:, position]) for position in range(len(names))],
+                                        names=names)
+
+    def query_frame(self, sql, params=(), max_rows=None, guard=None):
+        return self.query_arrow(sql, params, max_rows, guard).to_pandas()
+
+    # Function to compile a statement without running it; raises the engine's error for bad SQL
+    def validate(self, sql):
+        with get_pool(self.db).connection() as conn:
+            conn.execute("EXPLAIN " + sql).fetchall()
+
+    def schema_version(self):
+        with get_pool(self.db).connection() as conn:
+            return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    def table_names(self):
+        with get_pool(self.db).connection() as conn:
+            # sqlite_stat1 and friends (created by ANALYZE) are not user tables, nor is our bookkeeping
+            rows = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\';"
+            ).fetchall()
+        return [row[0] for row in rows if not row[0].startswith(SIDE_TABLE_PREFIX)]
+
+    def column_names(self, table_name):
+        with get_pool(self.db).connection() as conn:
+            rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+        return [row[1] for row in rows]
+
+    # Function to tell whether "rowid" names the row id of a table, so it can be paged by rowid:
+    # false for views, WITHOUT ROWID tables and tables with a column of that name
+    def rowid_table(self, table_name):
+        with get_pool(self.db).connection() as conn:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                               (table_name,)).fetchone()
+        if row is None or re.search(r"\bwithout\s+rowid\s*;?\s*$", row[0] or "", re.IGNORECASE):
+            return False
+        return not {"rowid", "_rowid_", "oid"} & {column.lower() for column in self.column_names(table_name)}
+
+    # Function to read a table's column statistics (see column_stats.read_stats), or None
+    def table_stats(self, table_name):
+        with get_pool(self.db).connection() as conn:
+            return column_stats.read_stats(conn, table_name)
+
+    # Function to answer a simple aggregate from the table's column statistics instead of
+    # scanning it; returns an Arrow table, or None when the statistics cannot give the exact answer
+    def query_stats(self, sql):
+        query = column_stats.parse_aggregate(sql)
+        if query is None:
+            return None
+        with span("sql.stats", engine=self.name):
+            answer = column_stats.answer(query, self.table_stats(query["table"]))
+        if answer is None:
+            return None
+        names, columns = answer
+        return pa.Table.from_arrays([_arrow_column(values) for values in columns], names=names)
+
+    def close(self):
+        pass
+
+
+# Columnar backend: Parquet part files queried by an in-memory DuckDB connection that exposes
+# each table as a view. DuckDB executes vectorized and on all cores, and results are fetched
+# as Arrow record batches without going through Python row tuples. Generated SQL may only read
+# files under the database's directory: the connection is confined to it and its configuration
+# locked. DuckDB before 1.3 cannot confine file access, so there statements that read files
+# themselves are refused instead.
+class DuckDBBackend:
+    name = "duckdb"
+
+    def __init__(self, db):
+        if duckdb is None:
+            raise ImportError("Missing optional dependency 'duckdb'. Please install it using `pip install duckdb`.")
+        self.db = db
+        self._conn = None
+        self._confined = False
+        self._views_version = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = duckdb.connect(":memory:")
+        conn.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT_MB}MB'")
+        directory = (os.path.abspath(self.db) + os.sep).replace("'", "''")
+        try:
+            conn.execute(f"SET allowed_directories = ['{directory}']")
+        except duckdb.Error:  # DuckDB < 1.3
+            self._confined = False
+        else:
+            conn.execute("SET enable_external_access = false")
+            conn.execute("SET lock_configuration = true")
+            self._confined = True
+        return conn
+
+    def _check(self, sql):
+        if not is_read_only_statement(sql):
+            raise duckdb.InvalidInputException("Only single read-only statements can run on a columnar database.")
+        if not self._confined and reads_files(sql):
+            raise duckdb.InvalidInputException("Queries on a columnar database cannot read other files.")
+
+    def _version(self):
+        # Staging directories of in-flight writes start with "."
+        return tuple(
+            (entry.name, entry.stat().st_mtime_ns) for entry in sorted(os.scandir(self.db), key=lambda e: e.name)
+            if entry.is_dir() and not entry.name.startswith(".")
+        )
+
+    # Function to (re)create one view per table directory whenever the set of tables changes
+    def _connection(self):
+        version = self._version()
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            if version != self._views_version:
+                current = {table_name for table_name, _ in version}
+                for table_name, _ in self._views_version or ():
+                    if table_name not in current:
+                        self._conn.execute(f"DROP VIEW IF EXISTS {quote_identifier(table_name)}")
+                for table_name, _ in version:
+                    pattern = os.path.join(os.path.abspath(self.db), table_name, "*.parquet").replace("'", "''")
+                    self._conn.execute(
+                        f"CREATE OR REPLACE VIEW {quote_identifier(table_name)} AS "
+                        f"SELECT * FROM read_parquet('{pattern}', union_by_name = true)"
+                    )
+                self._views_version = version
+            return self._conn.cursor()
+
+    # DuckDB has no progress handler, so a guard interrupts the cursor from its timer or cancel()
+    # instead
+    def query_arrow(self, sql, params=(), max_rows=None, guard=None):
+        self._check(sql)
+        cursor = self._connection()
+        if guard is not None:
+            max_rows = guard.row_limit(max_rows)
+            guard.on_interrupt(cursor.interrupt)
+        with span("sql.execute", engine=self.name):
+            try:
+                result = cursor.execute(strip_statement(sql), list(params))
+                if max_rows is None:
+                    table = result.fetch_arrow_table()
+                else:
+                    reader = result.to_arrow_reader(max_rows) if hasattr(result, "to_arrow_reader") \
+                        else result.fetch_record_batch(max_rows)
+                    batches = []
+                    remaining = max_rows
+                    for batch in reader:
+                        if guard is not None:
+                            guard.check(sql)
+                        batches.append(batch.slice(0, remaining))
+                        remaining -= batches[-1].num_rows
+                        if remaining <= 0:
+                            break
+                    table = pa.Table.from_batches(batches, schema=reader.schema)
+            except duckdb.Error:
+                if guard is not None:
+                    guard.check(sql)
+                raise
+            finally:
+                cursor.close()
+        return _decimals_to_float(table)
+
+    def query_frame(self, sql, params=(), max_rows=None, guard=None):
+        return self.query_arrow(sql, params, max_rows, guard).to_pandas()
+
+    def query_rows(self, sql, params=(), max_rows=None, guard=None):
+        table = self.query_arrow(sql, params, max_rows, guard)
+        return table.column_names, list(zip(*(column.to_pylist() for column in table.columns)))
+
+    def validate(self, sql):
+        self._check(sql)
+        cursor = self._connection()
+        try:
+            cursor.execute("EXPLAIN " + strip_statement(sql)).fetchall()
+        finally:
+            cursor.close()
+
+    def schema_version(self):
+        return self._version()
+
+    def table_names(self):
+        return [table_name for table_name, _ in self._version()]
+
+    def column_names(self, table_name):
+        cursor = self._connection()
+        try:
+            return [row[0] for row in cursor.execute(f"DESCRIBE {quote_identifier(table_name)}").fetchall()]
+        finally:
+            cursor.close()
+
+    def table_stats(self, table_name):
+        return column_stats.read_stats_file(os.path.join(self.db, table_name))
+
+    def rowid_table(self, table_name):
+        return False
+
+    # DuckDB already answers counts and min/max from the Parquet footers, so queries always run
+    def query_stats(self, sql):
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._views_version = None
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+# Function to get the shared backend for a database; the engine follows from the path
+def get_backend(db):
+    key = os.path.abspath(db)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _backends[key] = DuckDBBackend(db) if is_columnar(db) else SQLiteBackend(db)
+        return backend
+
+
+def close_backend(db):
+    with _backends_lock:
+        backend = _backends.pop(os.path.abspath(db), None)
+    if backend is not None:
+        backend.close()
+
+
+# Function to convert a DataFrame chunk to Arrow, storing mixed-type object columns as text
+def _arrow_chunk(chunk):
+    try:
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        chunk = chunk.copy()
+        for column in chunk.columns:
+            if chunk[column].dtype == object:
+                chunk[column] = chunk[column].map(lambda value: None if pd.isna(value) else str(value))
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+# Function to count a changed chunk's rows against the part it replaces, row by row at the same
+# positions; returns (inserted, updated, skipped)
+def _diff_part(path, chunk):
+    previous = pd.util.hash_pandas_object(pq.read_table(path).to_pandas(), index=False).to_numpy()
+    current = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    overlap = min(len(previous), len(current))
+    skipped = int((previous[:overlap] == current[:overlap]).sum())
+    return len(current) - overlap, overlap - skipped, skipped
+
+
+# Function to stream DataFrame chunks into a columnar table, one Parquet part per chunk.
+# Same call shape as ingest.write_chunks; the parts are written to a staging directory that is
+# swapped in for the table once all of them exist, so readers never see a partial table (two
+# renames: between them the table is briefly missing).
+# Each part carries its chunk's fingerprint, and with mode="upsert" a part whose fingerprint
+# matches the incoming chunk at the same position is reused instead of rewritten, so the table
+# mirrors the new file at the cost of its changed chunks. The report then counts rows inserted,
+# updated, skipped and deleted by position, as ingest.upsert_chunks does without a key. The
+# table's column statistics are written next to the parts (see column_stats).
+def write_parquet_chunks(chunks, db_name, table_name=DEFAULT_TABLE, progress=None, mode="replace", **kwargs):
+    started = time.perf_counter()
+    os.makedirs(db_name, exist_ok=True)
+    target = os.path.join(db_name, table_name)
+    staging = os.path.join(db_name, f".{table_name}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(staging)
+    upsert = mode == "upsert" and os.path.isdir(target)
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "deleted": 0}
+    stats = column_stats.StatsBuilder()
+    rows_written = 0
+    chunk_count = 0
+    try:
+        for chunk in timed(chunks, "ingest.parse"):
+            name = f"part-{chunk_count:05d}.parquet"
+            digest = chunk_digest(chunk)
+            previous = os.path.join(target, name)
+            if upsert and os.path.exists(previous) \
+                    and (pq.read_schema(previous).metadata or {}).get(b"nl2sql.digest") == digest.encode():
+                try:
+                    os.link(previous, os.path.join(staging, name))
+                except OSError:  # no hard links on this filesystem
+                    shutil.copy2(previous, os.path.join(staging, name))
+                counts["skipped"] += len(chunk)
+            else:
+                if upsert:
+                    changes = _diff_part(previous, chunk) if os.path.exists(previous) else (len(chunk), 0, 0)
+                    for key, count in zip(("inserted", "updated", "skipped"), changes):
+                        counts[key] += count
+                with span("ingest.write", rows=len(chunk)):
+                    table = _arrow_chunk(chunk)
+                    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"nl2sql.digest": digest})
+                    pq.write_table(table, os.path.join(staging, name))
+            chunk_count += 1
+            rows_written += len(chunk)
+            with span("ingest.stats", rows=len(chunk)):
+                stats.add(chunk)
+            if progress is not None:
+                progress(rows_written, time.perf_counter() - started)
+        if chunk_count == 0:
+            raise ValueError("No data to ingest.")
+        column_stats.save_stats_file(staging, stats.result())
+        if upsert:
+            for entry in os.scandir(target):
+                if entry.name.endswith(".parquet") and not os.path.exists(os.path.join(staging, entry.name)):
+                    counts["deleted"] += pq.read_metadata(entry.path).num_rows
+
+        if os.path.exists(target):
+            retired = staging + ".old"
+            os.replace(target, retired)
+            os.replace(staging, target)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    seconds = time.perf_counter() - started
+    report = {
+        "table": table_name,
+        "rows": rows_written,
+        "chunks": chunk_count,
+        "seconds": seconds,
+        "rows_per_sec": rows_written / seconds if seconds > 0 else 0.0,
+    }
+    if mode == "upsert":
+        report.update(counts if upsert else {"inserted": rows_written, "updated": 0, "skipped": 0, "deleted": 0})
+    return report
+
+
+# Function to pick the chunk writer for an engine and upload mode: "replace" rewrites the table,
+# "upsert" writes only new or changed rows, matched on `key` when given (SQLite only)
+def chunk_writer(engine, mode="replace", key=None):
+    if mode not in UPLOAD_MODES:
+        raise ValueError(f"Unknown upload mode: {mode}")
+    if engine == "duckdb":
+        if key:
+            raise ValueError("Upserts on a key column need the SQLite engine.")
+        return functools.partial(write_parquet_chunks, mode=mode) if mode == "upsert" else write_parquet_chunks
+    if mode == "upsert":
+        return functools.partial(upsert_chunks, key=key or None)
+    return write_chunks
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+
+from backends import QUERY_ERRORS
+from connections import SchemaCatalog
+from llm import StubModel, get_gemini_response_async, get_model
+from metrics import get_metrics
+from prompting import DEFAULT_TOP_K, generate_prompt
+from query_cache import QueryCache
+from query_guard import QueryAborted, QueryLimits, QueryWatchdog
+from result_cache import ResultCache
+from results import clean_sql, is_single_select, read_dataframe
+
+PREVIEW_ROWS = 5
+
+
+# Token-bucket rate limiter: allows `rate` acquisitions per second with bursts up to `capacity`
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Function to read questions from a text file (one per line) or a CSV/Parquet file with a
+# 'question' column
+def load_questions(path):
+    if path.endswith(".csv"):
+        return [q for q in pd.read_csv(path)["question"].dropna().astype(str) if q.strip()]
+    if path.endswith(".parquet"):
+        return [q for q in pd.read_parquet(path)["question"].dropna().astype(str) if q.strip()]
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+# Function to list every (database, table, columns) target under a directory
+def discover_targets(root_dir):
+    catalog = SchemaCatalog()
+    targets = []
+    for db_name, db in sorted(catalog.databases(root_dir).items()):
+        for table_name in catalog.table_names(db):
+            targets.append((db_name, db, table_name, catalog.column_names(table_name, db)))
+    return targets
+
+
+# Function to write batch results as Parquet or CSV depending on the file extension
+def write_results(records, output):
+    df = pd.DataFrame.from_records(records)
+    if output.endswith(".parquet"):
+        df.to_parquet(output, index=False)
+    else:
+        df.to_csv(output, index=False)
+    return df
+
+
+# Runs every question against every target: model calls are issued concurrently on the event
+# loop, bounded by a semaphore and a token bucket, and the generated SQL runs on the query
+# watchdog's worker threads under its time and row limits. Only single SELECT statements are
+# run, and model SQL enters the question -> SQL cache once it has run successfully.
+class BatchRunner:
+    def __init__(self, model, concurrency=8, rate=5.0, burst=None, sql_workers=4,
+                 top_k=DEFAULT_TOP_K, max_rows=10_000, query_cache=None, result_cache=None, query_timeout=30.0):
+        self.model = model
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.sql_workers = sql_workers
+        self.top_k = top_k
+        self.max_rows = max_rows
+        self.query_cache = query_cache
+        self.result_cache = result_cache
+        self.watchdog = QueryWatchdog(QueryLimits(timeout=query_timeout, max_rows=max_rows), workers=sql_workers)
+
+    async def _run_one(self, semaphore, bucket, question, target):
+        db_name, db, table_name, columns = target
+        record = {"database": db_name, "table": table_name, "question": question, "sql": None,
+                  "status": "ok", "error": None, "cached": False, "row_count": None,
+                  "model_seconds": 0.0, "sql_seconds": None, "preview": None}
+        try:
+            sql = self.query_cache.get(question, table_name, columns) if self.query_cache else None
+            if sql is not None:
+                record["cached"] = True
+            else:
+                prompt = generate_prompt(table_name, columns, question=question, top_k=self.top_k)
+                async with semaphore:
+                    await bucket.acquire()
+                    started = time.perf_counter()
+                    sql = clean_sql(await get_gemini_response_async(question, prompt, model=self.model))
+                    record["model_seconds"] = time.perf_counter() - started
+            record["sql"] = sql
+        except Exception as e:
+            record.update(status="model_error", error=str(e))
+            return record
+
+        if not sql or not is_single_select(sql):
+            record.update(status="sql_error", error="Only single SELECT statements can be run.")
+            return record
+
+        started = time.perf_counter()
+        try:
+            job = self.watchdog.submit(read_dataframe, sql, db, self.max_rows, self.result_cache, sql=sql, db=db)
+            df = await asyncio.wrap_future(job.future)
+            record["row_count"] = len(df)
+            record["preview"] = df.head(PREVIEW_ROWS).to_json(orient="records")
+            # Only SQL that ran is worth reusing; the cache is shared with interactive users
+            if self.query_cache and not record["cached"]:
+                self.query_cache.put(question, table_name, columns, sql)
+        except QueryAborted as e:
+            record.update(status="killed", error=str(e))
+        except QUERY_ERRORS as e:
+            record.update(status="sql_error", error=str(e))
+        except Exception as e:  # one failing question must not lose the other results
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record["sql_seconds"] = time.perf_counter() - started
+        return record
+
+    async def run_async(self, questions, targets):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate, self.burst)
+        jobs = [self._run_one(semaphore, bucket, question, target) for target in targets for question in questions]
+        return await asyncio.gather(*jobs)
+
+    def run(self, questions, targets):
+        return asyncio.run(self.run_async(questions, targets))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a file of questions against every database, headless.")
+    parser.add_argument("questions", help="questions file: .txt (one per line), or .csv/.parquet with a 'question' column")
+    parser.add_argument("--root", default=".", help="directory scanned for .db files and .parquetdb directories")
+    parser.add_argument("--output", default="batch_results.parquet", help=".parquet or .csv")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum model calls in flight")
+    parser.add_argument("--rate", type=float, default=5.0, help="model calls per second")
+    parser.add_argument("--burst", type=float, default=None, help="token bucket capacity (defaults to --rate)")
+    parser.add_argument("--sql-workers", type=int, default=4, help="threads executing generated SQL")
+    parser.add_argument("--few-shot-k", type=int, default=DEFAULT_TOP_K, help="examples per prompt; 0 sends all")
+    parser.add_argument("--max-rows", type=int, default=10_000, help="rows materialized per query")
+    parser.add_argument("--query-timeout", type=float, default=30.0, help="seconds before a generated query is stopped")
+    parser.add_argument("--cache", metavar="PATH", help="reuse and fill a question -> SQL cache at PATH")
+    parser.add_argument("--result-cache", metavar="DIR", help="reuse results of identical SQL on unchanged databases")
+    parser.add_argument("--metrics", metavar="PATH", help="write per-stage latency histograms as Prometheus text")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub model instead of Gemini")
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="simulated stub model latency in seconds")
+    args = parser.parse_args()
+
+    if args.stub:
+        model = StubModel(latency=args.stub_latency)
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        model = get_model()
+
+    questions = load_questions(args.questions)
+    targets = discover_targets(args.root)
+    runner = BatchRunner(model, concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+                         sql_workers=args.sql_workers, top_k=args.few_shot_k, max_rows=args.max_rows,
+                         query_cache=QueryCache(args.cache) if args.cache else None,
+                         result_cache=ResultCache(args.result_cache) if args.result_cache else None,
+                         query_timeout=args.query_timeout)
+
+    started = time.perf_counter()
+    records = runner.run(questions, targets)
+    elapsed = time.perf_counter() - started
+    df = write_results(records, args.output)
+
+    summary = {
+        "questions": len(questions),
+        "targets": len(targets),
+        "runs": len(df),
+        "statuses": df["status"].value_counts().to_dict() if len(df) else {},
+        "seconds": round(elapsed, 3),
+        "runs_per_sec": round(len(df) / elapsed, 2) if elapsed > 0 else None,
+        "output": os.path.abspath(args.output),
+        "stages_ms": {
+            row["stage"]: {key[:-len("_seconds")]: round(row[key] * 1000, 2) for key in ("p50_seconds", "p95_seconds", "p99_seconds")}
+            for row in get_metrics().summary()
+        },
+    }
+    if args.metrics:
+        get_metrics().write_prometheus(args.metrics)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from backends import QUERY_ERRORS, chunk_writer, close_backend, database_path
+from connections import close_pool
+from llm import StubModel, get_gemini_response
+from metrics import get_metrics
+from prompting import EXAMPLES, generate_prompt
+from results import read_dataframe
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TABLE_NAME = "STUDENT"
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+CHUNK_ROWS = 500_000
+ANCHOR_DATE = np.datetime64("2024-06-30")
+
+# The STUDENT table from sql.py, widened with a date, a decimal and a second integer column so
+# that every example query shape has a column to bind to
+COLUMNS = ["NAME", "CLASS", "SECTION", "MARKS", "ENROLLED", "FEE", "CREDITS"]
+FIRST_NAMES = ["John", "Jane", "Alice", "Bob", "Charlie", "Diana", "Ethan", "Fiona", "George", "Hannah",
+               "Ian", "Jasmine", "Kevin", "Laura", "Mike", "Nina", "Oscar", "Paula", "Quincy", "Rachel"]
+LAST_NAMES = ["Doe", "Smith", "Johnson", "Brown", "Davis", "Miller", "Wilson", "Garcia", "Martinez", "Lee",
+              "Clark", "Lewis", "Young", "Hall", "Allen", "Scott", "Adams", "Baker", "Wright", "Harris"]
+
+# One concrete (question, SQL) pair per prompting.EXAMPLES entry, in the same order, bound to the
+# STUDENT columns. These are the "recorded" model answers replayed through the stub model.
+# Dates are compared as ISO text and relative to ANCHOR_DATE so that results are reproducible
+# and every query also runs on the columnar engine; scalar sub-queries return exactly one row,
+# which DuckDB requires and SQLite does not check.
+REPLAY = [
+    ("How many students are in the table?",
+     "SELECT COUNT(*) FROM STUDENT;"),
+    ("Show all students in section A.",
+     "SELECT * FROM STUDENT WHERE SECTION = 'A';"),
+    ("What is the average of the marks?",
+     "SELECT AVG(MARKS) FROM STUDENT;"),
+    ("List students in class 10 with marks above 80.",
+     "SELECT * FROM STUDENT WHERE CLASS = '10' AND MARKS > 80;"),
+    ("What is the total of marks in section B?",
+     "SELECT SUM(MARKS) FROM STUDENT WHERE SECTION = 'B';"),
+    ("Show the 10 students with the highest marks.",
+     "SELECT * FROM STUDENT ORDER BY MARKS DESC LIMIT 10;"),
+    ("What are the highest marks?",
+     "SELECT MAX(MARKS) FROM STUDENT;"),
+    ("How many students are in each class?",
+     "SELECT CLASS, COUNT(*) FROM STUDENT GROUP BY CLASS;"),
+    ("Show students with marks between 80 and 90.",
+     "SELECT * FROM STUDENT WHERE MARKS BETWEEN 80 AND 90;"),
+    ("Which classes are there?",
+     "SELECT DISTINCT CLASS FROM STUDENT;"),
+    ("List students in section A with marks above 85, by name descending.",
+     "SELECT * FROM STUDENT WHERE MARKS > 85 AND SECTION = 'A' ORDER BY NAME DESC;"),
+    ("Average marks and total fees per class for section A.",
+     "SELECT CLASS, AVG(MARKS) AS AvgMARKS, SUM(FEE) AS TotalFEE FROM STUDENT WHERE SECTION = 'A' GROUP BY CLASS;"),
+    ("Students in section B of class 10 or 11 with marks between 70 and 90.",
+     "SELECT * FROM STUDENT WHERE MARKS BETWEEN 70 AND 90 AND SECTION = 'B' AND CLASS IN ('10', '11');"),
+    ("The 3 classes with the best average marks, with their student counts.",
+     "SELECT CLASS, AVG(MARKS) AS AvgMARKS, COUNT(*) AS RecordCount FROM STUDENT GROUP BY CLASS "
+     "ORDER BY AvgMARKS DESC LIMIT 3;"),
+    ("Students with above-average marks paying less than 1000 in fees.",
+     "SELECT * FROM STUDENT WHERE MARKS > (SELECT AVG(MARKS) FROM STUDENT) AND FEE < 1000;"),
+    ("Students with a name that is not a Smith.",
+     "SELECT * FROM STUDENT WHERE NAME IS NOT NULL AND NAME NOT LIKE '%Smith%';"),
+    ("Class 12 students who are in section A or have marks under 60.",
+     "SELECT * FROM STUDENT WHERE CLASS = '12' AND (SECTION = 'A' OR MARKS < 60);"),
+    ("Count, average marks and highest fee in class 11.",
+     "SELECT COUNT(*), AVG(MARKS), MAX(FEE) FROM STUDENT WHERE CLASS = '11';"),
+    ("Students whose marks are within the range of marks per class.",
+     "SELECT * FROM STUDENT WHERE MARKS BETWEEN (SELECT MIN(low) FROM (SELECT MIN(MARKS) AS low FROM STUDENT "
+     "GROUP BY CLASS) AS class_low) AND (SELECT MAX(high) FROM (SELECT MAX(MARKS) AS high FROM STUDENT "
+     "GROUP BY CLASS) AS class_high);"),
+    ("How often does each section occur, most frequent first?",
+     "SELECT SECTION, COUNT(*) AS Frequency FROM STUDENT GROUP BY SECTION ORDER BY Frequency DESC;"),
+    ("Students with one of the top 5 marks, ordered by name.",
+     "SELECT * FROM STUDENT WHERE MARKS IN (SELECT MARKS FROM STUDENT ORDER BY MARKS DESC LIMIT 5) "
+     "AND NAME IS NOT NULL ORDER BY NAME;"),
+    ("Students whose fee is within the range of fees per section.",
+     "SELECT * FROM STUDENT WHERE FEE BETWEEN (SELECT MIN(low) FROM (SELECT MIN(FEE) AS low FROM STUDENT "
+     "GROUP BY SECTION) AS section_low) AND (SELECT MAX(high) FROM (SELECT MAX(FEE) AS high FROM STUDENT "
+     "GROUP BY SECTION) AS section_high);"),
+    ("Class 10 students who enrolled in the last 7 days.",
+     "SELECT * FROM STUDENT WHERE CLASS = '10' AND ENROLLED >= '2024-06-23';"),
+    ("Average marks, total fees and student count per section, for sections with more than 5 students.",
+     "SELECT SECTION, AVG(MARKS), SUM(FEE), COUNT(NAME) FROM STUDENT GROUP BY SECTION HAVING COUNT(NAME) > 5;"),
+    ("What is the fee per credit over all students?",
+     "SELECT ROUND(SUM(FEE) / SUM(CREDITS), 2) AS item_price FROM STUDENT;"),
+    ("Students enrolled in a month that has only one enrolment.",
+     "SELECT * FROM STUDENT WHERE SUBSTR(ENROLLED, 6, 2) IN (SELECT month FROM (SELECT SUBSTR(ENROLLED, 6, 2) AS month, "
+     "COUNT(*) AS record_count FROM STUDENT GROUP BY month) AS monthly_counts WHERE record_count = 1);"),
+    ("All students with the fee per credit.",
+     "SELECT *, ROUND(FEE / CREDITS, 2) AS Single_Unit_Price FROM STUDENT;"),
+    ("All students with their marks per credit.",
+     "SELECT *, ROUND(MARKS * 1.0 / CREDITS, 2) AS Calculated_Column FROM STUDENT;"),
+    ("All students with their marks increased by 10 percent.",
+     "SELECT *, ROUND(MARKS * 1.1, 2) AS Calculated_Column FROM STUDENT;"),
+    ("All students with their monthly fee.",
+     "SELECT *, ROUND(FEE / 12, 2) AS Monthly_Salary FROM STUDENT;"),
+    ("All students with their total fee over all credits.",
+     "SELECT *, ROUND(CREDITS * FEE, 2) AS Total_Price FROM STUDENT;"),
+]
+assert len(REPLAY) == len(EXAMPLES), "REPLAY must have one entry per prompting.EXAMPLES shape"
+
+# Metrics where a bigger number is better; for every other metric a bigger number is a regression
+HIGHER_IS_BETTER = ("rows_per_sec",)
+
+
+# Function to generate the synthetic STUDENT table in chunks; the same seed gives the same rows
+def iter_student_chunks(rows, seed=0, chunk_rows=CHUNK_ROWS):
+    rng = np.random.default_rng(seed)
+    names = np.array([f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES], dtype=object)
+    for start in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - start)
+        enrolled = ANCHOR_DATE - rng.integers(0, 730, size).astype("timedelta64[D]")
+        yield pd.DataFrame({
+            "NAME": rng.choice(names, size),
+            "CLASS": rng.choice(np.array(["10", "11", "12"], dtype=object), size),
+            "SECTION": rng.choice(np.array(["A", "B"], dtype=object), size),
+            "MARKS": rng.integers(35, 101, size),
+            "ENROLLED": np.datetime_as_string(enrolled, unit="D").astype(object),
+            "FEE": np.round(rng.uniform(500, 5000, size), 2),
+            "CREDITS": rng.integers(1, 7, size),
+        })
+
+
+# Function to report the peak resident set size of this process so far, in MB
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Function to load a synthetic table the way the app loads an upload: DataFrame chunks through
+# the engine's chunk writer (what app.create_database_from_df does for a whole DataFrame)
+def bench_ingest(db, rows, engine, seed):
+    started = time.perf_counter()
+    report = chunk_writer(engine)(iter_student_chunks(rows, seed), db, table_name=TABLE_NAME)
+    seconds = time.perf_counter() - started
+    return {"seconds": seconds, "rows_per_sec": rows / seconds if seconds > 0 else 0.0, "rows": report["rows"]}
+
+
+# Function to replay every example query shape: the prompt is built, the stub model returns the
+# recorded SQL and the SQL runs through results.read_dataframe, the path the app's
+# read_sql_query uses. Stage times come from the metrics spans of each run; the median of
+# `repeat` runs is reported per stage.
+def bench_queries(db, repeat, max_rows):
+    model = StubModel(responses=dict(REPLAY))
+    store = get_metrics()
+    records = []
+    for number, (question, _) in enumerate(REPLAY, start=1):
+        record = {"query": f"q{number:02d}", "question": question, "status": "ok", "error": None, "rows": None}
+        timings = {}
+        for _ in range(repeat):
+            store.reset()
+            started = time.perf_counter()
+            try:
+                prompt = generate_prompt(TABLE_NAME, COLUMNS, question=question, top_k=6)
+                sql = get_gemini_response(question, prompt, model=model)
+                df = read_dataframe(sql, db, max_rows=max_rows)
+            except QUERY_ERRORS as e:
+                record.update(status="error", error=str(e))
+                break
+            total = time.perf_counter() - started
+            record.update(sql=sql, rows=len(df))
+            stages = {row["stage"]: row["total_seconds"] for row in store.summary()}
+            for name, seconds in (("total", total), ("execute", stages.get("sql.execute", 0.0)),
+                                  ("materialize", stages.get("frame.build", 0.0)),
+                                  ("round", stages.get("frame.round", 0.0))):
+                timings.setdefault(name, []).append(seconds)
+        for name, values in timings.items():
+            record[f"{name}_ms"] = statistics.median(values) * 1000
+        records.append(record)
+    store.reset()
+    return records
+
+
+def run_benchmarks(sizes, engine="sqlite", repeat=3, max_rows=100_000, seed=0, workdir=None, keep=False):
+    created = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="nl2sql-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = {
+        "meta": {
+            "engine": engine, "repeat": repeat, "max_rows": max_rows, "seed": seed,
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": {},
+        "queries": [],
+    }
+    try:
+        for size in sizes:
+            db = database_path(os.path.join(workdir, f"student_{size}"), engine)
+            ingest_report = bench_ingest(db, SIZES[size], engine, seed)
+            results["metrics"][f"{size}/ingest.rows_per_sec"] = ingest_report["rows_per_sec"]
+            results["metrics"][f"{size}/ingest.seconds"] = ingest_report["seconds"]
+            print(f"[{size}] ingested {ingest_report['rows']:,} rows at {ingest_report['rows_per_sec']:,.0f} rows/sec",
+                  file=sys.stderr)
+
+            for record in bench_queries(db, repeat, max_rows):
+                record["size"] = size
+                results["queries"].append(record)
+                for key, value in record.items():
+                    if key.endswith("_ms"):
+                        results["metrics"][f"{size}/{record['query']}.{key}"] = value
+            results["metrics"][f"{size}/peak_rss_mb"] = peak_rss_mb()
+            print(f"[{size}] replayed {len(REPLAY)} queries, peak RSS {results['metrics'][f'{size}/peak_rss_mb']} MB",
+                  file=sys.stderr)
+
+            close_pool(db)
+            close_backend(db)
+            if not keep:
+                shutil.rmtree(db) if os.path.isdir(db) else os.remove(db)
+    finally:
+        if created and not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+# Function to list metrics that got worse than the baseline by more than `threshold` (a fraction),
+# and queries that ran in the baseline but fail now. Timings that moved by less than
+# `min_delta_ms` are ignored as noise.
+def find_regressions(results, baseline, threshold=0.2, min_delta_ms=1.0):
+    regressions = []
+    status = {(record["size"], record["query"]): record for record in results["queries"]}
+    for record in baseline.get("queries", []):
+        current = status.get((record["size"], record["query"]))
+        if record["status"] == "ok" and current is not None and current["status"] != "ok":
+            regressions.append({"metric": f"{record['size']}/{record['query']}.status", "baseline": "ok",
+                                "current": current["status"], "change": None, "error": current["error"]})
+    for key, before in baseline["metrics"].items():
+        after = results["metrics"].get(key)
+        if before is None or after is None:
+            continue
+        if key.endswith(HIGHER_IS_BETTER):
+            worse = after < before * (1 - threshold)
+        else:
+            worse = after > before * (1 + threshold)
+            if key.endswith("_ms") and after - before < min_delta_ms:
+                worse = False
+        if worse:
+            regressions.append({"metric": key, "baseline": before, "current": after,
+                                "change": (after - before) / before if before else None})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and the example query shapes on synthetic data.")
+    parser.add_argument("--sizes", default="10k,1m,10m", help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--engine", choices=("sqlite", "duckdb"), default="sqlite")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per query; the median is reported")
+    parser.add_argument("--max-rows", type=int, default=100_000, help="rows materialized per query, as in the app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown as a fraction, e.g. 0.2")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore timing changes smaller than this")
+    parser.add_argument("--workdir", help="directory for the benchmark databases (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark databases")
+    args = parser.parse_args()
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    results = run_benchmarks(sizes, engine=args.engine, repeat=args.repeat, max_rows=args.max_rows,
+                             seed=args.seed, workdir=args.workdir, keep=args.keep)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        results["regressions"] = find_regressions(results, baseline, args.threshold, args.min_delta_ms)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    failed = [record for record in results["queries"] if record["status"] != "ok"]
+    for record in failed:
+        print(f"[{record['size']}] {record['query']} failed: {record['error']}", file=sys.stderr)
+    for regression in results.get("regressions", []):
+        if regression["change"] is None and isinstance(regression["current"], str):
+            print(f"REGRESSION {regression['metric']}: now fails with {regression['error']}", file=sys.stderr)
+        else:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']:.3f} -> {regression['current']:.3f}",
+                  file=sys.stderr)
+    print(json.dumps({"output": os.path.abspath(args.output), "metrics": len(results["metrics"]),
+                      "failed_queries": len(failed), "regressions": len(results.get("regressions", []))}))
+    if results.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
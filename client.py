@@ -0,0 +1,157 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import requests
+
+from query_guard import QueryAborted, QueryError, QueryGuard, QueryJob, QueryLimits
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+# Function to raise the error an engine response carries, as the same exception types the
+# in-process Engine raises
+def raise_for_error(response):
+    if response.ok:
+        return
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = {"error": response.text or response.reason}
+    if response.status_code == 409 and "reason" in payload:
+        raise QueryAborted(payload["reason"], payload.get("seconds", 0.0))
+    if response.status_code == 404:
+        raise KeyError(payload["error"])
+    if response.status_code == 400:
+        raise ValueError(payload["error"])
+    raise QueryError(payload["error"])
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+# Function to rebuild the page dict of an engine page sent as an Arrow IPC stream
+def page_from_arrow(body):
+    table = pa.ipc.open_stream(body).read_all()
+    page = json.loads(table.schema.metadata[b"page"])
+    page["table"] = table.replace_schema_metadata(None)
+    return page
+
+
+# Talks to an api.py server with the same methods as engine.Engine, so the Streamlit app can use
+# either. Databases are addressed by display name; the server resolves them to paths. Pages are
+# fetched on a local thread and returned as QueryJobs; cancelling one cancels the remote query.
+class EngineClient:
+    def __init__(self, base_url, timeout=None, workers=4):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="engine-client")
+        self._jobs = {}  # query id -> QueryJob of the page last asked for
+        self._query_timeout = None
+        self._lock = threading.Lock()
+
+    def _request(self, method, path, **kwargs):
+        response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        raise_for_error(response)
+        return response
+
+    @property
+    def query_timeout(self):
+        if self._query_timeout is None:
+            self._query_timeout = self.stats()["query_timeout"]
+        return self._query_timeout
+
+    def databases(self):
+        return {name: name for name in self._request("GET", "/api/databases").json()["databases"]}
+
+    def table_names(self, db):
+        return self._request("GET", "/api/tables", params={"database": db}).json()["tables"]
+
+    def column_names(self, table_name, db):
+        return self._request("GET", "/api/columns", params={"database": db, "table": table_name}).json()["columns"]
+
+    def delete_database(self, db):
+        self._request("DELETE", "/api/databases", params={"database": db})
+
+    # Function to upload a file to the server; the body is streamed, not read into memory first.
+    # Row progress is only known to the server, so `progress` is not called.
+    def ingest(self, source, filename, engine="sqlite", size=None, progress=None, mode="replace", key=None):
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                return self.ingest(f, filename, engine=engine, size=size, mode=mode, key=key)
+        params = {"filename": filename, "engine": engine, "mode": mode}
+        if key:
+            params["key"] = key
+        chunks = iter(lambda: source.read(UPLOAD_CHUNK_BYTES), b"")
+        return self._request("POST", "/api/upload", params=params, data=chunks).json()
+
+    # Function to ask a question; with on_text the model response is streamed back as NDJSON
+    def ask(self, question, db, table_name, columns=None, on_text=None, page_size=None):
+        body = {"question": question, "database": db, "table": table_name, "columns": columns,
+                "stream": on_text is not None}
+        if page_size is not None:
+            body["page_size"] = page_size
+        if on_text is None:
+            return self._request("POST", "/api/ask", json=body).json()
+
+        with self._request("POST", "/api/ask", json=body, stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "text" in event:
+                    on_text(event["text"])
+                elif "result" in event:
+                    return event["result"]
+                else:
+                    raise QueryError(event["error"])
+        raise QueryError("The engine closed the response before sending a result.")
+
+    def open_query(self, sql, db, page_size=None, prefetch=True):
+        body = {"database": db, "sql": sql}
+        if page_size is not None:
+            body["page_size"] = page_size
+        return self._request("POST", "/api/queries", json=body).json()["query_id"]
+
+    # Function to fetch a page on a local thread. As with Engine.submit_page, asking again for the
+    # page being fetched returns the same job and asking for another page stops the previous one.
+    def submit_page(self, query_id, page, page_size=None):
+        key = (query_id, page, page_size)
+        with self._lock:
+            job = self._jobs.get(query_id)
+            if job is not None and job.key == key and not (job.done() and job.future.exception() is not None):
+                return job
+            if job is not None:
+                job.cancel()
+            # The server enforces the limits; the local guard only forwards a cancel
+            guard = QueryGuard(QueryLimits(timeout=None, max_rows=None, temp_store_mb=None))
+            guard.on_interrupt(lambda: self.cancel(query_id))
+            params = {"page_size": page_size} if page_size else {}
+            future = self._executor.submit(self._fetch_page, query_id, page, params)
+            job = self._jobs[query_id] = QueryJob(future, guard, None, None, key)
+            return job
+
+    def _fetch_page(self, query_id, page, params):
+        response = self._request("GET", f"/api/queries/{query_id}/pages/{page}", params=params,
+                                 headers={"Accept": ARROW_STREAM})
+        return page_from_arrow(response.content)
+
+    def fetch_page(self, query_id, page, page_size=None):
+        return self.submit_page(query_id, page, page_size).result()
+
+    def cancel(self, query_id):
+        self._request("DELETE", f"/api/queries/{query_id}")
+
+    def close_query(self, query_id):
+        with self._lock:
+            self._jobs.pop(query_id, None)
+        self.cancel(query_id)
+
+    def advise(self, query_id, table_name, columns=None):
+        body = {"query_id": query_id, "table": table_name, "columns": columns}
+        return self._request("POST", "/api/advise", json=body).json()["advice"]
+
+    def stats(self):
+        return self._request("GET", "/api/stats").json()
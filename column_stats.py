@@ -0,0 +1,360 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from connections import quote_identifier
+
+# Statistics gathered while a table is loaded, so that simple aggregates can be answered and
+# value domains described to the model without scanning the table. On SQLite they are kept in
+# bookkeeping tables of the same file (the "_nl2sql_" prefix hides them from the table listing)
+# and triggers on the table mark them stale on any write that bypasses ingest; a columnar table
+# keeps them in a JSON file next to its Parquet parts, which are only ever replaced together.
+TABLE_STATS = "_nl2sql_table_stats"
+COLUMN_STATS = "_nl2sql_column_stats"
+STALE_TRIGGER_PREFIX = "_nl2sql_stale_"
+STATS_FILE = "_nl2sql_stats.json"
+
+HLL_PRECISION = 12  # 4096 one-byte registers per column, about 1.6% error on distinct counts
+EXACT_VALUES_LIMIT = 1000  # value frequencies are counted exactly up to this many distinct values
+TOP_VALUES = 10  # most frequent values kept for columns with more distinct values than that
+
+_EVENTS = ("insert", "update", "delete")
+
+
+# Function to reduce a chunk column to its non-null values as SQLite stores them, plus their
+# kind: "integer", "real", "text", "mixed" (anything else, or no single kind), or None (all null)
+def _stored_values(series):
+    values = series.dropna()
+    if values.empty:
+        return values, None
+    if pd.api.types.is_bool_dtype(values):
+        return values.astype("int64"), "integer"
+    if pd.api.types.is_integer_dtype(values):
+        return values, "integer"
+    if pd.api.types.is_float_dtype(values):
+        return values, "real"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.strftime("%Y-%m-%d %H:%M:%S"), "text"
+    inferred = pd.api.types.infer_dtype(values, skipna=False)
+    if inferred == "boolean":
+        return values.astype("int64"), "integer"
+    kind = {"string": "text", "integer": "integer", "floating": "real"}.get(inferred)
+    if kind is None:
+        return values.map(str), "mixed"  # only described to the model, never used for answers
+    return values, kind
+
+
+def _python_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# Function to fold 64-bit hashes into HyperLogLog registers: the leading bits pick a register,
+# which keeps the highest position of the first set bit among the remaining bits
+def _hll_add(registers, hashes):
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.intp)
+    rest = (hashes << np.uint64(HLL_PRECISION)) | np.uint64(1 << (HLL_PRECISION - 1))
+    _, exponent = np.frexp(rest.astype(np.float64))
+    np.maximum.at(registers, index, (65 - exponent).astype(np.uint8))
+
+
+def _hll_estimate(registers):
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum()
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)  # linear counting is more accurate for small counts
+    return int(round(estimate))
+
+
+# Accumulates a table's statistics one DataFrame chunk at a time, in memory that does not grow
+# with the table: min/max and null counts per column, a HyperLogLog sketch for distinct counts,
+# and value frequencies, exact while a column has at most EXACT_VALUES_LIMIT distinct values
+# and afterwards only the most frequent values (approximate counts).
+class StatsBuilder:
+    def __init__(self):
+        self.rows = 0
+        self.columns = None
+
+    def add(self, chunk):
+        if self.columns is None:
+            self.columns = [
+                {"name": str(name), "kind": None, "nulls": 0, "min": None, "max": None, "exact": True,
+                 "values": Counter(), "registers": np.zeros(1 << HLL_PRECISION, dtype=np.uint8)}
+                for name in chunk.columns
+            ]
+        self.rows += len(chunk)
+        for position, column in enumerate(self.columns):
+            series = chunk.iloc[:, position]
+            values, kind = _stored_values(series)
+            column["nulls"] += len(series) - len(values)
+            if kind is None:
+                continue
+            column["kind"] = kind if column["kind"] in (None, kind) else "mixed"
+            if column["kind"] != "mixed":
+                low, high = _python_value(values.min()), _python_value(values.max())
+                column["min"] = low if column["min"] is None else min(column["min"], low)
+                column["max"] = high if column["max"] is None else max(column["max"], high)
+            counts = values.value_counts()
+            # Repeats never change a HyperLogLog sketch, so only the chunk's distinct values are hashed
+            _hll_add(column["registers"], pd.util.hash_pandas_object(counts.index).to_numpy())
+            if len(counts) > EXACT_VALUES_LIMIT:
+                column["exact"] = False
+                counts = counts.head(EXACT_VALUES_LIMIT)
+            column["values"].update(dict(zip(counts.index.tolist(), counts.tolist())))
+            if len(column["values"]) > EXACT_VALUES_LIMIT:
+                column["exact"] = False
+                column["values"] = Counter(dict(column["values"].most_common(EXACT_VALUES_LIMIT)))
+
+    # Function to return the statistics as a plain dict (see read_stats for its shape)
+    def result(self):
+        columns = []
+        for column in self.columns or ():
+            exact = column["exact"] and column["kind"] != "mixed"
+            values = column["values"].most_common(None if exact else TOP_VALUES)
+            columns.append({
+                "name": column["name"],
+                "kind": column["kind"],
+                "nulls": column["nulls"],
+                "min": column["min"] if column["kind"] != "mixed" else None,
+                "max": column["max"] if column["kind"] != "mixed" else None,
+                "distinct": len(values) if exact else max(_hll_estimate(column["registers"]), len(values)),
+                "exact": exact,
+                "values": [list(pair) for pair in values],
+            })
+        return {"rows": self.rows, "stale": False, "columns": columns}
+
+
+def _ensure_stats_tables(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE_STATS} (table_name TEXT PRIMARY KEY, rows INTEGER NOT NULL, "
+        "stale INTEGER NOT NULL, built_at REAL NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {COLUMN_STATS} (table_name TEXT NOT NULL, position INTEGER NOT NULL, "
+        "column_name TEXT NOT NULL, kind TEXT, nulls INTEGER NOT NULL, min_value, max_value, "
+        "distinct_count INTEGER NOT NULL, exact INTEGER NOT NULL, top_values TEXT NOT NULL, "
+        "PRIMARY KEY (table_name, position))"
+    )
+
+
+# Function to store a table's statistics in its database, inside the caller's transaction.
+# Every write to the table afterwards, other than through ingest, flags them stale.
+def save_stats(conn, table_name, stats):
+    _ensure_stats_tables(conn)
+    conn.execute(f"INSERT OR REPLACE INTO {TABLE_STATS} VALUES (?, ?, 0, ?)", (table_name, stats["rows"], time.time()))
+    conn.execute(f"DELETE FROM {COLUMN_STATS} WHERE table_name = ?", (table_name,))
+    conn.executemany(
+        f"INSERT INTO {COLUMN_STATS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (table_name, position, column["name"], column["kind"], column["nulls"], column["min"], column["max"],
+             column["distinct"], int(column["exact"]), json.dumps(column["values"]))
+            for position, column in enumerate(stats["columns"])
+        ],
+    )
+    create_stale_triggers(conn, table_name)
+
+
+def create_stale_triggers(conn, table_name):
+    literal = "'" + table_name.replace("'", "''") + "'"
+    for event in _EVENTS:
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {quote_identifier(STALE_TRIGGER_PREFIX + event + '_' + table_name)} "
+            f"AFTER {event.upper()} ON {quote_identifier(table_name)} "
+            f"BEGIN UPDATE {TABLE_STATS} SET stale = 1 WHERE table_name = {literal} AND stale = 0; END"
+        )
+
+
+# Function to copy a table's statistics from an attached database, e.g. a scratch part
+def copy_stats(conn, table_name, source):
+    _ensure_stats_tables(conn)
+    for name in (TABLE_STATS, COLUMN_STATS):
+        conn.execute(f"DELETE FROM main.{name} WHERE table_name = ?", (table_name,))
+        conn.execute(f"INSERT INTO main.{name} SELECT * FROM {source}.{name} WHERE table_name = ?", (table_name,))
+    create_stale_triggers(conn, table_name)
+
+
+# Function to read a table's statistics, or None when it has none:
+# {"rows", "stale", "columns": [{"name", "kind", "nulls", "min", "max", "distinct", "exact",
+# "values": [[value, count], ...] most frequent first, every value when exact}]}.
+# Statistics are stale once the table was written to outside ingest, or dropped and recreated.
+def read_stats(conn, table_name):
+    try:
+        row = conn.execute(f"SELECT table_name, rows, stale FROM {TABLE_STATS} WHERE table_name = ? COLLATE NOCASE",
+                           (table_name,)).fetchone()
+    except sqlite3.OperationalError:  # no statistics in this database
+        return None
+    if row is None:
+        return None
+    table_name, rows, stale = row
+    triggers = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name IN (?, ?, ?)",
+        (table_name, *(STALE_TRIGGER_PREFIX + event + "_" + table_name for event in _EVENTS)),
+    ).fetchone()[0]
+    columns = [
+        {"name": name, "kind": kind, "nulls": nulls, "min": low, "max": high, "distinct": distinct,
+         "exact": bool(exact), "values": json.loads(values)}
+        for name, kind, nulls, low, high, distinct, exact, values in conn.execute(
+            f"SELECT column_name, kind, nulls, min_value, max_value, distinct_count, exact, top_values "
+            f"FROM {COLUMN_STATS} WHERE table_name = ? ORDER BY position", (table_name,)
+        )
+    ]
+    return {"rows": rows, "stale": bool(stale) or triggers < len(_EVENTS), "columns": columns}
+
+
+def save_stats_file(directory, stats):
+    with open(os.path.join(directory, STATS_FILE), "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+
+
+def read_stats_file(directory):
+    try:
+        with open(os.path.join(directory, STATS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+_IDENTIFIER = r'(?:"(?:[^"]|"")+"|\w+)'
+_SELECT = re.compile(
+    rf"^select\s+(?P<items>.+?)\s+from\s+(?P<table>{_IDENTIFIER})"
+    rf"(?:\s+group\s+by\s+(?P<group>{_IDENTIFIER}))?"
+    rf"(?:\s+order\s+by\s+(?P<order>.+?)(?:\s+(?P<direction>asc|desc))?)?"
+    rf"(?:\s+limit\s+(?P<limit>\d+))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+_AGGREGATE = re.compile(
+    rf"^(?P<expression>(?P<function>count|min|max)\s*\(\s*(?P<argument>\*|(?:distinct\s+)?{_IDENTIFIER})\s*\))"
+    rf"(?:\s+as\s+(?P<alias>{_IDENTIFIER}))?$",
+    re.IGNORECASE,
+)
+_COLUMN = re.compile(rf"^{_IDENTIFIER}$")
+
+
+def _unquote(identifier):
+    return identifier[1:-1].replace('""', '"') if identifier.startswith('"') else identifier
+
+
+# Function to recognise the aggregate shapes the catalog can answer: a list of COUNT(*),
+# COUNT(col), COUNT(DISTINCT col), MIN(col) and MAX(col) over a whole table, or
+# "SELECT col, COUNT(*) ... GROUP BY col" with an optional ORDER BY and LIMIT. Returns the
+# parsed query as a dict with its "table", or None for anything else.
+def parse_aggregate(sql):
+    match = _SELECT.match(sql.strip().rstrip(";").strip())
+    if match is None:
+        return None
+    items = []
+    for text in (item.strip() for item in match["items"].split(",")):
+        aggregate = _AGGREGATE.match(text)
+        if aggregate is not None:
+            argument = aggregate["argument"]
+            distinct = argument.lower().startswith("distinct")
+            if distinct:
+                argument = argument[len("distinct"):].strip()
+            items.append({
+                "function": aggregate["function"].lower(),
+                "column": None if argument == "*" else _unquote(argument),
+                "distinct": distinct,
+                "name": _unquote(aggregate["alias"]) if aggregate["alias"] else aggregate["expression"],
+                "text": aggregate["expression"],
+            })
+        elif _COLUMN.match(text):
+            items.append({"function": None, "column": _unquote(text), "distinct": False, "name": None, "text": text})
+        else:
+            return None
+    return {
+        "table": _unquote(match["table"]),
+        "items": items,
+        "group": _unquote(match["group"]) if match["group"] else None,
+        "order": match["order"].strip() if match["order"] else None,
+        "descending": (match["direction"] or "").lower() == "desc",
+        "limit": int(match["limit"]) if match["limit"] is not None else None,
+    }
+
+
+def _aggregate_value(item, stats, column):
+    if item["column"] is None:
+        return stats["rows"] if item["function"] == "count" else _UNANSWERED
+    if item["function"] == "count":
+        if item["distinct"]:
+            return column["distinct"] if column["exact"] else _UNANSWERED
+        return stats["rows"] - column["nulls"]
+    if column["kind"] == "mixed":
+        return _UNANSWERED
+    return column["min"] if item["function"] == "min" else column["max"]
+
+
+_UNANSWERED = object()
+
+
+# Function to answer a parsed aggregate (see parse_aggregate) from a table's statistics.
+# Returns (column names, list of column values) named as SQLite would name them, or None when
+# the statistics are stale or too approximate to give the exact answer.
+def answer(query, stats):
+    if stats is None or stats["stale"]:
+        return None
+    columns = {column["name"].lower(): column for column in stats["columns"]}
+    items = query["items"]
+    for item in items:
+        if item["column"] is not None and item["column"].lower() not in columns:
+            return None
+        if item["function"] is None:
+            item["name"] = columns[item["column"].lower()]["name"]  # SQLite reports the declared name
+
+    if query["group"] is None:
+        if query["order"] is not None or any(item["function"] is None for item in items):
+            return None
+        row = [_aggregate_value(item, stats, columns.get((item["column"] or "").lower())) for item in items]
+        if any(value is _UNANSWERED for value in row):
+            return None
+        rows = [row][:query["limit"]]
+    else:
+        group = columns.get(query["group"].lower())
+        kinds = sorted((item["function"] or "", item["column"] is None) for item in items)
+        if group is None or kinds != [("", False), ("count", True)] or not group["exact"] or group["kind"] == "mixed" \
+                or any(item["function"] is None and item["column"].lower() != query["group"].lower() for item in items):
+            return None
+        groups = [tuple(pair) for pair in group["values"]]
+        if group["nulls"]:
+            groups.append((None, group["nulls"]))
+        count_item = next(item for item in items if item["function"] == "count")
+        order = query["order"]
+        if order is None or _unquote(order).lower() == query["group"].lower():
+            groups.sort(key=lambda pair: (pair[0] is not None, pair[0]), reverse=query["descending"])
+        elif order.lower() in (count_item["text"].lower(), count_item["name"].lower()):
+            groups.sort(key=lambda pair: (pair[1], pair[0] is not None, pair[0]), reverse=query["descending"])
+        else:
+            return None
+        rows = [[value if item["function"] is None else count for item in items] for value, count in groups]
+        rows = rows[:query["limit"]]
+    return [item["name"] for item in items], [[row[position] for row in rows] for position in range(len(items))]
+
+
+def _short(value, width=40):
+    text = repr(value)
+    return text if len(text) <= width else text[:width - 4] + "...'"
+
+
+# Function to describe a table's statistics in a few lines for the prompt, so the model sees the
+# real value domains: ranges of numeric and date columns and the common values of text columns
+def describe_stats(stats, max_values=5):
+    lines = [f"The table has {stats['rows']:,} rows{' (approximately)' if stats['stale'] else ''}."]
+    for column in stats["columns"]:
+        if column["kind"] is None:
+            lines.append(f"- {column['name']}: always empty")
+            continue
+        parts = [f"{'' if column['exact'] else '~'}{column['distinct']:,} distinct"]
+        if column["min"] is not None and (column["kind"] != "text" or column["distinct"] > max_values):
+            parts.append(f"from {_short(column['min'])} to {_short(column['max'])}")
+        if column["kind"] in ("text", "mixed") and column["values"]:
+            parts.append("e.g. " + ", ".join(_short(value) for value, _ in column["values"][:max_values]))
+        if column["nulls"]:
+            parts.append(f"{column['nulls']:,} empty")
+        lines.append(f"- {column['name']} ({column['kind']}): " + "; ".join(parts))
+    return "\n".join(lines)
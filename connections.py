@@ -0,0 +1,197 @@
+import os
+import pathlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# Function to open a read-only connection to a database file
+def connect_read_only(db, check_same_thread=True):
+    return sqlite3.connect(
+        pathlib.Path(db).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=check_same_thread
+    )
+
+
+def _file_id(db):
+    stat = os.stat(db)
+    return (stat.st_dev, stat.st_ino)
+
+
+# Function to fingerprint a database file's identity and content without opening it.
+# Any committed write changes the mtime/size of the file or of its -wal file.
+def file_fingerprint(db):
+    stat = os.stat(db)
+    try:
+        wal = os.stat(db + "-wal")
+        wal_fingerprint = (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        wal_fingerprint = None
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size, wal_fingerprint)
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# A small pool of read-only connections to one database file. Connections are created with
+# check_same_thread=False so they can be handed to whichever Streamlit script thread asks next;
+# a connection is only ever used by the thread that checked it out. If the file is replaced
+# (deleted and re-uploaded) the idle connections point at the old inode and are discarded.
+class ConnectionPool:
+    def __init__(self, db, max_idle=4):
+        self.db = db
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._file_id = None
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _acquire(self):
+        file_id = _file_id(self.db)
+        with self._lock:
+            if file_id != self._file_id:
+                self._close_idle()
+                self._file_id = file_id
+            if self._idle:
+                return self._idle.pop()
+        return connect_read_only(self.db, check_same_thread=False)
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _close_idle(self):
+        for conn in self._idle:
+            conn.close()
+        self._idle = []
+
+    def close(self):
+        with self._lock:
+            self._close_idle()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Function to get the shared connection pool for a database file
+def get_pool(db):
+    key = os.path.abspath(db)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db)
+        return pool
+
+
+# Function to close pooled connections, e.g. before the file is deleted (required on Windows)
+def close_pool(db):
+    with _pools_lock:
+        pool = _pools.pop(os.path.abspath(db), None)
+    if pool is not None:
+        pool.close()
+
+
+def _backend(db):
+    from backends import get_backend  # backends builds on this module
+
+    return get_backend(db)
+
+
+# Cache of database listings and table/column names shared by every session.
+# A database entry is reused while the file's identity, mtime and size are unchanged; when
+# they move, the backend's schema version (for SQLite, PRAGMA schema_version: a cookie in the
+# file header, bumped on every schema change and visible to all connections) decides whether
+# the cached names are still valid.
+class SchemaCatalog:
+    def __init__(self):
+        self._entries = {}
+        self._listings = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, db):
+        key = os.path.abspath(db)
+        fingerprint = file_fingerprint(db)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                self.hits += 1
+                return entry
+
+        schema_version = _backend(db).schema_version()
+
+        with self._lock:
+            if (entry is not None and entry["fingerprint"][:2] == fingerprint[:2]
+                    and entry["schema_version"] == schema_version):
+                entry["fingerprint"] = fingerprint
+                self.hits += 1
+                return entry
+            self.misses += 1
+            entry = {"fingerprint": fingerprint, "schema_version": schema_version, "tables": None, "columns": {},
+                     "stats": {}}
+            self._entries[key] = entry
+            return entry
+
+    # Function to list the .db files in a directory, cached until the directory changes
+    def databases(self, root_dir):
+        mtime = os.stat(root_dir).st_mtime_ns
+        with self._lock:
+            listing = self._listings.get(root_dir)
+            if listing is not None and listing[0] == mtime:
+                return dict(listing[1])
+        from backends import COLUMNAR_SUFFIX
+
+        databases = {}
+        for file in sorted(os.listdir(root_dir)):
+            if file.endswith(".db"):
+                databases[os.path.splitext(file)[0]] = os.path.join(root_dir, file)
+            elif file.endswith(COLUMNAR_SUFFIX) and os.path.isdir(os.path.join(root_dir, file)):
+                databases[file[:-len(COLUMNAR_SUFFIX)] + " [columnar]"] = os.path.join(root_dir, file)
+        with self._lock:
+            self._listings[root_dir] = (mtime, databases)
+        return dict(databases)
+
+    def table_names(self, db):
+        entry = self._entry(db)
+        if entry["tables"] is None:
+            entry["tables"] = _backend(db).table_names()
+        return list(entry["tables"])
+
+    def column_names(self, table_name, db):
+        entry = self._entry(db)
+        columns = entry["columns"].get(table_name)
+        if columns is None:
+            columns = entry["columns"][table_name] = _backend(db).column_names(table_name)
+        return list(columns)
+
+    # Function to get a table's column statistics (see column_stats); unlike names, they are
+    # re-read after any write to the database
+    def table_stats(self, table_name, db):
+        entry = self._entry(db)
+        cached = entry["stats"].get(table_name)
+        if cached is None or cached[0] != entry["fingerprint"]:
+            cached = entry["stats"][table_name] = (entry["fingerprint"], _backend(db).table_stats(table_name))
+        return cached[1]
+
+    def invalidate(self, db=None):
+        with self._lock:
+            if db is None:
+                self._entries.clear()
+                self._listings.clear()
+            else:
+                self._entries.pop(os.path.abspath(db), None)
+                self._listings.clear()
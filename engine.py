@@ -0,0 +1,314 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+
+import ingest
+from backends import QUERY_ERRORS, chunk_writer, close_backend, database_path, is_columnar
+from connections import SchemaCatalog, close_pool
+from index_advisor import IndexAdvisor
+from intents import IntentCounter, match_question
+from llm import StubModel, get_gemini_response, stream_gemini_response
+from metrics import span
+from prompting import DEFAULT_TOP_K, generate_prompt
+from query_cache import QueryCache
+from query_guard import QueryLimits, QueryWatchdog
+from result_cache import ResultCache
+from results import DEFAULT_PAGE_SIZE, ResultWindow, clean_sql, is_single_select, validate_sql
+from sql_stream import SqlStream
+
+# Hard cap on the rows a single query may page through
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "100000"))
+
+# Limits for generated SQL: seconds before a query is stopped, and the memory temporary
+# b-trees may use before spilling to disk
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
+QUERY_TEMP_STORE_MB = int(os.getenv("QUERY_TEMP_STORE_MB", "256"))
+
+# Memory budget for cached query results before they spill to disk
+RESULT_CACHE_MEMORY_MB = int(os.getenv("RESULT_CACHE_MEMORY_MB", "256"))
+
+# Index advisor mode: auto, recommend or off
+INDEX_ADVISOR_MODE = os.getenv("INDEX_ADVISOR", "auto").lower()
+
+# USE_STUB_MODEL=1 swaps Gemini for the offline stub model, e.g. to try the app without a key
+USE_STUB_MODEL = os.getenv("USE_STUB_MODEL", "0") == "1"
+
+# Number of few-shot examples sent with each question; 0 sends all of them
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", str(DEFAULT_TOP_K)))
+
+# Key that signs query ids. Engine processes that should reopen each other's queries (e.g. the
+# forked api.py processes) share it; by default every engine makes up its own.
+ENGINE_SECRET = os.getenv("ENGINE_SECRET")
+
+XLSX_PARALLEL_MIN_BYTES = 20 * 1024 * 1024  # below this, worker start-up costs more than it saves
+
+
+# Function to create a database from a DataFrame; a ".parquetdb" name selects the columnar engine
+def create_database_from_df(df, db_name):
+    writer = chunk_writer("duckdb" if is_columnar(db_name) else "sqlite")
+    return writer(ingest.iter_frame_chunks(df), db_name)
+
+
+# Function to build a query id that any engine process sharing `secret` can reopen: it carries
+# the database and the SQL, whether the engine generated the SQL itself (ask) rather than being
+# handed it, and a nonce so that two users running the same SQL never share (or cancel) a query.
+# The id is signed, so clients cannot make up ids for SQL the engine never opened.
+def make_query_id(db, sql, secret, generated=False):
+    payload = [db, sql, uuid.uuid4().hex[:8], generated]
+    tag = hmac.new(secret, json.dumps(payload).encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+    raw = json.dumps(payload + [tag])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# Function to read (db, sql, generated) back from a query id; KeyError for ids this engine (or
+# one sharing its secret) did not make
+def parse_query_id(query_id, secret):
+    try:
+        padded = query_id + "=" * (-len(query_id) % 4)
+        *payload, tag = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        expected = hmac.new(secret, json.dumps(payload).encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+        valid = len(payload) == 4 and hmac.compare_digest(str(tag), expected)
+    except (ValueError, TypeError, UnicodeError):
+        valid = False
+    if not valid:
+        raise KeyError(f"Unknown query: {query_id}")
+    db, sql, _, generated = payload
+    return db, sql, generated
+
+
+# The application core, independent of any UI: database listing and ingestion, prompt building
+# and model calls, and paged SQL execution under the query watchdog. One Engine is shared by
+# every session of a process (Streamlit sessions, or all requests of an api.py process), so the
+# question -> SQL cache, the result cache, the schema catalog and the connection pools are too.
+# Open queries are kept in a bounded LRU; a query id not found there (evicted, or opened by
+# another process) is reopened from the id itself.
+class Engine:
+    def __init__(self, root_dir=".", sql_workers=4, max_open_queries=256, secret=None):
+        self.root_dir = root_dir
+        self.secret = (secret or ENGINE_SECRET or secrets.token_hex(16)).encode("utf-8")
+        self.query_timeout = QUERY_TIMEOUT_SECONDS
+        self.max_open_queries = max_open_queries
+        self.query_cache = QueryCache()
+        self.intents = IntentCounter()
+        self.result_cache = ResultCache(memory_budget=RESULT_CACHE_MEMORY_MB * 1024 * 1024)
+        self.catalog = SchemaCatalog()
+        self.index_advisor = None if INDEX_ADVISOR_MODE == "off" else IndexAdvisor(auto=INDEX_ADVISOR_MODE == "auto")
+        self.watchdog = QueryWatchdog(
+            QueryLimits(timeout=QUERY_TIMEOUT_SECONDS, max_rows=MAX_RESULT_ROWS, temp_store_mb=QUERY_TEMP_STORE_MB),
+            workers=sql_workers,
+        )
+        self.model = StubModel(latency=0.5, token_latency=0.05) if USE_STUB_MODEL else None
+        self._queries = OrderedDict()  # query id -> {"window": ResultWindow, "job": QueryJob or None}
+        self._lock = threading.Lock()
+
+    # Function to list databases as {display name: path}
+    def databases(self):
+        return self.catalog.databases(self.root_dir)
+
+    def table_names(self, db):
+        return self.catalog.table_names(db)
+
+    def column_names(self, table_name, db):
+        return self.catalog.column_names(table_name, db)
+
+    def table_stats(self, table_name, db):
+        return self.catalog.table_stats(table_name, db)
+
+    def delete_database(self, db):
+        close_pool(db)  # Pooled connections would keep the file open
+        close_backend(db)
+        if os.path.isdir(db):
+            shutil.rmtree(db)  # Columnar databases are directories of Parquet files
+        else:
+            os.remove(db)
+        self.catalog.invalidate(db)
+
+    # Function to load an uploaded CSV or XLSX file (path or file-like object) into the database
+    # named after the file, then profile the tables for the index advisor. mode="replace"
+    # rewrites each table; mode="upsert" writes only rows that are new or changed since the last
+    # upload of the file, matched by position or on the `key` column (see ingest.upsert_chunks).
+    def ingest(self, source, filename, engine="sqlite", size=None, progress=None, mode="replace", key=None):
+        name = os.path.basename(filename).split(".")[0]
+        if not name:
+            raise ValueError(f"Cannot name a database after '{filename}'.")
+        db = database_path(os.path.join(self.root_dir, name), engine)
+        writer = chunk_writer(engine, mode, key)
+        with span("ingest.total", engine=engine, mode=mode):
+            if filename.endswith(".xlsx"):
+                # Stream every sheet into its own table; parse large workbooks in parallel processes
+                workers = (os.cpu_count() or 1) if (size or 0) >= XLSX_PARALLEL_MIN_BYTES else 1
+                report = ingest.ingest_xlsx(source, db, workers=workers, progress=progress, writer=writer)
+            elif filename.endswith(".csv"):
+                # Stream the CSV in chunks so peak memory does not grow with the file size
+                report = ingest.ingest_csv(source, db, progress=progress, writer=writer)
+            else:
+                raise ValueError("Only .csv and .xlsx files can be uploaded.")
+
+        # Profile column cardinality and refresh planner statistics for the new tables
+        if self.index_advisor is not None and engine == "sqlite":
+            for table_report in report.get("tables", [report]):
+                with span("ingest.profile"):
+                    self.index_advisor.profile_table(db, table_report["table"])
+        report["database"] = name
+        return report
+
+    # Function to turn a question into SQL and open it as a query. The SQL comes from the local
+    # intent matcher (common question shapes, no model call), the question -> SQL cache or the
+    # model; model SQL is validated with EXPLAIN and only cached when valid. With on_text, the
+    # response is streamed and on_text is called with the text so far; the query is opened (and
+    # its first page started) as soon as the streamed statement is complete and valid.
+    def ask(self, question, db, table_name, columns=None, on_text=None, page_size=DEFAULT_PAGE_SIZE):
+        columns = columns if columns is not None else self.column_names(table_name, db)
+        stats = self.table_stats(table_name, db)
+        result = {"sql": None, "error": None, "cached": False, "intent": None, "query_id": None}
+        opened = {}
+        matched = match_question(question, table_name, columns, stats)
+        self.intents.record(matched[0] if matched else None)
+        if matched is not None:
+            result["intent"], sql = matched
+        else:
+            # Reuse the SQL generated earlier for the same question and schema
+            sql = self.query_cache.get(question, table_name, columns)
+            result["cached"] = sql is not None
+            if sql is None:
+                prompt = generate_prompt(table_name, columns, question=question, top_k=FEW_SHOT_K, stats=stats)
+                if on_text is not None:
+                    stream = SqlStream(
+                        stream_gemini_response(question, prompt, model=self.model), db,
+                        on_valid=lambda valid_sql: opened.update(
+                            {valid_sql: self.open_query(valid_sql, db, page_size, generated=True)}
+                        ) if is_single_select(valid_sql) else None,
+                    )
+                    for text in stream:
+                        on_text(text)
+                    sql, error = stream.sql, stream.error
+                else:
+                    response = get_gemini_response(question, prompt, model=self.model)
+                    with span("sql.clean"):
+                        sql = clean_sql(response)
+                    error = None
+                    try:
+                        validate_sql(sql, db)
+                    except QUERY_ERRORS as e:
+                        error = e
+
+                if sql and error is None and not is_single_select(sql):
+                    error = "Only single SELECT statements can be run."
+                # Only SQL that compiles against the database is worth reusing
+                if sql and error is None:
+                    self.query_cache.put(question, table_name, columns, sql)
+                result["error"] = str(error) if error is not None else None
+
+        result["sql"] = sql
+        if sql and result["error"] is None and not is_single_select(sql):
+            result["error"] = "Only single SELECT statements can be run."  # e.g. a cached entry
+        if sql and result["error"] is None:
+            result["query_id"] = opened.pop(clean_sql(sql), None) \
+                or self.open_query(sql, db, page_size, generated=True)
+        for query_id in opened.values():
+            self.close_query(query_id)
+        return result
+
+    # Function to open a paged query and start fetching its first page right away. Only single
+    # SELECT statements can be opened; `generated` marks SQL that ask() produced.
+    def open_query(self, sql, db, page_size=DEFAULT_PAGE_SIZE, prefetch=True, generated=False):
+        if not is_single_select(sql):
+            raise ValueError("Only single SELECT statements can be opened as queries.")
+        query_id = make_query_id(db, clean_sql(sql), self.secret, generated)
+        self._entry(query_id, page_size)
+        if prefetch:
+            self.submit_page(query_id, 0, page_size)
+        return query_id
+
+    def _entry(self, query_id, page_size=DEFAULT_PAGE_SIZE):
+        with self._lock:
+            entry = self._queries.get(query_id)
+            if entry is not None:
+                self._queries.move_to_end(query_id)
+                return entry
+        db, sql, _ = parse_query_id(query_id, self.secret)
+        if os.path.abspath(db) not in {os.path.abspath(path) for path in self.databases().values()}:
+            raise KeyError(f"Unknown database for query: {db}")
+        window = ResultWindow(sql, db, page_size=page_size, max_rows=MAX_RESULT_ROWS, result_cache=self.result_cache)
+        with self._lock:
+            entry = self._queries.setdefault(query_id, {"window": window, "job": None})
+            while len(self._queries) > self.max_open_queries:
+                _, evicted = self._queries.popitem(last=False)
+                if evicted["job"] is not None:
+                    evicted["job"].cancel()
+        return entry
+
+    # Function to start fetching one page of a query on the watchdog's SQL workers. Asking again
+    # for the page that is already being fetched returns the same job; asking for another page
+    # stops the previous one. The job's result is a page dict (see _fetch_page) whose "table"
+    # is a rounded Arrow table.
+    def submit_page(self, query_id, page, page_size=None):
+        entry = self._entry(query_id, page_size or DEFAULT_PAGE_SIZE)
+        with self._lock:
+            window = entry["window"]
+            key = (query_id, page, page_size or window.page_size)
+            job = entry["job"]
+            if job is not None and job.key == key and not (job.done() and job.future.exception() is not None):
+                return job
+            if job is not None:
+                job.cancel()
+            if key[2] != window.page_size:
+                window.set_page_size(key[2])
+            job = self.watchdog.submit(self._fetch_page, window, page, sql=window.sql, db=window.db, key=key)
+            entry["job"] = job
+            return job
+
+    def _fetch_page(self, window, page, guard=None):
+        table = window.fetch_page(page, guard=guard)
+        return {"table": table, "page": page, "page_start": window.page_start(page), "has_more": window.has_more,
+                "capped": window.capped, "max_rows": window.max_rows}
+
+    def fetch_page(self, query_id, page, page_size=None):
+        return self.submit_page(query_id, page, page_size).result()
+
+    def cancel(self, query_id):
+        with self._lock:
+            entry = self._queries.get(query_id)
+        if entry is not None and entry["job"] is not None:
+            entry["job"].cancel()
+
+    def close_query(self, query_id):
+        with self._lock:
+            entry = self._queries.pop(query_id, None)
+        if entry is not None and entry["job"] is not None:
+            entry["job"].cancel()
+
+    # Function to let the index advisor learn from a query that ran, and adjust indexes. Only
+    # queries that ask() generated and opened are advised on, looked up by their query id.
+    def advise(self, query_id, table_name, columns=None):
+        db, sql, generated = parse_query_id(query_id, self.secret)
+        if not generated or not is_single_select(sql):
+            raise ValueError("Only SELECT queries generated by the engine can be advised on.")
+        if self.index_advisor is None or is_columnar(db):
+            return None
+        if table_name not in self.table_names(db):
+            raise ValueError(f"Unknown table: {table_name}")
+        columns = columns if columns is not None else self.column_names(table_name, db)
+        try:
+            self.index_advisor.record_query(db, table_name, sql, columns)
+            return self.index_advisor.maintain(db, table_name)
+        except sqlite3.Error as e:
+            return {"error": str(e), "applied": False, "recommendations": []}
+
+    def stats(self):
+        return {
+            "query_cache": self.query_cache.stats(),
+            "intents": self.intents.stats(),
+            "result_cache": self.result_cache.stats(),
+            "killed_queries": self.watchdog.killed,
+            "open_queries": len(self._queries),
+            "query_timeout": self.query_timeout,
+        }
@@ -0,0 +1,268 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from connections import connect_read_only, get_pool, quote_identifier
+from query_guard import PROGRESS_OPS, QueryGuard, QueryLimits
+from results import is_single_select, strip_statement
+
+INDEX_PREFIX = "nl2sql_idx_"
+PROFILE_SAMPLE_ROWS = 100_000
+
+# Limits for timing a sample query before and after creating an index: it runs read-only, reads
+# at most this many rows and is stopped after this many seconds
+SAMPLE_LIMITS = QueryLimits(timeout=5.0, max_rows=10_000, temp_store_mb=None)
+
+_CLAUSES = {
+    "filter": re.compile(r"\b(?:WHERE|HAVING|ON)\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bUNION\b|;|$)",
+                         re.IGNORECASE | re.DOTALL),
+    "group": re.compile(r"\bGROUP\s+BY\b(.*?)(?=\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|\)|;|$)", re.IGNORECASE | re.DOTALL),
+    "order": re.compile(r"\bORDER\s+BY\b(.*?)(?=\bLIMIT\b|\)|;|$)", re.IGNORECASE | re.DOTALL),
+}
+
+
+# Function to find which of a table's columns a query filters, groups or orders by
+def columns_used(sql, columns):
+    usage = {}
+    for kind, pattern in _CLAUSES.items():
+        for match in pattern.finditer(sql):
+            clause = match.group(1)
+            for column in columns:
+                name = re.escape(column)
+                if re.search(rf'(?<![\w.])(?:"{name}"|`{name}`|\[{name}\]|{name})(?!\w)', clause, re.IGNORECASE):
+                    usage.setdefault(column, set()).add(kind)
+    return usage
+
+
+# Function to tell whether EXPLAIN QUERY PLAN scans a table without an index or sorts in a temp b-tree
+def plan_needs_index(conn, sql, table_name):
+    details = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    for detail in details:
+        if re.match(rf"SCAN (?:TABLE )?{re.escape(table_name)}\b", detail) and "INDEX" not in detail:
+            return True
+        if detail.startswith("USE TEMP B-TREE"):
+            return True
+    return False
+
+
+# Function to time a SELECT on a pooled read-only connection, reading at most limits.max_rows
+# rows; returns the elapsed seconds, or None for SQL that is not a single SELECT or that ran
+# out of time
+def time_query(db, sql, limits=SAMPLE_LIMITS):
+    if not sql or not is_single_select(sql):
+        return None
+    guard = QueryGuard(limits)
+    with get_pool(db).connection() as conn:
+        conn.set_progress_handler(guard.progress_handler, PROGRESS_OPS)
+        try:
+            started = time.perf_counter()
+            conn.execute(f"SELECT * FROM ({strip_statement(sql)}\n) LIMIT ?", (limits.max_rows,)).fetchall()
+            return time.perf_counter() - started
+        except sqlite3.OperationalError:
+            if guard.reason is not None:
+                return None
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+
+# Learns which columns generated SQL filters, groups and orders by, and creates, recommends or
+# retires single-column indexes for them. Usage and cardinality profiles live in a sidecar
+# SQLite file rather than in the user's database, so recording a query never changes the
+# database's fingerprint (and never invalidates the result cache).
+class IndexAdvisor:
+    def __init__(self, path=".index_advisor.sqlite", min_hits=2, min_selectivity=0.001,
+                 retire_after_days=30, auto=True):
+        self.path = path
+        self.min_hits = min_hits
+        self.min_selectivity = min_selectivity
+        self.retire_after_days = retire_after_days
+        self.auto = auto
+        self._lock = threading.Lock()
+        self._store = sqlite3.connect(path, check_same_thread=False)
+        self._store.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS column_profile (
+                db TEXT, table_name TEXT, column_name TEXT, row_count INTEGER, sample_rows INTEGER,
+                distinct_count INTEGER, null_count INTEGER, profiled_at REAL,
+                PRIMARY KEY (db, table_name, column_name)
+            );
+            CREATE TABLE IF NOT EXISTS column_usage (
+                db TEXT, table_name TEXT, column_name TEXT, kind TEXT, hits INTEGER, full_scans INTEGER,
+                last_used REAL, last_sql TEXT,
+                PRIMARY KEY (db, table_name, column_name, kind)
+            );
+            """
+        )
+        self._store.commit()
+
+    # Function to profile column cardinality on a sample and refresh the planner statistics.
+    # Called right after ingest, when the table is known to have changed.
+    def profile_table(self, db, table_name, sample_rows=PROFILE_SAMPLE_ROWS):
+        conn = sqlite3.connect(db)
+        try:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})")]
+            row_count = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table_name)}").fetchone()[0]
+            aggregates = ", ".join(
+                f"COUNT(DISTINCT {quote_identifier(c)}), SUM({quote_identifier(c)} IS NULL)" for c in columns
+            )
+            stats = conn.execute(
+                f"SELECT COUNT(*), {aggregates} FROM (SELECT * FROM {quote_identifier(table_name)} LIMIT ?)",
+                (sample_rows,),
+            ).fetchone() if columns else (0,)
+            conn.execute(f"ANALYZE {quote_identifier(table_name)}")
+            conn.commit()
+        finally:
+            conn.close()
+
+        now = time.time()
+        profile = []
+        for position, column in enumerate(columns):
+            distinct_count, null_count = stats[1 + 2 * position], stats[2 + 2 * position] or 0
+            profile.append((os.path.abspath(db), table_name, column, row_count, stats[0], distinct_count, null_count, now))
+        with self._lock:
+            self._store.execute("DELETE FROM column_profile WHERE db = ? AND table_name = ?",
+                                (os.path.abspath(db), table_name))
+            self._store.executemany("INSERT INTO column_profile VALUES (?, ?, ?, ?, ?, ?, ?, ?)", profile)
+            self._store.commit()
+        return [
+            {"column": row[2], "row_count": row[3], "sample_rows": row[4], "distinct_count": row[5], "null_count": row[6]}
+            for row in profile
+        ]
+
+    # Function to record which columns a generated query used and whether its plan scanned the
+    # table. Only single SELECT statements are recorded, since their SQL is replayed by apply().
+    def record_query(self, db, table_name, sql, columns):
+        if not is_single_select(sql):
+            return {}
+        usage = columns_used(sql, columns)
+        if not usage:
+            return {}
+        conn = connect_read_only(db)
+        try:
+            full_scan = plan_needs_index(conn, sql, table_name)
+        except sqlite3.Error:
+            return {}
+        finally:
+            conn.close()
+
+        now = time.time()
+        with self._lock:
+            for column, kinds in usage.items():
+                for kind in kinds:
+                    self._store.execute(
+                        """
+                        INSERT INTO column_usage VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+                        ON CONFLICT (db, table_name, column_name, kind) DO UPDATE SET
+                            hits = hits + 1, full_scans = full_scans + excluded.full_scans,
+                            last_used = excluded.last_used, last_sql = excluded.last_sql
+                        """,
+                        (os.path.abspath(db), table_name, column, kind, int(full_scan), now, sql),
+                    )
+            self._store.commit()
+        return usage
+
+    def _existing_indexes(self, conn, table_name):
+        indexes = {}
+        for row in conn.execute(f"PRAGMA index_list({quote_identifier(table_name)})"):
+            index_name = row[1]
+            info = conn.execute(f"PRAGMA index_info({quote_identifier(index_name)})").fetchall()
+            if info:
+                indexes[index_name] = info[0][2]  # leading column
+        return indexes
+
+    # Function to list the indexes worth creating and the advisor-created ones worth retiring
+    def recommend(self, db, table_name):
+        key = (os.path.abspath(db), table_name)
+        with self._lock:
+            usage = self._store.execute(
+                "SELECT column_name, kind, hits, full_scans, last_used, last_sql FROM column_usage "
+                "WHERE db = ? AND table_name = ?", key,
+            ).fetchall()
+            profile = {
+                row[0]: row[1:] for row in self._store.execute(
+                    "SELECT column_name, sample_rows, distinct_count FROM column_profile WHERE db = ? AND table_name = ?", key,
+                )
+            }
+
+        conn = sqlite3.connect(db)
+        try:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})")]
+            indexes = self._existing_indexes(conn, table_name)
+        finally:
+            conn.close()
+        indexed = set(indexes.values())
+
+        by_column = {}
+        for column, kind, hits, full_scans, last_used, last_sql in usage:
+            entry = by_column.setdefault(column, {"hits": 0, "full_scans": 0, "kinds": set(), "last_used": 0, "last_sql": None})
+            entry["hits"] += hits
+            entry["full_scans"] += full_scans
+            entry["kinds"].add(kind)
+            if last_used > entry["last_used"]:
+                entry["last_used"], entry["last_sql"] = last_used, last_sql
+
+        recommendations = []
+        for column, entry in by_column.items():
+            if column not in columns or column in indexed:
+                continue
+            if entry["hits"] < self.min_hits or entry["full_scans"] == 0:
+                continue
+            sample_rows, distinct_count = profile.get(column, (0, None))
+            selectivity = distinct_count / sample_rows if sample_rows and distinct_count is not None else None
+            # A near-constant column does not help an equality filter, but still saves the sort
+            if entry["kinds"] == {"filter"} and selectivity is not None and selectivity < self.min_selectivity:
+                continue
+            recommendations.append({
+                "action": "create",
+                "index": f"{INDEX_PREFIX}{table_name}_{column}"[:120],
+                "column": column,
+                "hits": entry["hits"],
+                "kinds": sorted(entry["kinds"]),
+                "selectivity": selectivity,
+                "sample_sql": entry["last_sql"],
+            })
+
+        cutoff = time.time() - self.retire_after_days * 24 * 3600
+        for index_name, column in indexes.items():
+            if not index_name.startswith(INDEX_PREFIX):
+                continue
+            entry = by_column.get(column)
+            if entry is None or entry["last_used"] < cutoff:
+                recommendations.append({"action": "retire", "index": index_name, "column": column})
+        return recommendations
+
+    # Function to create/drop recommended indexes, timing each index's sample query before and
+    # after (see time_query for the limits)
+    def apply(self, db, table_name, recommendations):
+        report = []
+        conn = sqlite3.connect(db)
+        try:
+            for recommendation in recommendations:
+                entry = dict(recommendation)
+                if recommendation["action"] == "create":
+                    sample_sql = recommendation.get("sample_sql")
+                    entry["before_seconds"] = time_query(db, sample_sql)
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {quote_identifier(recommendation['index'])} "
+                        f"ON {quote_identifier(table_name)} ({quote_identifier(recommendation['column'])})"
+                    )
+                    conn.execute(f"ANALYZE {quote_identifier(table_name)}")
+                    conn.commit()
+                    entry["after_seconds"] = time_query(db, sample_sql)
+                else:
+                    conn.execute(f"DROP INDEX IF EXISTS {quote_identifier(recommendation['index'])}")
+                    conn.commit()
+                report.append(entry)
+        finally:
+            conn.close()
+        return report
+
+    # Function to recommend, and in auto mode apply, index changes for a table
+    def maintain(self, db, table_name):
+        recommendations = self.recommend(db, table_name)
+        if not self.auto or not recommendations:
+            return {"applied": False, "recommendations": recommendations}
+        return {"applied": True, "recommendations": self.apply(db, table_name, recommendations)}
@@ -0,0 +1,570 @@
+import datetime
+import decimal
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import pandas as pd
+
+from column_stats import StatsBuilder, copy_stats, save_stats
+from metrics import span, timed
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+DEFAULT_TABLE = "uploaded_data"
+
+# Bookkeeping tables kept next to the data start with this prefix and are hidden from the
+# table listing. CHUNKS_TABLE holds a fingerprint of every chunk loaded into each table.
+SIDE_TABLE_PREFIX = "_nl2sql_"
+CHUNKS_TABLE = SIDE_TABLE_PREFIX + "chunks"
+KEY_INDEX_PREFIX = "nl2sql_key_"
+UPSERT_LOOKUP_BATCH = 500  # keys per "WHERE key IN (...)" lookup
+
+# PRAGMAs applied for the duration of a bulk load; the previous values are restored afterwards.
+# journal_mode=MEMORY keeps ROLLBACK working if a chunk fails, unlike journal_mode=OFF.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": -262144,  # negative means KiB, i.e. 256 MiB of page cache
+    "temp_store": "MEMORY",
+}
+
+
+# Function to split an in-memory DataFrame into fixed-size chunks
+def iter_frame_chunks(df, chunksize=50_000):
+    if df.empty:
+        yield df
+        return
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+# Inferred object-column types that sqlite3 can bind without conversion
+BINDABLE_INFERRED_TYPES = {"string", "integer", "floating", "mixed-integer-float", "boolean", "bytes", "empty"}
+
+
+# Function to convert a single value sqlite3 cannot bind (dates, decimals, ...) into one it can
+def bindable_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    return value
+
+
+# Function to turn a DataFrame chunk into plain Python rows sqlite3 can bind
+def chunk_rows(chunk):
+    chunk = chunk.copy()
+    for column in chunk.columns:
+        if pd.api.types.is_datetime64_any_dtype(chunk[column]):
+            chunk[column] = chunk[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif chunk[column].dtype == object:
+            if pd.api.types.infer_dtype(chunk[column], skipna=True) not in BINDABLE_INFERRED_TYPES:
+                chunk[column] = chunk[column].map(bindable_value)
+    values = chunk.astype(object)
+    values = values.where(chunk.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# Function to fingerprint a chunk from its column names and a vectorized hash of every row
+def chunk_digest(chunk):
+    digest = hashlib.sha256(json.dumps([str(column) for column in chunk.columns]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(chunk, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _ensure_chunks_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHUNKS_TABLE} (table_name TEXT NOT NULL, chunk INTEGER NOT NULL, "
+        "first_row INTEGER NOT NULL, rows INTEGER NOT NULL, digest TEXT NOT NULL, PRIMARY KEY (table_name, chunk))"
+    )
+
+
+def _record_chunk(conn, table_name, chunk_index, first_row, rows, digest):
+    conn.execute(f"INSERT OR REPLACE INTO {CHUNKS_TABLE} VALUES (?, ?, ?, ?, ?)",
+                 (table_name, chunk_index, first_row, rows, digest))
+
+
+# Function to switch a connection into bulk-load mode, returning the settings to restore
+def apply_bulk_pragmas(conn, pragmas=None):
+    pragmas = BULK_LOAD_PRAGMAS if pragmas is None else pragmas
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.execute(f"PRAGMA {name}").fetchone()[0]
+        conn.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+
+def restore_pragmas(conn, previous):
+    for name, value in previous.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+# Function to replace a table with a fully written staging table, inside the caller's
+# transaction. Legacy ALTER TABLE semantics let views that read the table survive the swap.
+def _swap_in(conn, staging, table_name):
+    legacy = conn.execute("PRAGMA legacy_alter_table").fetchone()[0]
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+        conn.execute(f"ALTER TABLE {quote_identifier(staging)} RENAME TO {quote_identifier(table_name)}")
+    finally:
+        conn.execute(f"PRAGMA legacy_alter_table = {legacy}")
+
+
+# Function to stream DataFrame chunks into a SQLite table with batched executemany calls.
+# The table is replaced, like df.to_sql(if_exists='replace'), and only one chunk is held in
+# memory at a time. Rows go to a staging table that replaces the table in the last
+# transaction, so a load that fails leaves the previous table as it was. Column statistics
+# (see column_stats) are gathered on the way and stored with the table. `progress` is called
+# as progress(rows_written, elapsed_seconds).
+def write_chunks(chunks, db_name, table_name=DEFAULT_TABLE, batch_size=10_000,
+                 rows_per_transaction=250_000, progress=None, pragmas=None):
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    previous = apply_bulk_pragmas(conn, pragmas)
+    staging = SIDE_TABLE_PREFIX + "staging_" + table_name
+    rows_written = 0
+    rows_in_transaction = 0
+    chunk_count = 0
+    insert_sql = None
+    fingerprints = []
+    stats = StatsBuilder()
+    try:
+        conn.execute("BEGIN")
+        for chunk in timed(chunks, "ingest.parse"):
+            if insert_sql is None:
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+                conn.execute(pd.io.sql.get_schema(chunk, staging, con=conn))
+                placeholders = ", ".join("?" * len(chunk.columns))
+                insert_sql = f"INSERT INTO {quote_identifier(staging)} VALUES ({placeholders})"
+            # Fingerprints let a later upsert of the same file skip unchanged chunks
+            fingerprints.append((table_name, chunk_count, rows_written, len(chunk), chunk_digest(chunk)))
+            chunk_count += 1
+            with span("ingest.stats", rows=len(chunk)):
+                stats.add(chunk)
+
+            rows = chunk_rows(chunk)
+            with span("ingest.write", rows=len(chunk)):
+                while True:
+                    batch = list(itertools.islice(rows, batch_size))
+                    if not batch:
+                        break
+                    conn.executemany(insert_sql, batch)
+                    rows_written += len(batch)
+                    rows_in_transaction += len(batch)
+                    if rows_in_transaction >= rows_per_transaction:
+                        conn.execute("COMMIT")
+                        conn.execute("BEGIN")
+                        rows_in_transaction = 0
+
+            if progress is not None:
+                progress(rows_written, time.perf_counter() - started)
+
+        if insert_sql is None:
+            raise ValueError("No data to ingest.")
+        _swap_in(conn, staging, table_name)
+        _ensure_chunks_table(conn)
+        conn.execute(f"DELETE FROM {CHUNKS_TABLE} WHERE table_name = ?", (table_name,))
+        conn.executemany(f"INSERT INTO {CHUNKS_TABLE} VALUES (?, ?, ?, ?, ?)", fingerprints)
+        save_stats(conn, table_name, stats.result())
+        with span("ingest.commit"):
+            conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+        except sqlite3.Error:
+            pass  # the original error matters more; the next load replaces the staging table
+        raise
+    finally:
+        restore_pragmas(conn, previous)
+        conn.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "table": table_name,
+        "rows": rows_written,
+        "chunks": chunk_count,
+        "seconds": seconds,
+        "rows_per_sec": rows_written / seconds if seconds > 0 else 0.0,
+    }
+
+
+# Function to diff a chunk against the rows stored at the same positions (rowid = position + 1)
+# and write only the rows that differ; returns (inserted, updated, skipped)
+def _upsert_by_position(conn, table_name, columns, rows, first_row):
+    stored = {
+        row[0]: row[1:] for row in conn.execute(
+            f"SELECT rowid, * FROM {quote_identifier(table_name)} WHERE rowid BETWEEN ? AND ?",
+            (first_row + 1, first_row + len(rows)),
+        )
+    }
+    inserts, updates = [], []
+    for rowid, row in enumerate(rows, start=first_row + 1):
+        previous = stored.get(rowid)
+        if previous is None:
+            inserts.append((rowid, *row))
+        elif previous != row:
+            updates.append((rowid, *row))
+    names = ", ".join(["rowid"] + [quote_identifier(column) for column in columns])
+    placeholders = ", ".join("?" * (len(columns) + 1))
+    conn.executemany(f"INSERT OR REPLACE INTO {quote_identifier(table_name)} ({names}) VALUES ({placeholders})",
+                     inserts + updates)
+    return len(inserts), len(updates), len(rows) - len(inserts) - len(updates)
+
+
+# Function to diff a chunk against the stored rows with the same key values and write only new
+# or changed rows; within a chunk the last row for a key wins. Returns (inserted, updated, skipped)
+def _upsert_by_key(conn, table_name, columns, rows, key):
+    position = columns.index(key)
+    incoming = {row[position]: row for row in rows}
+    stored = {}
+    keys = list(incoming)
+    for start in range(0, len(keys), UPSERT_LOOKUP_BATCH):
+        batch = keys[start:start + UPSERT_LOOKUP_BATCH]
+        for row in conn.execute(
+            f"SELECT rowid, * FROM {quote_identifier(table_name)} "
+            f"WHERE {quote_identifier(key)} IN ({', '.join('?' * len(batch))})", batch,
+        ):
+            stored[row[1 + position]] = row
+    inserts, updates = [], []
+    for key_value, row in incoming.items():
+        previous = stored.get(key_value)
+        if previous is None:
+            inserts.append(row)
+        elif previous[1:] != row:
+            updates.append((previous[0], *row))
+    placeholders = ", ".join("?" * len(columns))
+    conn.executemany(f"INSERT INTO {quote_identifier(table_name)} VALUES ({placeholders})", inserts)
+    names = ", ".join(["rowid"] + [quote_identifier(column) for column in columns])
+    conn.executemany(f"INSERT OR REPLACE INTO {quote_identifier(table_name)} ({names}) VALUES (?, {placeholders})",
+                     updates)
+    return len(inserts), len(updates), len(rows) - len(inserts) - len(updates)
+
+
+# Function to load a new version of a file into an existing table, writing only what changed,
+# in one transaction. Every chunk is fingerprinted and a chunk identical to the one stored at
+# the same position is skipped without reading the table; other chunks are diffed row by row.
+# Fingerprints are only kept by writes that leave the table mirroring the file (write_chunks and
+# upserts without a key); an upsert with a key clears them.
+# Without `key`, rows are matched by position and the table ends up mirroring the file (rows
+# past its end are deleted). With `key`, rows are matched on that column (which gets an index)
+# and rows whose key is not in the file are kept. The table and its indexes are never dropped;
+# a missing table is created. Same call shape as write_chunks. Matched by position, the table's
+# column statistics are rebuilt from the file; matched on a key the table no longer equals the
+# file, so any statistics it has are flagged stale as soon as a row changes.
+def upsert_chunks(chunks, db_name, table_name=DEFAULT_TABLE, key=None, batch_size=10_000,
+                  progress=None, pragmas=None, **kwargs):
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    previous = apply_bulk_pragmas(conn, pragmas)
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "deleted": 0}
+    rows_read = 0
+    chunk_count = 0
+    columns = None
+    stats = StatsBuilder() if key is None else None
+    try:
+        conn.execute("BEGIN")
+        _ensure_chunks_table(conn)
+        stored_chunks = {
+            chunk_index: (first_row, rows, digest) for chunk_index, first_row, rows, digest in conn.execute(
+                f"SELECT chunk, first_row, rows, digest FROM {CHUNKS_TABLE} WHERE table_name = ?", (table_name,)
+            )
+        }
+        for chunk in timed(chunks, "ingest.parse"):
+            if columns is None:
+                columns = [str(column) for column in chunk.columns]
+                existing = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})")]
+                if not existing:
+                    conn.execute(pd.io.sql.get_schema(chunk, table_name, con=conn))
+                    stored_chunks = {}
+                elif existing != columns:
+                    raise ValueError(f"The file's columns do not match table '{table_name}'; "
+                                     "upload it in replace mode instead.")
+                if key is not None:
+                    if key not in columns:
+                        raise ValueError(f"Key column '{key}' is not in the file.")
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(KEY_INDEX_PREFIX + table_name + '_' + key)} "
+                                 f"ON {quote_identifier(table_name)} ({quote_identifier(key)})")
+
+            if key is not None and chunk[key].isna().any():
+                raise ValueError(f"Key column '{key}' has empty values.")
+            digest = chunk_digest(chunk)
+            if stored_chunks.get(chunk_count) == (rows_read, len(chunk), digest):
+                counts["skipped"] += len(chunk)
+            else:
+                with span("ingest.write", rows=len(chunk)):
+                    rows = list(chunk_rows(chunk))
+                    for start in range(0, len(rows), batch_size):
+                        batch = rows[start:start + batch_size]
+                        if key is None:
+                            changes = _upsert_by_position(conn, table_name, columns, batch, rows_read + start)
+                        else:
+                            changes = _upsert_by_key(conn, table_name, columns, batch, key)
+                        for name, count in zip(("inserted", "updated", "skipped"), changes):
+                            counts[name] += count
+                if key is None:
+                    _record_chunk(conn, table_name, chunk_count, rows_read, len(chunk), digest)
+            chunk_count += 1
+            rows_read += len(chunk)
+            if stats is not None:
+                with span("ingest.stats", rows=len(chunk)):
+                    stats.add(chunk)
+            if progress is not None:
+                progress(rows_read, time.perf_counter() - started)
+
+        if columns is None:
+            raise ValueError("No data to ingest.")
+        if key is None:
+            counts["deleted"] = conn.execute(
+                f"DELETE FROM {quote_identifier(table_name)} WHERE rowid > ?", (rows_read,)
+            ).rowcount
+            save_stats(conn, table_name, stats.result())
+            conn.execute(f"DELETE FROM {CHUNKS_TABLE} WHERE table_name = ? AND chunk >= ?", (table_name, chunk_count))
+        else:
+            # Key-matched rows no longer sit at their file positions, so no fingerprint is valid
+            conn.execute(f"DELETE FROM {CHUNKS_TABLE} WHERE table_name = ?", (table_name,))
+        with span("ingest.commit"):
+            conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        restore_pragmas(conn, previous)
+        conn.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "table": table_name,
+        "rows": rows_read,
+        "chunks": chunk_count,
+        **counts,
+        "seconds": seconds,
+        "rows_per_sec": rows_read / seconds if seconds > 0 else 0.0,
+    }
+
+
+# Function to stream a CSV file (path or file-like object) into SQLite in bounded memory.
+# `writer` replaces write_chunks to target another storage engine.
+def ingest_csv(source, db_name, table_name=DEFAULT_TABLE, chunksize=50_000, writer=None, **kwargs):
+    writer = writer or write_chunks
+    with pd.read_csv(source, chunksize=chunksize) as chunks:
+        return writer(chunks, db_name, table_name=table_name, **kwargs)
+
+
+# Function to derive unique SQLite table names from worksheet titles
+def sheet_table_names(sheet_names):
+    names = {}
+    used = set()
+    for sheet_name in sheet_names:
+        base = re.sub(r"\W+", "_", sheet_name).strip("_").lower() or "sheet"
+        name = base
+        suffix = 1
+        while name in used:
+            suffix += 1
+            name = f"{base}_{suffix}"
+        used.add(name)
+        names[sheet_name] = name
+    return names
+
+
+# Function to name header cells, filling blanks and de-duplicating like pd.read_excel does
+def header_names(header):
+    columns = []
+    seen = {}
+    for position, value in enumerate(header):
+        name = str(value).strip() if value is not None and str(value).strip() else f"Unnamed: {position}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+# Function to read one worksheet as DataFrame chunks with openpyxl's read-only row iterator
+def iter_sheet_chunks(workbook, sheet_name, chunksize=50_000):
+    rows = workbook[sheet_name].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = header_names(header)
+    width = len(columns)
+    emitted = False
+    while True:
+        block = [
+            tuple(row[:width]) + (None,) * (width - len(row))
+            for row in itertools.islice(rows, chunksize)
+        ]
+        if not block:
+            break
+        emitted = True
+        yield pd.DataFrame(block, columns=columns)
+    if not emitted:
+        yield pd.DataFrame(columns=columns)
+
+
+def _open_workbook(source):
+    if openpyxl is None:
+        raise ImportError("Missing optional dependency 'openpyxl'. Please install it using `pip install openpyxl`.")
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+# Function to stream one worksheet into a table; returns None for a sheet with no header row
+def _load_sheet(workbook, sheet_name, db_name, table_name, chunksize, writer=None, **kwargs):
+    chunks = iter_sheet_chunks(workbook, sheet_name, chunksize)
+    first = next(chunks, None)
+    if first is None:
+        return None
+    report = (writer or write_chunks)(itertools.chain([first], chunks), db_name, table_name=table_name, **kwargs)
+    report["sheet"] = sheet_name
+    return report
+
+
+# Worker entry point: parse one sheet into its own scratch database so workers never
+# contend for the SQLite write lock
+def _load_sheet_to_part(path, sheet_name, table_name, part_db, chunksize):
+    workbook = _open_workbook(path)
+    try:
+        return _load_sheet(workbook, sheet_name, part_db, table_name, chunksize)
+    finally:
+        workbook.close()
+
+
+# Function to copy a table produced by a worker into the target database
+def _merge_part(db_name, part_db, table_name):
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    previous = apply_bulk_pragmas(conn)
+    try:
+        conn.execute("ATTACH DATABASE ? AS part", (part_db,))
+        schema = conn.execute(
+            "SELECT sql FROM part.sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+        ).fetchone()[0]
+        with span("ingest.merge"):
+            conn.execute("BEGIN")
+            conn.execute(f"DROP TABLE IF EXISTS main.{quote_identifier(table_name)}")
+            conn.execute(schema)
+            conn.execute(
+                f"INSERT INTO main.{quote_identifier(table_name)} SELECT * FROM part.{quote_identifier(table_name)}"
+            )
+            _ensure_chunks_table(conn)
+            conn.execute(f"DELETE FROM main.{CHUNKS_TABLE} WHERE table_name = ?", (table_name,))
+            conn.execute(f"INSERT INTO main.{CHUNKS_TABLE} SELECT * FROM part.{CHUNKS_TABLE} WHERE table_name = ?",
+                         (table_name,))
+            copy_stats(conn, table_name, "part")
+            conn.execute("COMMIT")
+        conn.execute("DETACH DATABASE part")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        restore_pragmas(conn, previous)
+        conn.close()
+
+
+# Function to stream every sheet of an XLSX workbook (path or file-like object) into its own
+# table. With workers > 1 sheets are parsed in parallel processes, each into a scratch
+# database that is then merged into `db_name`; that path is SQLite-only, so a custom `writer`
+# always loads sheets one after another.
+def ingest_xlsx(source, db_name, sheets=None, chunksize=50_000, workers=1, progress=None, writer=None):
+    started = time.perf_counter()
+    workbook = _open_workbook(source)
+    try:
+        sheet_names = list(sheets) if sheets is not None else workbook.sheetnames
+        table_names = sheet_table_names(sheet_names)
+        if workers <= 1 or len(sheet_names) <= 1 or writer not in (None, write_chunks):
+            reports = []
+            rows_before = 0
+
+            # Report rows across all sheets loaded so far, not just the current one
+            def sheet_progress(rows, elapsed):
+                if progress is not None:
+                    progress(rows_before + rows, time.perf_counter() - started)
+
+            for sheet_name in sheet_names:
+                report = _load_sheet(workbook, sheet_name, db_name, table_names[sheet_name], chunksize,
+                                     writer=writer, progress=sheet_progress)
+                if report is not None:
+                    reports.append(report)
+                    rows_before += report["rows"]
+        else:
+            workbook.close()
+            workbook = None
+            reports = _ingest_xlsx_parallel(source, db_name, sheet_names, table_names, chunksize,
+                                            workers, progress, started)
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+    rows = sum(report["rows"] for report in reports)
+    seconds = time.perf_counter() - started
+    summary = {
+        "tables": reports,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+    }
+    # Upserts report what changed; add it up across sheets
+    for name in ("inserted", "updated", "skipped", "deleted"):
+        if any(name in report for report in reports):
+            summary[name] = sum(report.get(name, 0) for report in reports)
+    return summary
+
+
+def _ingest_xlsx_parallel(source, db_name, sheet_names, table_names, chunksize, workers, progress, started):
+    scratch_dir = tempfile.mkdtemp(prefix="xlsx_ingest_")
+    try:
+        # Worker processes need a path; spool file-like uploads to disk first
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+        else:
+            path = os.path.join(scratch_dir, "workbook.xlsx")
+            source.seek(0)
+            with open(path, "wb") as spooled:
+                shutil.copyfileobj(source, spooled)
+
+        reports = []
+        rows = 0
+        with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names)), mp_context=get_context("spawn")) as pool:
+            futures = {}
+            for position, sheet_name in enumerate(sheet_names):
+                part_db = os.path.join(scratch_dir, f"part_{position}.sqlite")
+                future = pool.submit(_load_sheet_to_part, path, sheet_name, table_names[sheet_name], part_db, chunksize)
+                futures[future] = part_db
+            for future in as_completed(futures):
+                report = future.result()
+                if report is None:
+                    continue
+                _merge_part(db_name, futures[future], report["table"])
+                reports.append(report)
+                rows += report["rows"]
+                if progress is not None:
+                    progress(rows, time.perf_counter() - started)
+        reports.sort(key=lambda report: sheet_names.index(report["sheet"]))
+        return reports
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
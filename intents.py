@@ -0,0 +1,240 @@
+import argparse
+import functools
+import re
+import threading
+from collections import Counter
+
+from connections import quote_identifier
+from metrics import span
+
+# Words that open a request for rows, and nouns that stand for "rows" in a question (besides
+# the table's own name, see IntentMatcher)
+_VERB = r"(?:please )?(?:show|list|get|give|find|display|retrieve|fetch|return|tell)(?: me)?"
+_ROW_NOUNS = ("records", "record", "rows", "row", "entries", "entry", "data", "results", "result", "items", "item")
+_TABLE_SUFFIX = r"(?: (?:in|from|of) (?:the|this|my) (?:table|dataset|data|database|sheet))?"
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                 "nine": 9, "ten": 10, "twenty": 20, "fifty": 50, "hundred": 100}
+_NUMBER = r"(?P<n>\d+|" + "|".join(_NUMBER_WORDS) + ")"
+_VALUE = r"(?P<value>'[^']*'|\"[^\"]*\"|[\w.\-]+)"
+_CONNECTIVE = r"(?: (?:is|=|==|equals|is equal to|equal to|has the value|has value|of|as|:))?"
+_DISTINCT = r"(?P<distinct>distinct|unique|different) "
+_COURTESY = re.compile(r"^(?:(?:can|could|would|will) you |please |kindly )+|(?:,? (?:please|for me|thanks|thank you))+$",
+                       re.IGNORECASE)
+
+# Words that never stand for a value, so "with marks above" is left to the model
+_NOT_VALUES = {"above", "below", "over", "under", "between", "greater", "less", "more", "fewer", "not", "null",
+               "empty", "missing", "like", "than", "highest", "lowest", "top", "bottom", "each", "every", "all",
+               "and", "or", "the"}
+
+_AGGREGATES = {
+    "average": "AVG", "avg": "AVG", "mean": "AVG",
+    "sum": "SUM", "total": "SUM",
+    "maximum": "MAX", "max": "MAX", "highest": "MAX", "largest": "MAX", "biggest": "MAX",
+    "minimum": "MIN", "min": "MIN", "lowest": "MIN", "smallest": "MIN",
+}
+_DESCENDING = {"top", "highest", "largest", "most", "biggest", "greatest", "best"}
+_ASCENDING = {"bottom", "lowest", "smallest", "least", "fewest", "worst"}
+
+_RESERVED = {"SELECT", "FROM", "WHERE", "GROUP", "ORDER", "BY", "LIMIT", "TABLE", "INDEX", "KEY", "VALUES",
+             "AND", "OR", "NOT", "IN", "IS", "NULL", "AS", "CASE", "WHEN", "THEN", "ELSE", "END", "JOIN", "ON",
+             "UNION", "ALL", "DISTINCT", "CHECK", "DEFAULT", "PRIMARY", "REFERENCES", "TO", "TRANSACTION"}
+
+
+# Function to write an identifier as the model would, quoting it only when SQL requires it
+def sql_identifier(name):
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name) and name.upper() not in _RESERVED:
+        return name
+    return quote_identifier(name)
+
+
+# Function to write a question's value as a SQL literal. Numbers stay bare unless the column
+# statistics say the column holds text; quoted values are always strings.
+def sql_literal(value, kind=None):
+    quoted = value[:1] in ("'", '"')
+    text = value[1:-1] if quoted else value
+    if not quoted and kind != "text" and re.fullmatch(r"-?\d+(?:\.\d+)?", text):
+        return text
+    return "'" + text.replace("'", "''") + "'"
+
+
+# Function to list a name written with spaces for underscores and in singular/plural forms
+def _derived_spellings(name):
+    base = name.lower().replace("_", " ")
+    for spelling in (base, base + "s", base + "es", base[:-1] if base.endswith("s") else None,
+                     base[:-2] if base.endswith("es") else None):
+        if spelling and len(spelling) > 1:
+            yield spelling
+
+
+# Function to list the spellings a question may use for a column: its name, with spaces for
+# underscores, and singular/plural forms. Exact names win over derived spellings.
+def _column_spellings(columns):
+    spellings = {}
+    for column in columns:
+        spellings.setdefault(column.lower(), column)
+    for column in columns:
+        for spelling in _derived_spellings(column):
+            spellings.setdefault(spelling, column)
+    return spellings
+
+
+# Turns the common question shapes into SQL for one table without calling the model: every row,
+# rows where a column equals a value, row and distinct counts, AVG/SUM/MIN/MAX of a column
+# (optionally filtered the same way), the top or bottom N rows by a column, and row counts per
+# value of a column. Patterns are anchored on the whole question so that anything they do not
+# fully explain (extra conditions, comparisons, joins of ideas) goes to the model instead.
+class IntentMatcher:
+    def __init__(self, table_name, columns):
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.spellings = _column_spellings(self.columns)
+        alternatives = "|".join(re.escape(spelling) for spelling in sorted(self.spellings, key=len, reverse=True))
+        # Only these words stand for rows: "how many students" counts rows of STUDENT, while
+        # "how many tables" or "show all columns" is not about rows and goes to the model
+        nouns = {*_ROW_NOUNS, self.table_name.lower(), *_derived_spellings(self.table_name)}
+        noun = (rf"(?P<noun>(?:{'|'.join(re.escape(word) for word in sorted(nouns, key=len, reverse=True))})"
+                r"(?: of (?:records|rows|entries|data))?)")
+
+        def column(group):
+            return (rf"(?:the )?(?:(?:column|field) )?(?P<{group}_quote>['\"`]?)(?P<{group}>{alternatives})"
+                    rf"(?P={group}_quote)(?: (?:column|field))?")
+
+        where = rf"(?: (?:where|with|whose|having|that have|for|in|from) {column('filter')}{_CONNECTIVE} {_VALUE})"
+        count = r"(?:how many|count(?: of)?(?: all)?(?: the)?|(?:what is |what's )?the (?:total )?number of" \
+                r"|(?:the )?total number of|number of)"
+        count_tail = r"(?: (?:are|is|do we have|exist)(?: there| present| stored| available)?)?"
+        self.patterns = [
+            ("group_count", re.compile(
+                rf"(?:{count}|(?:{_VERB} )?(?:the )?(?:counts?|numbers?)(?: of)?)(?: {noun})?{count_tail}"
+                rf" (?:in each|for each|per|by|grouped by|group by|in every|for every|across) {column('column')}"
+                rf"{_TABLE_SUFFIX}", re.IGNORECASE)),
+            ("count", re.compile(
+                rf"{count} (?:{_DISTINCT})?(?:{column('column')}|{noun}){count_tail}{_TABLE_SUFFIX}{where}?"
+                rf"{_TABLE_SUFFIX}", re.IGNORECASE)),
+            ("aggregate", re.compile(
+                rf"(?:(?:what (?:is|are)|what's|find|get|show(?: me)?|give me|calculate|compute|tell me) )?(?:the )?"
+                rf"(?P<function>{'|'.join(_AGGREGATES)})(?: value)?(?: (?:of|in|for))?(?: the)?(?: all)? "
+                rf"{column('column')}(?: values?)?{_TABLE_SUFFIX}{where}?", re.IGNORECASE)),
+            ("top", re.compile(
+                rf"(?:{_VERB} )?(?:the )?(?:(?P<edge>top|bottom) )?{_NUMBER}(?: {noun})?"
+                rf" (?:(?:with|having) (?:the )?(?P<direction>{'|'.join(_DESCENDING | _ASCENDING)})(?: values?)?"
+                rf"(?: (?:of|in|for))?|by(?: (?P<by_direction>{'|'.join(_DESCENDING | _ASCENDING)}))?)"
+                rf" {column('column')}{_TABLE_SUFFIX}", re.IGNORECASE)),
+            ("filter", re.compile(rf"(?:{_VERB} )?(?:all )?(?:the )?(?:{noun})?{where}", re.IGNORECASE)),
+            ("all", re.compile(
+                rf"(?:{_VERB} )(?:all|everything)(?: the)?(?: {noun})?{_TABLE_SUFFIX}", re.IGNORECASE)),
+        ]
+
+    def _column(self, match, group):
+        return self.spellings[match[group].lower()]
+
+    # Function to turn a question into (intent, SQL), or None when no pattern explains all of it.
+    # `stats` (see column_stats) decides how values are quoted.
+    def match(self, question, stats=None):
+        question = _COURTESY.sub("", re.sub(r"\s+", " ", question.strip()).rstrip("?.! ")).rstrip("?.!, ")
+        kinds = {column["name"]: column["kind"] for column in stats["columns"]} if stats else {}
+        table = sql_identifier(self.table_name)
+        for intent, pattern in self.patterns:
+            match = pattern.fullmatch(question)
+            if match is None:
+                continue
+            noun = match.groupdict().get("noun")
+            if intent in ("all", "filter", "top") and noun and noun.lower() in self.spellings:
+                continue  # "show all marks" asks for one column; the model writes the projection
+            condition = ""
+            if match.groupdict().get("filter"):
+                value = match["value"]
+                if value.lower() in _NOT_VALUES:
+                    continue
+                column = self._column(match, "filter")
+                condition = f" WHERE {sql_identifier(column)} = {sql_literal(value, kinds.get(column))}"
+            if intent == "all":
+                return intent, f"SELECT * FROM {table};"
+            if intent == "filter":
+                return intent, f"SELECT * FROM {table}{condition};"
+            if intent == "count":
+                if match["column"] is not None:
+                    if not match["distinct"]:
+                        continue  # "the number of marks": rows with a value, or distinct values?
+                    target = f"DISTINCT {sql_identifier(self._column(match, 'column'))}"
+                elif match["distinct"]:
+                    continue  # "how many distinct students": distinct by what?
+                else:
+                    target = "*"
+                return intent, f"SELECT COUNT({target}) FROM {table}{condition};"
+            if intent == "aggregate":
+                function = _AGGREGATES[match["function"].lower()]
+                return intent, f"SELECT {function}({sql_identifier(self._column(match, 'column'))}) FROM {table}{condition};"
+            if intent == "top":
+                direction = (match["direction"] or match["by_direction"] or match["edge"] or "").lower()
+                if not direction:
+                    continue  # "10 students by marks": which end?
+                n = match["n"].lower()
+                limit = int(n) if n.isdigit() else _NUMBER_WORDS[n]
+                order = "ASC" if direction in _ASCENDING else "DESC"
+                return intent, f"SELECT * FROM {table} ORDER BY {sql_identifier(self._column(match, 'column'))} {order} LIMIT {limit};"
+            if intent == "group_count":
+                column = sql_identifier(self._column(match, "column"))
+                return intent, f"SELECT {column}, COUNT(*) FROM {table} GROUP BY {column};"
+        return None
+
+
+# Function to get the matcher for a table schema; patterns are compiled once per schema
+@functools.lru_cache(maxsize=128)
+def compile_intents(table_name, columns):
+    return IntentMatcher(table_name, columns)
+
+
+# Function to answer a question locally: returns (intent, SQL), or None to ask the model
+def match_question(question, table_name, columns, stats=None):
+    with span("intent.match"):
+        return compile_intents(table_name, tuple(columns)).match(question, stats)
+
+
+# How often questions were answered without the model, per intent
+class IntentCounter:
+    def __init__(self):
+        self.hits = Counter()
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, intent):
+        with self._lock:
+            if intent is None:
+                self.misses += 1
+            else:
+                self.hits[intent] += 1
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            questions = hits + self.misses
+            return {
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": hits / questions if questions else 0.0,
+                "by_intent": dict(self.hits),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which questions the local matcher answers, and how.")
+    parser.add_argument("questions", help="text file with one question per line")
+    parser.add_argument("--table", default="STUDENT")
+    parser.add_argument("--columns", default="NAME,CLASS,SECTION,MARKS", help="comma-separated column names")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    counter = IntentCounter()
+    for question in questions:
+        matched = match_question(question, args.table, args.columns.split(","))
+        counter.record(matched[0] if matched else None)
+        print(f"{matched[0] if matched else 'model':>12}  {question}" + (f"\n{'':>14}{matched[1]}" if matched else ""))
+    summary = counter.stats()
+    print(f"Answered locally: {summary['hits']} of {len(questions)} questions ({summary['hit_rate']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
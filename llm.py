@@ -0,0 +1,103 @@
+import asyncio
+import os
+import re
+import threading
+import time
+
+from metrics import observe, span
+
+MODEL_NAME = "gemini-pro"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+# Function to build the Gemini model once per process; GenerativeModel is safe to reuse
+def get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
+
+
+# Function to Load Google Gemini Model and provide SQL query as response
+def get_gemini_response(question, prompt, model=None):
+    model = model or get_model()
+    with span("model.call"):
+        response = model.generate_content([prompt[0], question])
+    return response.text.strip()
+
+
+# Function to stream the response as it is generated, yielding text chunks; records the time
+# to the first chunk and to the end of the stream
+def stream_gemini_response(question, prompt, model=None):
+    model = model or get_model()
+    started = time.perf_counter()
+    first = True
+    for chunk in model.generate_content([prompt[0], question], stream=True):
+        if first:
+            observe("model.first_chunk", time.perf_counter() - started)
+            first = False
+        yield chunk.text
+    observe("model.call", time.perf_counter() - started)
+
+
+# Async variant for concurrent callers; falls back to a thread for models without an async API
+async def get_gemini_response_async(question, prompt, model=None):
+    model = model or get_model()
+    with span("model.call"):
+        if hasattr(model, "generate_content_async"):
+            response = await model.generate_content_async([prompt[0], question])
+        else:
+            response = await asyncio.to_thread(model.generate_content, [prompt[0], question])
+    return response.text.strip()
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+# Offline stand-in for GenerativeModel, for tests and load tests. Answers come from `responses`
+# (question -> SQL) when given, otherwise a COUNT(*) over the table named in the prompt, after
+# a simulated `latency` in seconds. With stream=True the answer arrives one token at a time,
+# `token_latency` seconds apart, after the same initial latency.
+class StubModel:
+    def __init__(self, latency=0.0, responses=None, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.responses = responses or {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, contents):
+        with self._lock:
+            self.calls += 1
+        prompt, question = contents[0], contents[-1]
+        if question in self.responses:
+            return StubResponse(self.responses[question])
+        match = re.search(r"table named '([^']+)'", prompt)
+        table_name = match.group(1) if match else "uploaded_data"
+        return StubResponse(f"SELECT COUNT(*) FROM {table_name};")
+
+    def generate_content(self, contents, stream=False):
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return self._stream(self._answer(contents).text)
+        return self._answer(contents)
+
+    def _stream(self, text):
+        for position, token in enumerate(re.findall(r"\s*\S+", text)):
+            if position and self.token_latency:
+                time.sleep(self.token_latency)
+            yield StubResponse(token)
+
+    async def generate_content_async(self, contents):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(contents)
@@ -0,0 +1,207 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency bucket upper bounds in seconds, exported as the Prometheus "le" label
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+# Percentiles are computed over this many most recent samples per stage
+RECENT_SAMPLES = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_NAME = "nl2sql_stage_seconds"
+# Spans are buffered and appended to the JSONL file in batches of this many lines, or once
+# this many seconds have passed since the last write
+JSONL_FLUSH_LINES = 256
+JSONL_FLUSH_SECONDS = 1.0
+
+
+# Cumulative bucket counts, sum and count since start (for Prometheus), plus a window of recent
+# samples for percentiles that follow the current load rather than the whole process lifetime
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        for position, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[position] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    # Nearest-rank percentile over the recent samples
+    def quantile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+# In-process store of per-stage latency histograms. Spans may be recorded from any thread
+# (script threads, query watchdog workers, batch runner threads). With `jsonl_path`, every span
+# is also appended there as one JSON object per line; lines are buffered and written outside the
+# histogram lock, so recording a span never waits on disk I/O.
+class MetricsStore:
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self.started = time.time()
+        self._histograms = {}
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **fields):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, **fields)
+
+    def observe(self, stage, seconds, **fields):
+        flush = False
+        line = None
+        if self.jsonl_path:
+            record = {"ts": round(time.time(), 6), "stage": stage, "seconds": round(seconds, 6), **fields}
+            line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if line is not None:
+                self._pending.append(line)
+                flush = len(self._pending) >= JSONL_FLUSH_LINES \
+                    or time.monotonic() - self._last_flush >= JSONL_FLUSH_SECONDS
+        if flush:
+            self.flush()
+
+    # Function to append the buffered spans to the JSONL file. The write lock keeps batches in
+    # order; the histogram lock is only held to take the buffer.
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+                path = self.jsonl_path
+            if lines and path:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+
+    # Function to time each step of an iterator, e.g. parsing the next chunk of an upload
+    def timed(self, iterable, stage):
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - started)
+            yield item
+
+    def summary(self):
+        with self._lock:
+            rows = []
+            for stage, histogram in sorted(self._histograms.items()):
+                row = {"stage": stage, "count": histogram.count, "total_seconds": histogram.sum,
+                       "mean_seconds": histogram.sum / histogram.count, "max_seconds": histogram.max}
+                for q in QUANTILES:
+                    row[f"p{round(q * 100)}_seconds"] = histogram.quantile(q)
+                rows.append(row)
+            return rows
+
+    # Function to render every histogram in the Prometheus text exposition format
+    def prometheus_text(self):
+        lines = [
+            f"# HELP {METRIC_NAME} Latency of each request stage in seconds.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {METRIC_NAME}_recent Percentiles over the last {RECENT_SAMPLES} samples of each stage.",
+            f"# TYPE {METRIC_NAME}_recent gauge",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                label = stage.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f'{METRIC_NAME}_bucket{{stage="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_sum{{stage="{label}"}} {histogram.sum}')
+                lines.append(f'{METRIC_NAME}_count{{stage="{label}"}} {histogram.count}')
+                for q in QUANTILES:
+                    quantile_lines.append(
+                        f'{METRIC_NAME}_recent{{stage="{label}",quantile="{q}"}} {histogram.quantile(q)}'
+                    )
+        return "\n".join(lines + quantile_lines) + "\n"
+
+    # Function to write the Prometheus text atomically, e.g. for node_exporter's textfile collector
+    def write_prometheus(self, path):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temporary, path)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started = time.time()
+
+
+_store = MetricsStore()
+atexit.register(_store.flush)
+
+
+# Function to get the process-wide metrics store
+def get_metrics():
+    return _store
+
+
+def span(stage, **fields):
+    return _store.span(stage, **fields)
+
+
+def observe(stage, seconds, **fields):
+    _store.observe(stage, seconds, **fields)
+
+
+def timed(iterable, stage):
+    return _store.timed(iterable, stage)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = _store.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to serve /metrics for Prometheus scraping from a daemon thread; only local scrapers
+# can reach it unless another host is given
+def serve_prometheus(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,45 @@
+import json
+
+import pandas as pd
+import streamlit as st
+
+import metrics
+from query_guard import read_kill_log
+
+st.set_page_config(page_title="Diagnostics")
+st.header("Diagnostics")
+st.caption("Latency of each request stage in this server process. Percentiles cover the "
+           f"last {metrics.RECENT_SAMPLES:,} samples of each stage.")
+
+store = metrics.get_metrics()
+summary = store.summary()
+
+if not summary:
+    st.info("No timings recorded yet. Ask a question or upload a file on the main page.")
+else:
+    df = pd.DataFrame(summary).set_index("stage")
+    milliseconds = df[[c for c in df.columns if c.endswith("_seconds")]] * 1000
+    milliseconds.columns = [c.replace("_seconds", "_ms") for c in milliseconds.columns]
+    table = pd.concat([df[["count"]], milliseconds.round(2)], axis=1)
+    st.dataframe(table, use_container_width=True)
+
+    # Where the time goes: total time per stage, and the tail latency of each stage
+    total_col, tail_col = st.columns(2)
+    total_col.subheader("Total time (ms)")
+    total_col.bar_chart(table["total_ms"])
+    tail_col.subheader("p95 (ms)")
+    tail_col.bar_chart(table["p95_ms"])
+
+    st.download_button("Download Prometheus text", store.prometheus_text(), file_name="nl2sql_metrics.prom",
+                       mime="text/plain")
+    st.download_button("Download summary (JSON lines)", "".join(json.dumps(row) + "\n" for row in summary),
+                       file_name="nl2sql_metrics.jsonl", mime="application/json")
+    if st.button("Reset timings"):
+        store.reset()
+        st.rerun()
+
+# Queries the watchdog stopped, most recent first
+kills = read_kill_log()
+if kills:
+    st.subheader("Stopped queries")
+    st.dataframe(pd.DataFrame(kills), use_container_width=True, hide_index=True)
@@ -0,0 +1,240 @@
+import argparse
+import functools
+import math
+import re
+import statistics
+import time
+from collections import Counter
+
+from column_stats import describe_stats
+from metrics import span
+
+# Few-shot examples as (question, query) templates; {table_name} is filled in per table
+EXAMPLES = [
+    ('How many entries of records are present in the table?',
+     'SELECT COUNT(*) FROM {table_name};'),
+    ("Tell me all the records where the column '<COLUMN_NAME>' has the value '<VALUE>'.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME> = '<VALUE>';"),
+    ("What is the average value of the column '<COLUMN_NAME>'?",
+     'SELECT AVG(<COLUMN_NAME>) FROM {table_name};'),
+    ("List all records where the column '<COLUMN_NAME1>' is '<VALUE1>' and the column '<COLUMN_NAME2>' is greater than <VALUE2>.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME1> = '<VALUE1>' AND <COLUMN_NAME2> > <VALUE2>;"),
+    ("Get the sum of the column '<COLUMN_NAME>' for records where '<COLUMN_NAME2>' is '<VALUE>'.",
+     "SELECT SUM(<COLUMN_NAME>) FROM {table_name} WHERE <COLUMN_NAME2> = '<VALUE>';"),
+    ("Retrieve the top <N> records with the highest values in the column '<COLUMN_NAME>'.",
+     'SELECT * FROM {table_name} ORDER BY <COLUMN_NAME> DESC LIMIT <N>;'),
+    ("Find the maximum value in the column '<COLUMN_NAME>'.",
+     'SELECT MAX(<COLUMN_NAME>) FROM {table_name};'),
+    ("Show the count of records grouped by the column '<COLUMN_NAME>'.",
+     'SELECT <COLUMN_NAME>, COUNT(*) FROM {table_name} GROUP BY <COLUMN_NAME>;'),
+    ("Display records where the column '<COLUMN_NAME>' is between '<VALUE1>' and '<VALUE2>'.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME> BETWEEN '<VALUE1>' AND '<VALUE2>';"),
+    ("Fetch all distinct values in the column '<COLUMN_NAME>'.",
+     'SELECT DISTINCT <COLUMN_NAME> FROM {table_name};'),
+    ("List records where the '<COLUMN_NAME1>' is greater than <VALUE1>, the '<COLUMN_NAME2>' is '<VALUE2>', and order by '<COLUMN_NAME3>' in descending order.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME1> > <VALUE1> AND <COLUMN_NAME2> = '<VALUE2>' ORDER BY <COLUMN_NAME3> DESC;"),
+    ("Calculate the average '<COLUMN_NAME1>' and the total '<COLUMN_NAME2>' for each '<COLUMN_NAME3>' where '<COLUMN_NAME4>' is '<VALUE>'.",
+     "SELECT <COLUMN_NAME3>, AVG(<COLUMN_NAME1>) AS Avg<COLUMN_NAME1>, SUM(<COLUMN_NAME2>) AS Total<COLUMN_NAME2> FROM {table_name} WHERE <COLUMN_NAME4> = '<VALUE>' GROUP BY <COLUMN_NAME3>;"),
+    ("Retrieve records where '<COLUMN_NAME1>' is between <VALUE1> and <VALUE2>, '<COLUMN_NAME2>' is '<VALUE3>', and '<COLUMN_NAME3>' is either '<VALUE4>' or '<VALUE5>'.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME1> BETWEEN <VALUE1> AND <VALUE2> AND <COLUMN_NAME2> = '<VALUE3>' AND <COLUMN_NAME3> IN ('<VALUE4>', '<VALUE5>');"),
+    ("Show the top <N> '<COLUMN_NAME1>' with the highest average '<COLUMN_NAME2>', including the count of records in each '<COLUMN_NAME1>'.",
+     'SELECT <COLUMN_NAME1>, AVG(<COLUMN_NAME2>) AS Avg<COLUMN_NAME2>, COUNT(*) AS RecordCount FROM {table_name} GROUP BY <COLUMN_NAME1> ORDER BY Avg<COLUMN_NAME2> DESC LIMIT <N>;'),
+    ("Find all records where the '<COLUMN_NAME1>' is greater than the average '<COLUMN_NAME1>' and the '<COLUMN_NAME2>' is less than <VALUE>.",
+     'SELECT * FROM {table_name} WHERE <COLUMN_NAME1> > (SELECT AVG(<COLUMN_NAME1>) FROM {table_name}) AND <COLUMN_NAME2> < <VALUE>;'),
+    ("Fetch records where the '<COLUMN_NAME1>' is not null and '<COLUMN_NAME2>' does not contain '<VALUE>'.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME1> IS NOT NULL AND <COLUMN_NAME2> NOT LIKE '%<VALUE>%';"),
+    ("List records where '<COLUMN_NAME1>' is '<VALUE1>' and either '<COLUMN_NAME2>' is '<VALUE2>' or '<COLUMN_NAME3>' is less than '<VALUE3>'.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME1> = '<VALUE1>' AND (<COLUMN_NAME2> = '<VALUE2>' OR <COLUMN_NAME3> < <VALUE3>);"),
+    ("Get the total count of records, the average value of '<COLUMN_NAME1>', and the maximum '<COLUMN_NAME2>' for records where '<COLUMN_NAME3>' is '<VALUE>'.",
+     "SELECT COUNT(*), AVG(<COLUMN_NAME1>), MAX(<COLUMN_NAME2>) FROM {table_name} WHERE <COLUMN_NAME3> = '<VALUE>';"),
+    ("Find records where the '<COLUMN_NAME1>' value is within the range of the minimum and maximum values of '<COLUMN_NAME2>' grouped by '<COLUMN_NAME3>'.",
+     'SELECT * FROM {table_name} WHERE <COLUMN_NAME1> BETWEEN (SELECT MIN(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>) AND (SELECT MAX(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>);'),
+    ("List the number of distinct '<COLUMN_NAME>' values along with their frequencies, sorted by frequency in descending order.",
+     'SELECT <COLUMN_NAME>, COUNT(*) AS Frequency FROM {table_name} GROUP BY <COLUMN_NAME> ORDER BY Frequency DESC;'),
+    ("Retrieve records where '<COLUMN_NAME1>' is in the top 5 values, and '<COLUMN_NAME2>' is not null, ordered by '<COLUMN_NAME3>'.",
+     'SELECT * FROM {table_name} WHERE <COLUMN_NAME1> IN (SELECT <COLUMN_NAME1> FROM {table_name} ORDER BY <COLUMN_NAME1> DESC LIMIT 5) AND <COLUMN_NAME2> IS NOT NULL ORDER BY <COLUMN_NAME3>;'),
+    ("Find records where the '<COLUMN_NAME1>' value is within the range of the minimum and maximum values of '<COLUMN_NAME2>' grouped by '<COLUMN_NAME3>'.",
+     'SELECT * FROM {table_name} WHERE <COLUMN_NAME1> BETWEEN (SELECT MIN(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>) AND (SELECT MAX(<COLUMN_NAME2>) FROM {table_name} GROUP BY <COLUMN_NAME3>);'),
+    ("Fetch records where '<COLUMN_NAME1>' is equal to '<VALUE1>' and '<COLUMN_NAME2>' is within the last 7 days from today.",
+     "SELECT * FROM {table_name} WHERE <COLUMN_NAME1> = '<VALUE1>' AND <COLUMN_NAME2> >= DATE_SUB(CURDATE(), INTERVAL 7 DAY);"),
+    ("Show the average '<COLUMN_NAME1>', sum of '<COLUMN_NAME2>', and count of '<COLUMN_NAME3>' for records grouped by '<COLUMN_NAME4>' having count greater than 5.",
+     'SELECT <COLUMN_NAME4>, AVG(<COLUMN_NAME1>), SUM(<COLUMN_NAME2>), COUNT(<COLUMN_NAME3>) FROM {table_name} GROUP BY <COLUMN_NAME4> HAVING COUNT(<COLUMN_NAME3>) > 5;'),
+    ('Calculate the price of one item given the total sales and total reviews, rounded to two decimal places.',
+     'SELECT ROUND(SUM(total_sale) / SUM(total_review), 2) AS item_price FROM {table_name};'),
+    ('Give me all records which month have only one record.',
+     'SELECT * FROM {table_name} WHERE EXTRACT(MONTH FROM <DATE_COLUMN>) IN (SELECT month FROM (SELECT EXTRACT(MONTH FROM <DATE_COLUMN>) AS month, COUNT(*) AS record_count FROM {table_name} GROUP BY month) AS monthly_counts WHERE record_count = 1);'),
+    ('Give all records and add a new column for single unit price (<REVENUE_COLUMN> / <UNITS_SOLD_COLUMN>) rounded to two decimal places.',
+     'SELECT *, ROUND(<REVENUE_COLUMN> / <UNITS_SOLD_COLUMN>, 2) AS Single_Unit_Price FROM {table_name};'),
+    ('Give all records and add a column showing the result of a calculation (e.g., <COLUMN_NAME1> divided by <COLUMN_NAME2>) rounded to two decimal places.',
+     'SELECT *, ROUND(<COLUMN_NAME1> / <COLUMN_NAME2>, 2) AS Calculated_Column FROM {table_name};'),
+    ('Give all records and add a column showing the result of a mathematical operation (e.g., <COLUMN_NAME> multiplied by <VALUE>) rounded to two decimal places.',
+     'SELECT *, ROUND(<COLUMN_NAME> * <VALUE>, 2) AS Calculated_Column FROM {table_name};'),
+    ('Give all records and add a column showing the monthly salary (salary divided by 12) rounded to two decimal places.',
+     'SELECT *, ROUND(salary / 12, 2) AS Monthly_Salary FROM {table_name};'),
+    ('Add a new column showing the total price (quantity * unit_price) rounded to two decimal places.',
+     'SELECT *, ROUND(quantity * unit_price, 2) AS Total_Price FROM {table_name};'),
+]
+
+PROMPT_HEADER = """
+You are an expert in converting English questions to SQL queries!
+The SQL database has a table named '{table_name}' with the following columns: {columns_str}.
+{stats_str}Here are some examples of how to convert English questions to SQL queries:
+
+"""
+
+PROMPT_FOOTER = """The SQL code should not have ``` in the beginning or end and should not include the word 'Query' in the output. Ensure that the generated SQL query is accurate and matches the requested parameters precisely.
+"""
+
+DEFAULT_TOP_K = 6
+
+# Everyday wording mapped onto the SQL vocabulary used in the example queries
+SYNONYMS = {
+    "many": "count", "number": "count", "entries": "count", "mean": "avg", "average": "avg",
+    "total": "sum", "highest": "max desc top", "largest": "max desc top", "biggest": "max desc top",
+    "maximum": "max", "lowest": "min asc", "smallest": "min asc", "minimum": "min",
+    "each": "group", "per": "group", "grouped": "group", "unique": "distinct", "different": "distinct",
+    "between": "between range", "contain": "like", "contains": "like", "missing": "null", "empty": "null",
+    "sorted": "order", "ordered": "order", "frequency": "count group", "frequencies": "count group",
+    "rounded": "round", "divided": "round calculation", "multiplied": "round calculation",
+}
+
+_PLACEHOLDER = re.compile(r"<[A-Z_0-9]+>")
+_WORD = re.compile(r"[a-z]+")
+
+
+# Function to turn text into retrieval terms, ignoring <PLACEHOLDER> tokens
+def tokenize(text):
+    terms = []
+    for word in _WORD.findall(_PLACEHOLDER.sub(" ", text).lower()):
+        terms.append(word)
+        terms.extend(SYNONYMS.get(word, "").split())
+    return terms
+
+
+# Function to roughly estimate the tokens in a prompt (about 4 characters per token)
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / 4))
+
+
+# Local TF-IDF index over the example store; no network access involved
+class ExampleIndex:
+    def __init__(self, examples=EXAMPLES):
+        self.examples = list(examples)
+        documents = [Counter(tokenize(question + " " + query)) for question, query in self.examples]
+        document_frequency = Counter(term for document in documents for term in document)
+        count = len(documents)
+        self.idf = {term: math.log((1 + count) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        self.vectors = [self._vector(document) for document in documents]
+
+    def _vector(self, counts):
+        vector = {term: tf * self.idf[term] for term, tf in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    # Return the indexes of the k examples most similar to the question, best first
+    def top_k(self, question, k=DEFAULT_TOP_K):
+        query = self._vector(Counter(tokenize(question)))
+        scores = [
+            (sum(weight * vector.get(term, 0.0) for term, weight in query.items()), position)
+            for position, vector in enumerate(self.vectors)
+        ]
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return [position for _, position in scores[:k]]
+
+
+@functools.lru_cache(maxsize=1)
+def default_index():
+    return ExampleIndex()
+
+
+# Function to render the header, examples and footer once per (table, schema, statistics)
+@functools.lru_cache(maxsize=128)
+def compile_prompt(table_name, columns, description=None):
+    stats_str = f"What the data in it looks like:\n{description}\n" if description else ""
+    header = PROMPT_HEADER.replace("{table_name}", table_name).replace("{columns_str}", ", ".join(columns)) \
+        .replace("{stats_str}", stats_str)
+    examples = tuple(
+        (question, query.replace("{table_name}", table_name)) for question, query in EXAMPLES
+    )
+    return header, examples
+
+
+# Function to build the prompt for a table. Without a question every example is included;
+# with one, only the top_k examples most relevant to it are sent to the model. `stats`, the
+# table's column statistics (see column_stats), show the model the real value domains.
+def generate_prompt(table_name, columns, question=None, top_k=None, stats=None):
+    with span("prompt.build"):
+        header, examples = compile_prompt(table_name, tuple(columns), describe_stats(stats) if stats else None)
+        if question is not None and top_k:
+            selected = sorted(default_index().top_k(question, top_k))
+            examples = [examples[position] for position in selected]
+        body = "".join(
+            f"Example {number} - {example_question}\nQuery: {query}\n\n"
+            for number, (example_question, query) in enumerate(examples, start=1)
+        )
+        return [header + body + PROMPT_FOOTER]
+
+
+# Function to compare the full prompt with the few-shot prompt on a list of questions.
+# `generate` is an optional callable (question, prompt) -> text used to time model calls,
+# and `count_tokens` an optional callable (text) -> int replacing the local estimate.
+def compare_prompts(questions, table_name, columns, top_k=DEFAULT_TOP_K, generate=None, count_tokens=None):
+    count_tokens = count_tokens or estimate_tokens
+    rows = []
+    for question in questions:
+        row = {"question": question}
+        for label, prompt in (
+            ("full", generate_prompt(table_name, columns)),
+            ("few_shot", generate_prompt(table_name, columns, question=question, top_k=top_k)),
+        ):
+            row[f"{label}_tokens"] = count_tokens(prompt[0] + question)
+            if generate is not None:
+                started = time.perf_counter()
+                generate(question, prompt)
+                row[f"{label}_seconds"] = time.perf_counter() - started
+        rows.append(row)
+
+    summary = {
+        "questions": len(rows),
+        "full_tokens": statistics.mean(row["full_tokens"] for row in rows) if rows else 0,
+        "few_shot_tokens": statistics.mean(row["few_shot_tokens"] for row in rows) if rows else 0,
+    }
+    if generate is not None and rows:
+        summary["full_seconds"] = statistics.median(row["full_seconds"] for row in rows)
+        summary["few_shot_seconds"] = statistics.median(row["few_shot_seconds"] for row in rows)
+    return {"summary": summary, "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the full prompt with the few-shot prompt.")
+    parser.add_argument("questions", help="text file with one question per line")
+    parser.add_argument("--table", default="STUDENT")
+    parser.add_argument("--columns", default="NAME,CLASS,SECTION,MARKS", help="comma-separated column names")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--live", action="store_true", help="also time real Gemini calls (needs GOOGLE_API_KEY)")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    generate = count_tokens = None
+    if args.live:
+        from dotenv import load_dotenv
+        from llm import get_gemini_response, get_model
+
+        load_dotenv()
+        generate = get_gemini_response
+        count_tokens = lambda text: get_model().count_tokens(text).total_tokens
+
+    report = compare_prompts(questions, args.table, args.columns.split(","), args.top_k, generate, count_tokens)
+    for row in report["rows"]:
+        print(f"{row['full_tokens']:>6} -> {row['few_shot_tokens']:>5} tokens  {row['question']}")
+    summary = report["summary"]
+    print(f"Average prompt: {summary['full_tokens']:.0f} -> {summary['few_shot_tokens']:.0f} tokens "
+          f"over {summary['questions']} questions")
+    if "full_seconds" in summary:
+        print(f"Median latency: {summary['full_seconds']:.2f}s -> {summary['few_shot_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
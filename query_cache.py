@@ -0,0 +1,144 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Function to normalize a question so trivially different spellings share a cache entry. Case is
+# kept, like result_cache.normalize_sql does: "section a" and "section A" may need different SQL.
+def normalize_question(question):
+    question = re.sub(r"\s+", " ", question.strip())
+    return question.rstrip("?.! ")
+
+
+# Function to fingerprint a table schema (the list returned by get_column_names)
+def schema_hash(columns):
+    return hashlib.sha256(json.dumps(list(columns)).encode("utf-8")).hexdigest()
+
+
+# Function to build the cache key for a question against a table schema
+def make_cache_key(question, table_name, columns):
+    raw = "\x1f".join([normalize_question(question), table_name, schema_hash(columns)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Two-tier question -> SQL cache: an in-process LRU backed by an on-disk SQLite store.
+# The schema hash is part of the key, so a changed table never serves stale SQL;
+# orphaned entries age out through the TTL and the size limits of each tier.
+class QueryCache:
+    def __init__(self, path=".query_cache.sqlite", max_memory_entries=256,
+                 max_disk_entries=10000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_cache (
+                cache_key TEXT PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                schema_hash TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS query_cache_last_used ON query_cache (last_used)")
+        self._conn.commit()
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    # Return the cached SQL for a question, or None on a miss
+    def get(self, question, table_name, columns):
+        key = make_cache_key(question, table_name, columns)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                sql, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return sql
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT sql, created_at FROM query_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                sql, created_at = row
+                if not self._expired(created_at, now):
+                    self._conn.execute("UPDATE query_cache SET last_used = ? WHERE cache_key = ?", (now, key))
+                    self._conn.commit()
+                    self._remember(key, sql, created_at)
+                    self.disk_hits += 1
+                    return sql
+                self._conn.execute("DELETE FROM query_cache WHERE cache_key = ?", (key,))
+                self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    # Store the SQL generated for a question in both tiers
+    def put(self, question, table_name, columns, sql):
+        key = make_cache_key(question, table_name, columns)
+        now = time.time()
+        with self._lock:
+            self._remember(key, sql, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, table_name, schema_hash(columns), sql, now, now),
+            )
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM query_cache")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key, sql, created_at):
+        self._memory[key] = (sql, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM query_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0] - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM query_cache WHERE cache_key IN "
+                "(SELECT cache_key FROM query_cache ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
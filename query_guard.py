@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# SQLite calls the progress handler every this many virtual machine instructions
+PROGRESS_OPS = 1000
+KILL_LOG = ".killed_queries.jsonl"
+
+
+# Limits applied to every guarded query: wall-clock seconds, rows materialized and the memory
+# the engine may use for temporary b-trees (sorts, GROUP BY, DISTINCT) before spilling to disk.
+# None disables a limit.
+class QueryLimits:
+    def __init__(self, timeout=30.0, max_rows=100_000, temp_store_mb=256):
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.temp_store_mb = temp_store_mb
+
+
+# A query failed for a reason other than an engine error, e.g. on a remote engine
+class QueryError(Exception):
+    pass
+
+
+class QueryAborted(QueryError):
+    def __init__(self, reason, seconds, sql=None):
+        self.reason = reason
+        self.seconds = seconds
+        self.sql = sql
+        if reason == "timeout":
+            message = f"Query stopped after exceeding the {seconds:.1f}s time limit."
+        else:
+            message = f"Query cancelled after {seconds:.1f}s."
+        super().__init__(message)
+
+
+# The state shared between a running query and whoever may stop it. SQLite polls should_abort()
+# from its progress handler; engines without one register an interrupt callback instead, which
+# is called on cancel() and, through a timer, when the deadline passes. The clock starts when
+# the guard is made; QueryWatchdog restarts it with start() once a queued query begins to run.
+class QueryGuard:
+    def __init__(self, limits=None):
+        self.limits = limits or QueryLimits()
+        self.reason = None
+        self._interrupts = []
+        self._timers = []
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.deadline = self.started + self.limits.timeout if self.limits.timeout else None
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    # Function to apply the row limit to a caller's own max_rows
+    def row_limit(self, max_rows=None):
+        if self.limits.max_rows is None:
+            return max_rows
+        return self.limits.max_rows if max_rows is None else min(max_rows, self.limits.max_rows)
+
+    def should_abort(self):
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.reason = "timeout"
+        return self.reason is not None
+
+    # Progress-handler form of should_abort: a non-zero return makes SQLite interrupt the statement
+    def progress_handler(self):
+        return 1 if self.should_abort() else 0
+
+    def on_interrupt(self, interrupt):
+        with self._lock:
+            self._interrupts.append(interrupt)
+            if self.deadline is not None:
+                timer = threading.Timer(max(self.deadline - time.monotonic(), 0), self._expire)
+                timer.daemon = True
+                timer.start()
+                self._timers.append(timer)
+
+    def release(self):
+        with self._lock:
+            for timer in self._timers:
+                timer.cancel()
+            self._interrupts = []
+            self._timers = []
+
+    def _expire(self):
+        self._abort("timeout")
+
+    def cancel(self):
+        self._abort("cancelled")
+
+    def _abort(self, reason):
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+            interrupts = list(self._interrupts)
+        for interrupt in interrupts:
+            try:
+                interrupt()
+            except Exception:  # the statement may already have finished
+                pass
+
+    # Function to turn an engine's "interrupted" error into QueryAborted when the guard caused it
+    def check(self, sql=None):
+        if self.reason is not None:
+            raise QueryAborted(self.reason, self.elapsed(), sql)
+
+
+# A guarded query running on the watchdog's worker threads
+class QueryJob:
+    def __init__(self, future, guard, sql, db, key=None):
+        self.future = future
+        self.guard = guard
+        self.sql = sql
+        self.db = db
+        self.key = key
+
+    def done(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        wait([self.future], timeout=timeout)
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def elapsed(self):
+        return self.guard.elapsed()
+
+    def cancel(self):
+        self.guard.cancel()
+
+
+# Runs generated SQL under QueryLimits, either on the caller's thread (run) or on a small
+# worker pool (submit) so the caller stays free to show progress and offer a Cancel button.
+# The guarded function must accept a `guard` keyword. Queries stopped for exceeding the time
+# limit or by a cancel are logged, with their SQL and timings, to `log_path` as JSON lines.
+class QueryWatchdog:
+    def __init__(self, limits=None, workers=2, log_path=KILL_LOG):
+        self.limits = limits or QueryLimits()
+        self.log_path = log_path
+        self.killed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-guard")
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, sql, db, guard=None, **kwargs):
+        guard = guard or QueryGuard(self.limits)
+        guard.start()  # time spent waiting for a worker does not count against the limit
+        try:
+            guard.check(sql)  # cancelled while it waited
+            return fn(*args, guard=guard, **kwargs)
+        except QueryAborted as e:
+            self._log_kill(e, sql, db, guard)
+            raise
+        finally:
+            guard.release()
+
+    def submit(self, fn, *args, sql, db, key=None, **kwargs):
+        guard = QueryGuard(self.limits)
+        future = self._executor.submit(self.run, fn, *args, sql=sql, db=db, guard=guard, **kwargs)
+        return QueryJob(future, guard, sql, db, key)
+
+    def _log_kill(self, error, sql, db, guard):
+        record = {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "reason": error.reason,
+            "seconds": round(error.seconds, 3),
+            "timeout": guard.limits.timeout,
+            "db": db,
+            "sql": sql,
+        }
+        logger.warning("Stopped query (%s after %.1fs) on %s: %s", error.reason, error.seconds, db, sql)
+        with self._lock:
+            self.killed += 1
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def recent_kills(self, limit=20):
+        with self._lock:
+            return read_kill_log(self.log_path, limit) if self.log_path else []
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to read the most recent stopped queries from a watchdog log, newest first
+def read_kill_log(path=KILL_LOG, limit=20):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()[-limit:]
+    return [json.loads(line) for line in reversed(lines)]
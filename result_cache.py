@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from connections import file_fingerprint
+
+
+# Function to normalize SQL for cache keys; literals keep their case
+def normalize_sql(sql):
+    sql = sql.replace("```sql", "").replace("```", "")
+    return re.sub(r"\s+", " ", sql).strip().rstrip(";").strip()
+
+
+# Functions whose value changes between runs on identical data
+_NONDETERMINISTIC = re.compile(r"\b(random|randomblob|changes|last_insert_rowid)\s*\(|'now'|\bcurrent_(date|time|timestamp)\b",
+                               re.IGNORECASE)
+
+
+# Function to tell whether a query's result depends only on the database content
+def is_cacheable(sql):
+    return re.match(r"^\s*(select|with|values)\b", sql, re.IGNORECASE) is not None \
+        and _NONDETERMINISTIC.search(sql) is None
+
+
+class ResultCacheKey:
+    def __init__(self, db, fingerprint, digest):
+        self.db = db
+        self.fingerprint = fingerprint
+        self.digest = digest
+
+
+# Cache of executed query results, keyed by (database path, content fingerprint, normalized
+# SQL, parameters). Results are held as Arrow tables in memory within `memory_budget` bytes;
+# least recently used tables spill to Parquet files in `directory`, which is itself bounded by
+# `disk_budget` bytes. Any write to the database changes its fingerprint, so stale results are
+# never returned, and entries for superseded fingerprints are dropped when first noticed.
+class ResultCache:
+    def __init__(self, directory=".result_cache", memory_budget=256 * 1024 * 1024,
+                 disk_budget=2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # digest -> (key, pa.Table)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # digest -> (size in bytes, db or None), oldest first
+        self._fingerprints = {}  # db -> latest fingerprint seen
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_disk_index()
+
+    def _load_disk_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, name[:-len(".parquet")], stat.st_size))
+        for _, digest, size in sorted(files):
+            self._disk[digest] = (size, None)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + ".parquet")
+
+    # Function to build the key for a query; compute it *before* executing the query so a
+    # write racing with execution cannot file the result under the newer fingerprint
+    def key(self, db, sql, params=()):
+        db = os.path.abspath(db)
+        fingerprint = file_fingerprint(db)
+        raw = json.dumps([db, list(fingerprint), normalize_sql(sql), list(params)], default=str)
+        return ResultCacheKey(db, fingerprint, hashlib.sha256(raw.encode("utf-8")).hexdigest())
+
+    # Return the cached result as an Arrow table, or None on a miss
+    def get(self, key):
+        with self._lock:
+            self._note_fingerprint(key)
+            entry = self._memory.get(key.digest)
+            if entry is not None:
+                self._memory.move_to_end(key.digest)
+                self.memory_hits += 1
+                table = entry[1]
+            elif key.digest in self._disk:
+                try:
+                    table = pq.read_table(self._path(key.digest))
+                except (OSError, pa.ArrowException):
+                    self._drop_disk(key.digest)
+                    self.misses += 1
+                    return None
+                self._drop_disk(key.digest)
+                self._remember(key, table)
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                return None
+        return table
+
+    # Store an Arrow table result
+    def put(self, key, table):
+        with self._lock:
+            self._note_fingerprint(key)
+            if self._fingerprints.get(key.db) != key.fingerprint:
+                return False  # the database changed while the query ran
+            self._remember(key, table)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for digest in list(self._disk):
+                self._drop_disk(digest)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes(),
+            }
+
+    def _note_fingerprint(self, key):
+        current = file_fingerprint(key.db) if os.path.exists(key.db) else None
+        previous = self._fingerprints.get(key.db)
+        if previous is not None and previous != current:
+            for digest, (entry_key, table) in list(self._memory.items()):
+                if entry_key.db == key.db:
+                    del self._memory[digest]
+                    self._memory_bytes -= table.nbytes
+            for digest, (_, db) in list(self._disk.items()):
+                if db == key.db:
+                    self._drop_disk(digest)
+        self._fingerprints[key.db] = current
+
+    def _remember(self, key, table):
+        if table.nbytes > self.memory_budget:
+            self._spill(key, table)
+            return
+        previous = self._memory.pop(key.digest, None)
+        if previous is not None:
+            self._memory_bytes -= previous[1].nbytes
+        self._memory[key.digest] = (key, table)
+        self._memory_bytes += table.nbytes
+        while self._memory_bytes > self.memory_budget:
+            _, (evicted_key, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self._spill(evicted_key, evicted)
+
+    def _spill(self, key, table):
+        if self.disk_budget <= 0:
+            return
+        path = self._path(key.digest)
+        try:
+            pq.write_table(table, path)
+        except (OSError, pa.ArrowException):  # e.g. a column type Parquet cannot store
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        self._disk[key.digest] = (os.path.getsize(path), key.db)
+        self._disk.move_to_end(key.digest)
+        while self._disk_bytes() > self.disk_budget and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+
+    def _disk_bytes(self):
+        return sum(size for size, _ in self._disk.values())
+
+    def _drop_disk(self, digest):
+        self._disk.pop(digest, None)
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
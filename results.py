@@ -0,0 +1,168 @@
+import re
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from backends import code_text, get_backend, strip_statement
+from connections import quote_identifier
+from metrics import span
+from result_cache import is_cacheable
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_MAX_ROWS = 100_000
+_MIN_ROWID = -(2 ** 63)
+
+# Plain "SELECT * FROM table" (the "show all" shortcut) can be paged by rowid instead of OFFSET
+_WHOLE_TABLE = re.compile(r'^select\s+\*\s+from\s+(?:"([^"]+)"|(\w+))\s*$', re.IGNORECASE)
+# Statements that can be wrapped as "SELECT * FROM (<sql>) LIMIT ? OFFSET ?"
+_PAGEABLE = re.compile(r"^\s*(select|with|values)\b", re.IGNORECASE)
+# Keywords that make a WITH statement (or anything else) change the database
+_WRITES = re.compile(r"\b(insert|update|delete|replace\s+into|create|drop|alter|attach|detach|pragma|vacuum|reindex)\b",
+                     re.IGNORECASE)
+
+
+# Function to clean SQL query from markdown or any unwanted characters
+def clean_sql(sql):
+    return sql.replace("```sql", "").replace("```", "").strip()
+
+
+# Function to tell whether SQL is one read-only SELECT (or WITH ... SELECT) statement: no
+# second statement and no data-changing keyword outside strings and comments
+def is_single_select(sql):
+    code = code_text(strip_statement(clean_sql(sql)))
+    return re.match(r"^\s*(select|with)\b", code, re.IGNORECASE) is not None and ";" not in code \
+        and _WRITES.search(code) is None
+
+
+# Function to round numeric columns the way results have always been displayed. Only floating
+# point columns are touched (rounding integers changes nothing), one vectorized pass each;
+# every other column is passed through without a copy.
+def round_numeric(table, decimals=2):
+    for position, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            table = table.set_column(position, field, pc.round(table.column(position), decimals))
+    return table
+
+
+# Function to answer a query from the column statistics gathered at ingest (see column_stats),
+# as a rounded Arrow table; None when it has to run
+def query_stats(sql, db):
+    table = get_backend(db).query_stats(sql)
+    return round_numeric(table) if table is not None else None
+
+
+# Function to run a query on the database's backend and return a rounded Arrow table.
+# Errors are raised to the caller; max_rows limits how many rows are materialized. Simple
+# aggregates are answered from the column statistics; with a result_cache, repeated queries
+# on an unchanged database skip execution entirely; with a query_guard.QueryGuard, execution
+# is stopped when it runs out of time or is cancelled.
+def query_table(sql, db, params=(), max_rows=None, result_cache=None, guard=None):
+    if not params:
+        table = query_stats(sql, db)
+        if table is not None:
+            return table if max_rows is None else table.slice(0, max_rows)
+
+    cache_key = None
+    if result_cache is not None and is_cacheable(sql):
+        cache_key = result_cache.key(db, sql, [*params, max_rows])
+        table = result_cache.get(cache_key)
+        if table is not None:
+            return table
+
+    table = get_backend(db).query_arrow(sql, params, max_rows, guard)
+    with span("frame.round"):
+        table = round_numeric(table)
+    if cache_key is not None:
+        result_cache.put(cache_key, table)
+    return table
+
+
+# Function to run a query like query_table but return a pandas DataFrame
+def query_frame(sql, db, params=(), max_rows=None, result_cache=None, guard=None):
+    return query_table(sql, db, params, max_rows, result_cache, guard).to_pandas()
+
+
+def read_dataframe(sql, db, max_rows=None, result_cache=None, guard=None):
+    return query_frame(clean_sql(sql), db, max_rows=max_rows, result_cache=result_cache, guard=guard)
+
+
+# Function to run a query and return the backend's Arrow table as-is (no pandas, no rounding)
+def query_arrow(sql, db, params=(), max_rows=None, guard=None):
+    return get_backend(db).query_arrow(clean_sql(sql), params, max_rows, guard)
+
+
+# Function to check generated SQL against a database without executing it (EXPLAIN only
+# compiles/plans the statement). Raises one of backends.QUERY_ERRORS for SQL that cannot run.
+def validate_sql(sql, db):
+    with span("sql.validate"):
+        get_backend(db).validate(clean_sql(sql))
+
+
+# A lazily fetched, paginated view over the result of one query. Nothing is executed until a
+# page is requested and at most page_size + 1 rows are read per page, so the first page costs
+# the same whatever the size of the full result. No connection is held between pages, which
+# keeps the window safe to park in st.session_state without blocking writers;
+# pages are read through the database's backend and, when given, the result cache.
+class ResultWindow:
+    def __init__(self, sql, db, page_size=DEFAULT_PAGE_SIZE, max_rows=DEFAULT_MAX_ROWS, result_cache=None):
+        self.sql = strip_statement(clean_sql(sql))
+        self.db = db
+        self.max_rows = max_rows
+        self.result_cache = result_cache
+        self.schema = None
+        self.has_more = False
+        self.capped = False
+        match = _WHOLE_TABLE.match(self.sql)
+        table_name = (match.group(1) or match.group(2)) if match else None
+        self.table = table_name if table_name and get_backend(db).rowid_table(table_name) else None
+        self.pageable = bool(_PAGEABLE.match(self.sql))
+        self.set_page_size(page_size)
+
+    def set_page_size(self, page_size):
+        self.page_size = page_size
+        # Last rowid seen before each page; only used for keyset pagination
+        self._rowid_bounds = [_MIN_ROWID]
+
+    def page_start(self, page):
+        return page * self.page_size
+
+    def _empty(self):
+        return self.schema.empty_table() if self.schema is not None else pa.table({})
+
+    # Fetch one page (0-based) as a rounded Arrow table, ready for st.dataframe as-is
+    def fetch_page(self, page, guard=None):
+        start = self.page_start(page)
+        limit = min(self.page_size, self.max_rows - start)
+        if limit <= 0 or (not self.pageable and page > 0):
+            return self._empty()
+
+        # Simple aggregates come from the column statistics without touching the table
+        answer = query_stats(self.sql, self.db) if self.table is None else None
+        if answer is not None:
+            table = answer.slice(start, limit + 1)
+        else:
+            if self.table is not None:
+                while len(self._rowid_bounds) <= page:
+                    self.fetch_page(len(self._rowid_bounds) - 1, guard)
+                    if not self.has_more:
+                        return self._empty()
+                sql = f"SELECT rowid, * FROM {quote_identifier(self.table)} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+                params = (self._rowid_bounds[page], limit + 1)
+            elif self.pageable:
+                sql = f"SELECT * FROM ({self.sql}\n) LIMIT ? OFFSET ?"
+                params = (limit + 1, start)
+            else:
+                sql, params = self.sql, ()
+            table = query_table(sql, self.db, params, max_rows=limit + 1,
+                                result_cache=self.result_cache if self.pageable else None, guard=guard)
+        more = table.num_rows > limit
+        table = table.slice(0, limit)
+        if self.table is not None:
+            if table.num_rows and len(self._rowid_bounds) == page + 1:
+                self._rowid_bounds.append(table.column(0)[-1].as_py())
+            table = table.remove_column(0)
+
+        self.schema = table.schema
+        self.capped = more and start + limit >= self.max_rows
+        self.has_more = more and not self.capped
+        return table
@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+from backends import QUERY_ERRORS
+from results import clean_sql, is_single_select, validate_sql
+
+
+# Follows a streamed model response. As soon as the text received so far holds a complete SQL
+# statement, it is validated with EXPLAIN against the database, while the rest of the response
+# (usually just the closing code fence) is still arriving, and `on_valid(sql)` is called so
+# execution can start before the stream ends. Anything but a single SELECT is rejected at that
+# point without being validated or passed on. Iterating yields the accumulated text after each
+# chunk. Once the stream ends, the final SQL is checked again only if it differs from the SQL
+# that was already checked.
+class SqlStream:
+    def __init__(self, chunks, db, on_valid=None):
+        self.chunks = chunks
+        self.db = db
+        self.on_valid = on_valid
+        self.text = ""
+        self.sql = None
+        self.error = None
+        self.checked_sql = None
+        self.first_chunk_seconds = None
+        self.complete_seconds = None
+        self.seconds = None
+
+    def __iter__(self):
+        started = time.perf_counter()
+        for chunk in self.chunks:
+            if self.first_chunk_seconds is None:
+                self.first_chunk_seconds = time.perf_counter() - started
+            self.text += chunk
+            if self.checked_sql is None:
+                sql = clean_sql(self.text)
+                if sqlite3.complete_statement(sql):
+                    self.complete_seconds = time.perf_counter() - started
+                    self._check(sql)
+            yield self.text
+        self.seconds = time.perf_counter() - started
+        self.sql = clean_sql(self.text)
+        if self.sql and self.sql != self.checked_sql:
+            self._check(self.sql)
+
+    @property
+    def valid(self):
+        return bool(self.sql) and self.sql == self.checked_sql and self.error is None
+
+    def _check(self, sql):
+        self.checked_sql = sql
+        if not is_single_select(sql):
+            self.error = ValueError("Only single SELECT statements can be run.")
+            return
+        try:
+            validate_sql(sql, self.db)
+        except QUERY_ERRORS as e:
+            self.error = e
+            return
+        self.error = None
+        if self.on_valid is not None:
+            self.on_valid(sql)
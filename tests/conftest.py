@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connections import close_pool  # noqa: E402
+from backends import close_backend  # noqa: E402
+
+
+@pytest.fixture
+def student_frame():
+    return pd.DataFrame({
+        "NAME": ["Asha", "Ben", "Chen", "Dina", "Eli", "Fay"],
+        "CLASS": ["Data Science", "Data Science", "DEVOPS", "DEVOPS", "Data Science", "AI"],
+        "SECTION": ["A", "B", "A", "A", "B", "C"],
+        "MARKS": [91, 75, 60, 88, 75, 99],
+    })
+
+
+# A fresh database path; pooled connections and backends are closed afterwards
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "student.db")
+    yield path
+    close_pool(path)
+    close_backend(path)
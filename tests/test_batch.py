@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+import batch
+import ingest
+from batch import BatchRunner, TokenBucket
+from llm import StubModel
+from query_cache import QueryCache
+
+COLUMNS = ["NAME", "CLASS", "SECTION", "MARKS"]
+
+
+@pytest.fixture
+def target(db_path, student_frame, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the watchdog logs stopped queries to the working directory
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    return ("student", db_path, "STUDENT", COLUMNS)
+
+
+@pytest.fixture
+def query_cache(tmp_path):
+    cache = QueryCache(str(tmp_path / "query_cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def run(runner, questions, target):
+    try:
+        return {record["question"]: record for record in runner.run(questions, [target])}
+    finally:
+        runner.watchdog.shutdown()
+
+
+def test_token_bucket_allows_a_burst_then_paces_at_the_rate():
+    async def acquire(bucket, times):
+        started = time.monotonic()
+        for _ in range(times):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(acquire(TokenBucket(rate=20, capacity=5), 5)) < 0.05
+    assert asyncio.run(acquire(TokenBucket(rate=20, capacity=1), 5)) >= 0.15
+
+
+def test_runner_caches_only_sql_that_ran(target, query_cache):
+    model = StubModel(responses={
+        "top students": "SELECT NAME FROM STUDENT ORDER BY MARKS DESC LIMIT 2;",
+        "drop them": "DROP TABLE STUDENT;",
+        "two statements": "SELECT 1; SELECT 2;",
+        "typo": "SELECT NAM FROM STUDENT;",
+    })
+    records = run(BatchRunner(model, rate=100, query_cache=query_cache),
+                  ["top students", "drop them", "two statements", "typo"], target)
+    assert records["top students"]["status"] == "ok"
+    assert records["top students"]["preview"] == '[{"NAME":"Fay"},{"NAME":"Asha"}]'
+    assert records["drop them"]["status"] == "sql_error"
+    assert records["two statements"]["status"] == "sql_error"
+    assert records["typo"]["status"] == "sql_error"
+    assert query_cache.get("top students", "STUDENT", COLUMNS) is not None
+    for question in ("drop them", "two statements", "typo"):
+        assert query_cache.get(question, "STUDENT", COLUMNS) is None
+
+    records = run(BatchRunner(StubModel(), rate=100, query_cache=query_cache), ["top students"], target)
+    assert records["top students"]["cached"] is True
+    assert records["top students"]["row_count"] == 2
+
+
+def test_one_failing_question_does_not_lose_the_others(target, monkeypatch):
+    read_dataframe = batch.read_dataframe
+
+    def flaky(sql, *args, **kwargs):
+        if "MARKS" in sql:
+            raise RuntimeError("disk on fire")
+        return read_dataframe(sql, *args, **kwargs)
+
+    monkeypatch.setattr(batch, "read_dataframe", flaky)
+    model = StubModel(responses={"marks": "SELECT MARKS FROM STUDENT;"})
+    records = run(BatchRunner(model, rate=100), ["marks", "how many"], target)
+    assert records["marks"]["status"] == "error"
+    assert "disk on fire" in records["marks"]["error"]
+    assert records["how many"]["status"] == "ok"
+    assert records["how many"]["row_count"] == 1
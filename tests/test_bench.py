@@ -0,0 +1,19 @@
+from bench import find_regressions
+
+
+def _results(status, total_ms):
+    record = {"size": "10k", "query": "q19", "status": status, "error": None if status == "ok" else "boom"}
+    metrics = {"10k/ingest.rows_per_sec": 1000.0}
+    if total_ms is not None:
+        metrics["10k/q19.total_ms"] = total_ms
+    return {"metrics": metrics, "queries": [record]}
+
+
+def test_newly_failing_query_is_a_regression():
+    regressions = find_regressions(_results("error", None), _results("ok", 5.0))
+    assert [(r["metric"], r["current"]) for r in regressions] == [("10k/q19.status", "error")]
+
+
+def test_slower_query_is_a_regression_and_noise_is_not():
+    assert [r["metric"] for r in find_regressions(_results("ok", 20.0), _results("ok", 5.0))] == ["10k/q19.total_ms"]
+    assert find_regressions(_results("ok", 5.5), _results("ok", 5.0)) == []
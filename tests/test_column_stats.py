@@ -0,0 +1,86 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import ingest
+from results import query_stats
+
+ANSWERED = [
+    "SELECT COUNT(*) FROM STUDENT",
+    "SELECT COUNT(*) AS total FROM STUDENT;",
+    "SELECT COUNT(MARKS), COUNT(DISTINCT MARKS) FROM STUDENT",
+    "SELECT COUNT(DISTINCT SECTION) FROM STUDENT",
+    "SELECT MIN(MARKS), MAX(MARKS) FROM STUDENT",
+    "SELECT MIN(NAME), MAX(NAME) FROM STUDENT",
+    "SELECT SECTION, COUNT(*) FROM STUDENT GROUP BY SECTION",
+    "SELECT SECTION, COUNT(*) FROM STUDENT GROUP BY SECTION ORDER BY SECTION DESC",
+    "SELECT SECTION, COUNT(*) AS n FROM STUDENT GROUP BY SECTION ORDER BY n DESC LIMIT 1",
+    "SELECT MARKS, COUNT(*) FROM STUDENT GROUP BY MARKS",
+]
+
+
+@pytest.fixture
+def student_db(db_path, student_frame):
+    frame = student_frame.astype({"MARKS": "float64"})
+    frame.loc[2, "MARKS"] = None
+    ingest.write_chunks(ingest.iter_frame_chunks(frame, chunksize=4), db_path, "STUDENT")
+    return db_path
+
+
+def run(db_path, sql):
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.execute(sql)
+        return [column[0] for column in cursor.description], [list(row) for row in cursor.fetchall()]
+
+
+def answered(db_path, sql):
+    table = query_stats(sql, db_path)
+    if table is None:
+        return None
+    return table.column_names, [list(row.values()) for row in table.to_pylist()]
+
+
+@pytest.mark.parametrize("sql", ANSWERED)
+def test_stats_answers_match_sqlite(student_db, sql):
+    assert answered(student_db, sql) == run(student_db, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT AVG(MARKS) FROM STUDENT",
+    "SELECT COUNT(*) FROM STUDENT WHERE MARKS > 80",
+    "SELECT NAME FROM STUDENT",
+    "SELECT SECTION, COUNT(*) FROM STUDENT GROUP BY SECTION ORDER BY NAME",
+    "SELECT COUNT(*) FROM MISSING",
+])
+def test_other_queries_are_not_answered(student_db, sql):
+    assert query_stats(sql, student_db) is None
+
+
+def test_writes_outside_ingest_make_the_stats_stale(student_db):
+    with sqlite3.connect(student_db) as conn:
+        conn.execute("INSERT INTO STUDENT VALUES ('Gil', 'AI', 'C', 70)")
+    assert query_stats("SELECT COUNT(*) FROM STUDENT", student_db) is None
+    assert run(student_db, "SELECT COUNT(*) FROM STUDENT")[1] == [[7]]
+
+
+def test_key_upsert_that_changes_rows_makes_the_stats_stale(student_db, student_frame):
+    changed = student_frame.iloc[:1].assign(MARKS=50.0)
+    ingest.upsert_chunks(ingest.iter_frame_chunks(changed), student_db, "STUDENT", key="NAME")
+    assert query_stats("SELECT MIN(MARKS) FROM STUDENT", student_db) is None
+
+
+def test_position_upsert_rebuilds_the_stats(student_db, student_frame):
+    frame = student_frame.astype({"MARKS": "float64"}).iloc[:4]
+    ingest.upsert_chunks(ingest.iter_frame_chunks(frame), student_db, "STUDENT")
+    for sql in ("SELECT COUNT(*), MIN(MARKS), MAX(MARKS) FROM STUDENT",
+                "SELECT SECTION, COUNT(*) FROM STUDENT GROUP BY SECTION"):
+        assert answered(student_db, sql) == run(student_db, sql)
+
+
+def test_approximate_distinct_counts_are_not_answered(db_path):
+    frame = pd.DataFrame({"ID": range(3000), "BUCKET": [i % 3 for i in range(3000)]})
+    ingest.write_chunks(ingest.iter_frame_chunks(frame, chunksize=1000), db_path, "STUDENT")
+    assert query_stats("SELECT COUNT(DISTINCT ID) FROM STUDENT", db_path) is None
+    assert answered(db_path, "SELECT COUNT(DISTINCT BUCKET), MAX(ID) FROM STUDENT") == \
+        run(db_path, "SELECT COUNT(DISTINCT BUCKET), MAX(ID) FROM STUDENT")
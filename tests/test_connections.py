@@ -0,0 +1,67 @@
+import os
+import sqlite3
+
+import pytest
+
+import ingest
+from connections import SchemaCatalog, close_pool, get_pool
+
+
+@pytest.fixture
+def student_db(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    return db_path
+
+
+def test_catalog_reuses_names_until_the_schema_changes(student_db):
+    catalog = SchemaCatalog()
+    assert catalog.table_names(student_db) == ["STUDENT"]
+    assert catalog.column_names("STUDENT", student_db) == ["NAME", "CLASS", "SECTION", "MARKS"]
+    misses = catalog.misses
+
+    with sqlite3.connect(student_db) as conn:
+        conn.execute("INSERT INTO STUDENT VALUES ('Gil', 'AI', 'C', 70)")
+    assert catalog.table_names(student_db) == ["STUDENT"]
+    assert catalog.misses == misses  # same schema version: the cached names are still valid
+
+    with sqlite3.connect(student_db) as conn:
+        conn.execute("ALTER TABLE STUDENT ADD COLUMN AGE INTEGER")
+    assert catalog.column_names("STUDENT", student_db) == ["NAME", "CLASS", "SECTION", "MARKS", "AGE"]
+    assert catalog.misses == misses + 1
+
+
+def test_catalog_sees_tables_added_by_ingest(student_db, student_frame):
+    catalog = SchemaCatalog()
+    assert catalog.table_names(student_db) == ["STUDENT"]
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), student_db, "TEACHER")
+    assert sorted(catalog.table_names(student_db)) == ["STUDENT", "TEACHER"]
+
+
+def test_catalog_rereads_stats_after_a_write(student_db):
+    catalog = SchemaCatalog()
+    assert catalog.table_stats("STUDENT", student_db)["stale"] is False
+    with sqlite3.connect(student_db) as conn:
+        conn.execute("DELETE FROM STUDENT WHERE NAME = 'Asha'")
+    assert catalog.table_stats("STUDENT", student_db)["stale"] is True
+
+
+def test_catalog_lists_new_databases(tmp_path, student_frame):
+    catalog = SchemaCatalog()
+    assert catalog.databases(str(tmp_path)) == {}
+    path = str(tmp_path / "school.db")
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), path, "STUDENT")
+    assert catalog.databases(str(tmp_path)) == {"school": path}
+    close_pool(path)
+
+
+def test_pool_connections_are_read_only_and_follow_a_replaced_file(student_db, student_frame):
+    pool = get_pool(student_db)
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM STUDENT").fetchone()[0] == 6
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM STUDENT")
+
+    os.remove(student_db)
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame.iloc[:2]), student_db, "STUDENT")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM STUDENT").fetchone()[0] == 2
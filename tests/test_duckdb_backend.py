@@ -0,0 +1,53 @@
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+import backends  # noqa: E402
+from backends import close_backend, get_backend, is_read_only_statement, write_parquet_chunks  # noqa: E402
+from ingest import iter_frame_chunks  # noqa: E402
+
+
+@pytest.fixture
+def columnar_db(tmp_path, student_frame):
+    db = str(tmp_path / "student.parquetdb")
+    write_parquet_chunks(iter_frame_chunks(student_frame), db, "STUDENT")
+    yield db
+    close_backend(db)
+
+
+def test_semicolons_in_strings_are_allowed(columnar_db):
+    assert is_read_only_statement("SELECT 'a;b' AS x;")
+    assert not is_read_only_statement("SELECT 1; SELECT 2")
+    table = get_backend(columnar_db).query_arrow("SELECT COUNT(*) AS n FROM STUDENT WHERE NAME <> 'a;b';")
+    assert table.column("n").to_pylist() == [6]
+
+
+def test_other_files_cannot_be_read(tmp_path, columnar_db):
+    secret = tmp_path / "secret.csv"
+    secret.write_text("x\n1\n")
+    backend = get_backend(columnar_db)
+    for sql in (f"SELECT * FROM read_csv('{secret}')", f"SELECT * FROM '{secret}'"):
+        with pytest.raises(duckdb.Error):
+            backend.query_arrow(sql)
+    with pytest.raises(duckdb.Error):
+        backend.query_arrow("SELECT current_setting('enable_external_access') AS x; SET enable_external_access = true")
+
+
+def test_memory_limit_is_set_once_per_connection(columnar_db):
+    backend = get_backend(columnar_db)
+    table = backend.query_arrow("SELECT current_setting('memory_limit') AS memory_limit")
+    assert table.column("memory_limit")[0].as_py().replace(" ", "").endswith(("MiB", "MB"))
+    assert backends.DUCKDB_MEMORY_LIMIT_MB > 0
+
+
+def test_file_reads_are_recognized_for_older_duckdb():
+    assert backends.reads_files("SELECT * FROM read_parquet('/etc/x.parquet')")
+    assert backends.reads_files("SELECT * FROM STUDENT JOIN '/tmp/other.csv' USING (NAME)")
+    assert not backends.reads_files("SELECT * FROM STUDENT WHERE NAME = 'read_csv(x)'")
+
+
+def test_new_tables_are_visible_after_lockdown(columnar_db, student_frame):
+    backend = get_backend(columnar_db)
+    backend.query_arrow("SELECT COUNT(*) FROM STUDENT")
+    write_parquet_chunks(iter_frame_chunks(student_frame.head(2)), columnar_db, "ALUMNI")
+    assert backend.query_arrow("SELECT COUNT(*) AS n FROM ALUMNI").column("n").to_pylist() == [2]
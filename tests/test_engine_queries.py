@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pandas as pd
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+
+import api
+import ingest
+from engine import Engine
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch, student_frame):
+    monkeypatch.chdir(tmp_path)  # the engine's caches and advisor store live in the working directory
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), str(tmp_path / "student.db"), "STUDENT")
+    engine = Engine(root_dir=str(tmp_path), secret="test")
+    yield engine
+    engine.watchdog.shutdown()
+
+
+def _db(engine):
+    return engine.databases()["student"]
+
+
+def test_open_query_refuses_anything_but_one_select(engine):
+    for sql in ("UPDATE STUDENT SET MARKS = 0", "SELECT 1; DELETE FROM STUDENT",
+                "WITH x AS (SELECT 1) DELETE FROM STUDENT"):
+        with pytest.raises(ValueError):
+            engine.open_query(sql, _db(engine))
+
+
+def test_advise_only_takes_queries_the_engine_generated(engine):
+    db = _db(engine)
+    opened = engine.open_query("SELECT * FROM STUDENT WHERE NAME = 'Asha'", db)
+    with pytest.raises(ValueError):
+        engine.advise(opened, "STUDENT")
+    with pytest.raises(KeyError):
+        engine.advise("not-a-query-id", "STUDENT")
+    forged = Engine(root_dir=engine.root_dir, secret="other").open_query("SELECT * FROM STUDENT", db)
+    with pytest.raises(KeyError):
+        engine.advise(forged, "STUDENT")
+
+    result = engine.ask("show students where name is Asha", db, "STUDENT")
+    assert result["intent"] == "filter"
+    for _ in range(2):
+        advice = engine.advise(result["query_id"], "STUDENT")
+    assert [item["column"] for item in advice["recommendations"]] == ["NAME"]
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT SUM(MARKS) FROM STUDENT").fetchone() == (488,)
+
+
+class ApiTest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.engine = Engine(root_dir=self._tmp, secret="test")
+        return api.make_app(self.engine)
+
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self._cwd = os.getcwd()
+        os.chdir(self._tmp)
+        frame = pd.DataFrame({"NAME": ["Asha", "Ben"], "MARKS": [91, 75]})
+        ingest.write_chunks(ingest.iter_frame_chunks(frame), os.path.join(self._tmp, "student.db"), "STUDENT")
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.engine.watchdog.shutdown()
+        os.chdir(self._cwd)
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def post(self, path, body):
+        return self.fetch(path, method="POST", body=json.dumps(body))
+
+    def test_missing_question_is_a_bad_request(self):
+        response = self.post("/api/ask", {"database": "student", "table": "STUDENT"})
+        assert response.code == 400
+        assert "question" in json.loads(response.body)["error"]
+
+    def test_client_sql_is_not_advised_on(self):
+        response = self.post("/api/queries", {"database": "student", "sql": "DELETE FROM STUDENT"})
+        assert response.code == 400
+        opened = json.loads(self.post("/api/queries", {"database": "student", "sql": "SELECT * FROM STUDENT"}).body)
+        response = self.post("/api/advise", {"query_id": opened["query_id"], "table": "STUDENT"})
+        assert response.code == 400
+        response = self.post("/api/advise", {"query_id": "bogus", "table": "STUDENT"})
+        assert response.code == 404
+
+    def test_page_size_must_be_a_positive_whole_number_within_the_limit(self):
+        for page_size in ("abc", 0, -5, 1.5, True, api.MAX_PAGE_SIZE + 1):
+            response = self.post("/api/queries", {"database": "student", "sql": "SELECT * FROM STUDENT",
+                                                  "page_size": page_size})
+            assert response.code == 400, page_size
+            response = self.post("/api/ask", {"database": "student", "table": "STUDENT",
+                                              "question": "how many rows are there", "page_size": page_size})
+            assert response.code == 400, page_size
+        opened = json.loads(self.post("/api/queries", {"database": "student", "sql": "SELECT * FROM STUDENT",
+                                                       "page_size": 1}).body)
+        for page_size in ("abc", "0", "-1"):
+            response = self.fetch(f"/api/queries/{opened['query_id']}?page_size={page_size}")
+            assert response.code == 400, page_size
+        page = json.loads(self.fetch(f"/api/queries/{opened['query_id']}/pages/1?page_size=1").body)
+        assert page["data"] == [["Ben", 75]]
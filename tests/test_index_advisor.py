@@ -0,0 +1,52 @@
+import sqlite3
+
+import ingest
+from index_advisor import IndexAdvisor, time_query
+from query_guard import QueryLimits
+
+COLUMNS = ["NAME", "CLASS", "SECTION", "MARKS"]
+
+
+def _advisor(tmp_path, db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    advisor = IndexAdvisor(path=str(tmp_path / "advisor.sqlite"), min_selectivity=0)
+    advisor.profile_table(db_path, "STUDENT")
+    return advisor
+
+
+def _indexes(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[1] for row in conn.execute("PRAGMA index_list(STUDENT)")]
+
+
+def test_recorded_dml_is_never_replayed(tmp_path, db_path, student_frame):
+    advisor = _advisor(tmp_path, db_path, student_frame)
+    sql = "UPDATE STUDENT SET MARKS = 0 WHERE NAME = 'Asha'"
+    for _ in range(2):
+        assert advisor.record_query(db_path, "STUDENT", sql, COLUMNS) == {}
+        assert advisor.maintain(db_path, "STUDENT")["recommendations"] == []
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT MARKS FROM STUDENT WHERE NAME = 'Asha'").fetchone() == (91,)
+    assert not any(name.startswith("nl2sql_idx_") for name in _indexes(db_path))
+
+
+def test_select_is_indexed_and_timed(tmp_path, db_path, student_frame):
+    advisor = _advisor(tmp_path, db_path, student_frame)
+    sql = "SELECT * FROM STUDENT WHERE NAME = 'Asha'"
+    for _ in range(2):
+        advisor.record_query(db_path, "STUDENT", sql, COLUMNS)
+    result = advisor.maintain(db_path, "STUDENT")
+    created = [entry for entry in result["recommendations"] if entry["action"] == "create"]
+    assert [entry["column"] for entry in created] == ["NAME"]
+    assert created[0]["before_seconds"] is not None and created[0]["after_seconds"] is not None
+    assert "nl2sql_idx_STUDENT_NAME" in _indexes(db_path)
+
+
+def test_time_query_is_read_only_and_bounded(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    assert time_query(db_path, "DELETE FROM STUDENT") is None
+    assert time_query(db_path, "WITH x AS (SELECT 1) DELETE FROM STUDENT") is None
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    assert time_query(db_path, slow, QueryLimits(timeout=0.2, max_rows=10, temp_store_mb=None)) is None
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM STUDENT").fetchone() == (6,)
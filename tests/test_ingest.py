@@ -0,0 +1,52 @@
+import io
+import sqlite3
+
+import pytest
+
+import ingest
+
+
+def table_rows(db_path, table_name="STUDENT"):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT * FROM {table_name} ORDER BY rowid").fetchall()
+
+
+def test_csv_is_loaded_across_transactions(db_path, student_frame):
+    source = io.StringIO(student_frame.to_csv(index=False))
+    report = ingest.ingest_csv(source, db_path, "STUDENT", chunksize=2, rows_per_transaction=2)
+    assert (report["rows"], report["chunks"]) == (6, 3)
+    assert table_rows(db_path)[0] == ("Asha", "Data Science", "A", 91)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {ingest.CHUNKS_TABLE}").fetchone()[0] == 3
+
+
+def test_failed_replace_keeps_the_previous_table(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE VIEW TOP_STUDENTS AS SELECT * FROM STUDENT WHERE MARKS > 80")
+    before = table_rows(db_path)
+
+    def failing_chunks():
+        changed = student_frame.assign(MARKS=0)
+        yield changed.iloc[:3]
+        yield changed.iloc[3:]
+        raise ValueError("bad row in the file")
+
+    with pytest.raises(ValueError, match="bad row"):
+        ingest.write_chunks(failing_chunks(), db_path, "STUDENT", batch_size=1, rows_per_transaction=1)
+    assert table_rows(db_path) == before
+    with sqlite3.connect(db_path) as conn:
+        names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert not [name for name in names if name.startswith(ingest.SIDE_TABLE_PREFIX + "staging_")]
+
+
+def test_replace_swaps_in_the_new_table_and_keeps_views(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE VIEW TOP_STUDENTS AS SELECT * FROM STUDENT WHERE MARKS > 80")
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame.iloc[:2]), db_path, "STUDENT")
+    assert [row[0] for row in table_rows(db_path)] == ["Asha", "Ben"]
+    assert table_rows(db_path, "TOP_STUDENTS") == [("Asha", "Data Science", "A", 91)]
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO STUDENT VALUES ('Gil', 'AI', 'C', 70)")
+        assert conn.execute("SELECT stale FROM _nl2sql_table_stats").fetchone()[0] == 1
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pandas as pd
+
+import ingest
+
+
+def frame(ids, names):
+    return pd.DataFrame({"ID": ids, "NAME": names})
+
+
+def rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT ID, NAME FROM STUDENT ORDER BY rowid").fetchall()
+
+
+def upsert(db_path, df, key=None):
+    return ingest.upsert_chunks(ingest.iter_frame_chunks(df, chunksize=1), db_path, "STUDENT", key=key)
+
+
+def test_position_upsert_skips_unchanged_chunks_and_mirrors_the_file(db_path):
+    ingest.write_chunks(ingest.iter_frame_chunks(frame([1, 2, 3], ["a", "b", "c"]), chunksize=1), db_path, "STUDENT")
+    report = upsert(db_path, frame([1, 5], ["a", "e"]))
+    assert (report["skipped"], report["updated"], report["deleted"]) == (1, 1, 1)
+    assert rows(db_path) == [(1, "a"), (5, "e")]
+
+
+def test_key_upsert_keeps_rows_missing_from_the_file(db_path):
+    ingest.write_chunks(ingest.iter_frame_chunks(frame([1, 2, 3], ["a", "b", "c"])), db_path, "STUDENT")
+    report = upsert(db_path, frame([3, 4], ["c2", "d"]), key="ID")
+    assert (report["inserted"], report["updated"], report["deleted"]) == (1, 1, 0)
+    assert rows(db_path) == [(1, "a"), (2, "b"), (3, "c2"), (4, "d")]
+
+
+def test_position_upsert_after_key_upsert_does_not_trust_key_fingerprints(db_path):
+    ingest.write_chunks(ingest.iter_frame_chunks(frame([1, 2, 3], ["a", "b", "c"])), db_path, "STUDENT")
+    upsert(db_path, frame([3, 4], ["c2", "d"]), key="ID")
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {ingest.CHUNKS_TABLE}").fetchone()[0] == 0
+
+    report = upsert(db_path, frame([3, 4], ["c2", "d"]))
+    assert report["skipped"] == 0
+    assert rows(db_path) == [(3, "c2"), (4, "d")]
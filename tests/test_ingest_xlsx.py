@@ -0,0 +1,55 @@
+import io
+import sqlite3
+
+import pytest
+
+import ingest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    workbook = openpyxl.Workbook()
+    students = workbook.active
+    students.title = "Students 2024"
+    students.append(["NAME", "MARKS"])
+    for n in range(7):
+        students.append([f"student {n}", 50 + n])
+    sections = workbook.create_sheet("Sections")
+    sections.append(["SECTION", "ROOM", "ROOM"])
+    sections.append(["A", 101, 102])
+    sections.append(["B", None, 201])
+    workbook.create_sheet("Empty")
+    path = str(tmp_path / "school.xlsx")
+    workbook.save(path)
+    return path
+
+
+def tables(db_path):
+    with sqlite3.connect(db_path) as conn:
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE '\\_nl2sql\\_%' ESCAPE '\\'"
+            " ORDER BY name")]
+        return {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in names}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_every_sheet_becomes_a_table(workbook_path, db_path, workers):
+    report = ingest.ingest_xlsx(workbook_path, db_path, chunksize=3, workers=workers)
+    assert [(table["sheet"], table["table"], table["rows"]) for table in report["tables"]] == [
+        ("Students 2024", "students_2024", 7), ("Sections", "sections", 2)]
+    assert report["rows"] == 9
+    assert tables(db_path) == {"sections": 2, "students_2024": 7}
+    with sqlite3.connect(db_path) as conn:
+        assert [row[1] for row in conn.execute("PRAGMA table_info(sections)")] == ["SECTION", "ROOM", "ROOM.1"]
+        assert conn.execute(f"SELECT COUNT(*) FROM {ingest.CHUNKS_TABLE} WHERE table_name = 'students_2024'"
+                            ).fetchone()[0] == 3
+
+
+def test_file_like_uploads_are_spooled_for_workers(workbook_path, db_path):
+    with open(workbook_path, "rb") as f:
+        upload = io.BytesIO(f.read())
+    report = ingest.ingest_xlsx(upload, db_path, sheets=["Sections", "Students 2024"], workers=2)
+    assert [table["table"] for table in report["tables"]] == ["sections", "students_2024"]
+    assert tables(db_path) == {"sections": 2, "students_2024": 7}
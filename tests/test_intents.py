@@ -0,0 +1,39 @@
+import pytest
+
+from intents import match_question
+
+COLUMNS = ["NAME", "CLASS", "SECTION", "MARKS"]
+
+
+@pytest.mark.parametrize("question, sql", [
+    ("How many students are there?", "SELECT COUNT(*) FROM STUDENT;"),
+    ("how many rows are in the table", "SELECT COUNT(*) FROM STUDENT;"),
+    ("list all records", "SELECT * FROM STUDENT;"),
+    ("show all students", "SELECT * FROM STUDENT;"),
+    ("show me all records where section is A", "SELECT * FROM STUDENT WHERE SECTION = 'A';"),
+    ("how many distinct sections are there", "SELECT COUNT(DISTINCT SECTION) FROM STUDENT;"),
+    ("count the unique marks", "SELECT COUNT(DISTINCT MARKS) FROM STUDENT;"),
+    ("what is the average marks", "SELECT AVG(MARKS) FROM STUDENT;"),
+    ("top 5 students by highest marks", "SELECT * FROM STUDENT ORDER BY MARKS DESC LIMIT 5;"),
+    ("count of students in each section", "SELECT SECTION, COUNT(*) FROM STUDENT GROUP BY SECTION;"),
+])
+def test_common_questions_are_answered_locally(question, sql):
+    assert match_question(question, "STUDENT", COLUMNS)[1] == sql
+
+
+@pytest.mark.parametrize("question", [
+    "how many columns are there",
+    "how many tables are in the database",
+    "how many duplicates are there",
+    "how many nulls are there in the table",
+    "list all tables",
+    "show all columns",
+    "show all marks",
+    "show students with marks above 80",
+    "how many distinct students are there",
+    "10 students by marks",
+    "how many sections are there",
+    "what is the total number of marks",
+])
+def test_questions_not_about_rows_go_to_the_model(question):
+    assert match_question(question, "STUDENT", COLUMNS) is None
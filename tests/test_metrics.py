@@ -0,0 +1,23 @@
+import json
+
+from metrics import JSONL_FLUSH_LINES, MetricsStore
+
+
+def test_spans_are_buffered_then_written_in_order(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    store = MetricsStore(jsonl_path=str(path))
+    store.observe("sql.execute", 0.5, engine="sqlite")
+    store.observe("sql.execute", 0.25)
+    store.flush()
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["seconds"] for record in records] == [0.5, 0.25]
+    assert records[0]["engine"] == "sqlite"
+    assert store.summary()[0]["count"] == 2
+
+
+def test_full_buffer_is_written_without_flush(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    store = MetricsStore(jsonl_path=str(path))
+    for _ in range(JSONL_FLUSH_LINES):
+        store.observe("ingest.write", 0.01)
+    assert len(path.read_text().splitlines()) == JSONL_FLUSH_LINES
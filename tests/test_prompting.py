@@ -0,0 +1,28 @@
+import pytest
+
+from prompting import EXAMPLES, ExampleIndex, default_index, generate_prompt
+
+COLUMNS = ["NAME", "CLASS", "SECTION", "MARKS"]
+
+
+@pytest.mark.parametrize("question, best", [
+    ("How many students are there?", "SELECT COUNT(*) FROM {table_name};"),
+    ("What is the average marks?", "SELECT AVG(<COLUMN_NAME>) FROM {table_name};"),
+    ("top 5 students with highest marks", "SELECT * FROM {table_name} ORDER BY <COLUMN_NAME> DESC LIMIT <N>;"),
+    ("count of students per section", "SELECT <COLUMN_NAME>, COUNT(*) FROM {table_name} GROUP BY <COLUMN_NAME>;"),
+])
+def test_most_relevant_example_ranks_first(question, best):
+    assert EXAMPLES[default_index().top_k(question, 3)[0]][1] == best
+
+
+def test_ranking_is_deterministic_and_ties_keep_example_order():
+    question = "What is the average marks per section?"
+    assert ExampleIndex().top_k(question, 6) == default_index().top_k(question, 6)
+    assert default_index().top_k("zzz qqq", 3) == [0, 1, 2]
+
+
+def test_prompt_sends_only_the_top_k_examples_in_store_order():
+    prompt = generate_prompt("STUDENT", COLUMNS, question="How many students are there?", top_k=3)[0]
+    assert prompt.count("\nQuery: ") == 3
+    assert prompt.index("SELECT COUNT(*) FROM STUDENT;") < prompt.index("Example 2 -")
+    assert generate_prompt("STUDENT", COLUMNS)[0].count("\nQuery: ") == len(EXAMPLES)
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from query_cache import QueryCache, make_cache_key
+
+COLUMNS = ["NAME", "CLASS", "SECTION", "MARKS"]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = QueryCache(str(tmp_path / "query_cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_key_ignores_whitespace_and_trailing_punctuation():
+    key = make_cache_key("How many students are there?", "STUDENT", COLUMNS)
+    assert make_cache_key("  How many   students are there ", "STUDENT", COLUMNS) == key
+    assert make_cache_key("How many students are there", "STUDENT", COLUMNS + ["AGE"]) != key
+    assert make_cache_key("How many students are there", "TEACHER", COLUMNS) != key
+
+
+def test_values_differing_in_case_do_not_share_sql(cache):
+    cache.put("students in section 'A'", "STUDENT", COLUMNS, "SELECT * FROM STUDENT WHERE SECTION = 'A';")
+    assert cache.get("students in section 'a'", "STUDENT", COLUMNS) is None
+    assert cache.get("students in section 'A'?", "STUDENT", COLUMNS) == "SELECT * FROM STUDENT WHERE SECTION = 'A';"
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    path = str(tmp_path / "query_cache.sqlite")
+    first = QueryCache(path)
+    first.put("list all students", "STUDENT", COLUMNS, "SELECT * FROM STUDENT;")
+    first.close()
+    second = QueryCache(path)
+    assert second.get("list all students", "STUDENT", COLUMNS) == "SELECT * FROM STUDENT;"
+    assert second.stats()["disk_hits"] == 1
+    second.close()
+
+
+def test_entries_expire_after_the_ttl(cache, monkeypatch):
+    cache.ttl_seconds = 60
+    cache.put("list all students", "STUDENT", COLUMNS, "SELECT * FROM STUDENT;")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("list all students", "STUDENT", COLUMNS) is None
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.max_memory_entries = 2
+    cache.max_disk_entries = 2
+    for n in range(3):
+        cache.put(f"question {n}", "STUDENT", COLUMNS, f"SELECT {n};")
+        time.sleep(0.01)
+    stats = cache.stats()
+    assert (stats["memory_entries"], stats["disk_entries"]) == (2, 2)
+    assert cache.get("question 0", "STUDENT", COLUMNS) is None
+    assert cache.get("question 2", "STUDENT", COLUMNS) == "SELECT 2;"
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+import ingest
+from backends import get_backend
+from connections import connect_read_only, get_pool
+from query_guard import QueryAborted, QueryLimits, QueryWatchdog, read_kill_log
+
+ENDLESS = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+@pytest.fixture
+def student_db(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    return db_path
+
+
+@pytest.fixture
+def watchdog(tmp_path):
+    watchdog = QueryWatchdog(QueryLimits(timeout=0.5, max_rows=100, temp_store_mb=16), workers=1,
+                             log_path=str(tmp_path / "killed.jsonl"))
+    yield watchdog
+    watchdog.shutdown()
+
+
+def query(sql, db, guard):
+    return get_backend(db).query_arrow(sql, guard=guard)
+
+
+def sleep_then_check(seconds, guard):
+    time.sleep(seconds)
+    if guard.should_abort():
+        guard.check()
+    return seconds
+
+
+def test_runaway_query_is_stopped_and_logged(student_db, watchdog):
+    job = watchdog.submit(query, ENDLESS, student_db, sql=ENDLESS, db=student_db)
+    with pytest.raises(QueryAborted) as aborted:
+        job.result()
+    assert aborted.value.reason == "timeout"
+    assert 0.5 <= aborted.value.seconds < 2
+    assert [(entry["reason"], entry["sql"]) for entry in read_kill_log(watchdog.log_path)] == [("timeout", ENDLESS)]
+
+
+def test_cancel_stops_a_running_query(student_db, watchdog):
+    watchdog.limits.timeout = None
+    job = watchdog.submit(query, ENDLESS, student_db, sql=ENDLESS, db=student_db)
+    time.sleep(0.1)
+    job.cancel()
+    with pytest.raises(QueryAborted, match="cancelled"):
+        job.result()
+
+
+def test_time_waiting_for_a_worker_does_not_count(watchdog):
+    jobs = [watchdog.submit(sleep_then_check, 0.3, sql="slow", db="test") for _ in range(2)]
+    quick = watchdog.submit(sleep_then_check, 0, sql="quick", db="test")
+    assert [job.result() for job in jobs] == [0.3, 0.3]
+    assert quick.result() == 0
+    assert watchdog.killed == 0
+
+
+def test_query_cancelled_while_queued_never_runs(watchdog):
+    calls = []
+    slow = watchdog.submit(sleep_then_check, 0.2, sql="slow", db="test")
+    queued = watchdog.submit(lambda guard: calls.append(guard), sql="queued", db="test")
+    queued.cancel()
+    assert slow.result() == 0.2
+    with pytest.raises(QueryAborted, match="cancelled"):
+        queued.result()
+    assert calls == []
+
+
+def test_temp_store_settings_do_not_leak_into_the_pool(student_db, watchdog):
+    sql = "SELECT NAME FROM STUDENT ORDER BY MARKS"
+    assert watchdog.submit(query, sql, student_db, sql=sql, db=student_db).result().num_rows == 6
+
+    def settings(conn):
+        return [conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ("temp_store", "temp.cache_size")]
+
+    fresh = connect_read_only(student_db)
+    try:
+        with get_pool(student_db).connection() as conn:
+            assert settings(conn) == settings(fresh)
+    finally:
+        fresh.close()
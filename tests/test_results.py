@@ -0,0 +1,42 @@
+import sqlite3
+
+import numpy as np
+
+import ingest
+from backends import _arrow_column
+from results import ResultWindow, strip_statement
+
+
+def test_strip_statement_drops_trailing_comments_and_semicolons():
+    assert strip_statement("SELECT 1; -- one") == "SELECT 1"
+    assert strip_statement("SELECT 1 /* done */ ;\n") == "SELECT 1"
+    assert strip_statement("SELECT '--not a comment;' AS x -- note") == "SELECT '--not a comment;' AS x"
+
+
+def test_window_pages_sql_ending_in_a_comment(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    window = ResultWindow("SELECT NAME FROM STUDENT ORDER BY NAME -- alphabetical", db_path, page_size=4)
+    assert window.fetch_page(0).column("NAME").to_pylist() == ["Asha", "Ben", "Chen", "Dina"]
+    assert window.fetch_page(1).column("NAME").to_pylist() == ["Eli", "Fay"]
+
+
+def test_window_pages_views_without_rowid(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE VIEW TOP_STUDENTS AS SELECT * FROM STUDENT WHERE MARKS > 80")
+    window = ResultWindow("SELECT * FROM TOP_STUDENTS", db_path, page_size=2)
+    assert window.table is None
+    rows = window.fetch_page(0).num_rows + window.fetch_page(1).num_rows
+    assert rows == 3
+
+
+def test_window_pages_tables_by_rowid(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    window = ResultWindow("SELECT * FROM STUDENT;", db_path, page_size=4)
+    assert window.table == "STUDENT"
+    assert window.fetch_page(1).column("NAME").to_pylist() == ["Eli", "Fay"]
+
+
+def test_huge_integers_in_mixed_columns_become_text():
+    column = _arrow_column(np.array([1, 2 ** 63, "x", None], dtype=object))
+    assert column.to_pylist() == ["1", str(2 ** 63), "x", None]
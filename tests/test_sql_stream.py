@@ -0,0 +1,39 @@
+import ingest
+from sql_stream import SqlStream
+
+
+def follow(chunks, db):
+    opened = []
+    stream = SqlStream(iter(chunks), db, on_valid=opened.append)
+    seen = []
+    for text in stream:
+        seen.append((text, list(opened), stream.error))
+    return stream, opened, seen
+
+
+def test_select_arriving_in_pieces_is_opened_before_the_stream_ends(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    chunks = ["```sql\nSELECT NAME", " FROM STUDENT", " WHERE MARKS > 80;", "\n```"]
+    sql = "SELECT NAME FROM STUDENT WHERE MARKS > 80;"
+    stream, opened, seen = follow(chunks, db_path)
+    assert [step[1] for step in seen] == [[], [], [sql], [sql]]
+    assert stream.valid and stream.error is None
+    assert opened == [sql]
+
+
+def test_non_select_is_rejected_as_soon_as_it_is_complete(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    stream, opened, seen = follow(["```sql\nDROP TABLE", " STUDENT;", "\n```"], db_path)
+    assert seen[0][2] is None
+    assert "single SELECT" in str(seen[1][2])
+    assert opened == [] and not stream.valid
+
+
+def test_multiple_statements_are_rejected(db_path, student_frame):
+    ingest.write_chunks(ingest.iter_frame_chunks(student_frame), db_path, "STUDENT")
+    stream, opened, seen = follow(["SELECT NAME FROM STUDENT; DELETE FROM STUDENT;"], db_path)
+    assert opened == [] and "single SELECT" in str(seen[0][2])
+
+    stream, opened, _ = follow(["SELECT NAME FROM STUDENT;", " DELETE FROM STUDENT;"], db_path)
+    assert "single SELECT" in str(stream.error) and not stream.valid
+    assert stream.sql == "SELECT NAME FROM STUDENT; DELETE FROM STUDENT;"